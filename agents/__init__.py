@@ -1,6 +1,7 @@
 """Core agent implementations."""
 
 from .agent import Agent, ModelConfig
+from .batch import BatchResult, BatchRunner
 from .tools.base import Tool
 
-__all__ = ["Agent", "ModelConfig", "Tool"]
+__all__ = ["Agent", "BatchResult", "BatchRunner", "ModelConfig", "Tool"]
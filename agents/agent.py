@@ -1,17 +1,42 @@
 """Agent implementation with Claude API and tools."""
 
 import asyncio
+import functools
+import itertools
 import os
+import random
+import time
 from contextlib import AsyncExitStack
 from dataclasses import dataclass
 from typing import Any
 
-from anthropic import Anthropic
+import httpx
+from anthropic import (
+    Anthropic,
+    APIConnectionError,
+    APIStatusError,
+    AsyncAnthropic,
+)
+from anthropic.types import Message
 
 from .tools.base import Tool
-from .utils.connections import setup_mcp_connections
+from .utils.compaction_util import Compactor
+from .utils.connections import MCPConnectionPool, setup_mcp_connections
 from .utils.history_util import MessageHistory
-from .utils.tool_util import execute_tools
+from .utils.payload_util import REQUEST_OPTION_KEYS, RequestPayloadBuilder
+from .utils.rate_limit import RateLimiter
+from .utils.result_cache import ToolResultCache
+from .utils.schema_cache import ToolSchemaCache
+from .utils.stream_util import stream_events
+from .utils.token_util import TokenEstimator
+from .utils.tool_util import ToolScheduler, execute_tools
+from .utils.tracing import Tracer, current_span, span
+
+# Retries of failed model requests the rate limiter makes in place of the
+# SDK's, on the SDK's defaults: up to 2 after 0.5s, 1s, ... at most 8s
+DEFAULT_RETRIES = 2
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
 
 
 @dataclass
@@ -41,8 +66,17 @@ class Agent:
         mcp_servers: list[dict[str, Any]] | None = None,
         config: ModelConfig | None = None,
         verbose: bool = False,
-        client: Anthropic | None = None,
+        client: Anthropic | AsyncAnthropic | None = None,
         message_params: dict[str, Any] | None = None,
+        stream: bool = False,
+        token_estimator: TokenEstimator | None = None,
+        compactor: Compactor | None = None,
+        mcp_pool: MCPConnectionPool | None = None,
+        tool_schema_cache: ToolSchemaCache | None = None,
+        tool_result_cache: ToolResultCache | None = None,
+        rate_limiter: RateLimiter | None = None,
+        tracer: Tracer | None = None,
+        preserialize_requests: bool = False,
     ):
         """Initialize an Agent.
         
@@ -53,9 +87,40 @@ class Agent:
             mcp_servers: MCP server configurations
             config: Model configuration with defaults
             verbose: Enable detailed logging
-            client: Anthropic client instance
+            client: Anthropic or AsyncAnthropic client instance. An async
+                    client is awaited natively; a sync client is run in a
+                    worker thread so the event loop is never blocked.
             message_params: Additional parameters for client.messages.create().
                            These override any conflicting parameters from config.
+            stream: Use the streaming Messages API. Tool calls are dispatched
+                    as soon as each tool_use block completes and verbose text
+                    output is printed incrementally.
+            token_estimator: Token estimator for sizing the context. Defaults
+                             to a process-wide local estimator, so no
+                             count_tokens request is made at construction.
+            compactor: Summarize old history in the background instead of
+                       dropping it when the context fills up.
+            mcp_pool: Connection pool that keeps MCP servers running between
+                      runs and shares them with other agents using the pool.
+            tool_schema_cache: On-disk cache of MCP tool schemas. Servers
+                               with cached tools are only started when one
+                               of their tools is called.
+            tool_result_cache: Memoizes results of cacheable tools, such
+                               as file reads, across turns and, if
+                               shared, across runs and agents.
+            rate_limiter: Paces model requests within the account's rate
+                          limits and retries rate-limit errors, in place
+                          of the SDK's own retries. Pass
+                          default_rate_limiter to share one process-wide.
+            tracer: Records a span for each run, turn, model request and
+                    tool call, with timings, token usage and truncation
+                    events, and hands them to the tracer's exporter.
+            preserialize_requests: POST request bodies encoded from cached
+                                   JSON fragments of the history, instead
+                                   of having the SDK transform and encode
+                                   the whole conversation every turn.
+                                   Only used with Anthropic and
+                                   AsyncAnthropic clients.
         """
         self.name = name
         self.system = system
@@ -63,15 +128,38 @@ class Agent:
         self.tools = list(tools or [])
         self.config = config or ModelConfig()
         self.mcp_servers = mcp_servers or []
+        self.mcp_pool = mcp_pool
+        self.tool_schema_cache = tool_schema_cache
+        self.tool_result_cache = tool_result_cache
+        self.rate_limiter = rate_limiter
+        self.tracer = tracer
         self.message_params = message_params or {}
+        self.stream = stream
         self.client = client or Anthropic(
             api_key=os.environ.get("ANTHROPIC_API_KEY", "")
         )
+        self.is_async_client = isinstance(self.client, AsyncAnthropic)
+        # The rate limiter retries rate-limit errors after its own backoff;
+        # the SDK's retries would resend paced requests outside its budget
+        self._request_client = self.client
+        if rate_limiter is not None and isinstance(
+            self.client, (Anthropic, AsyncAnthropic)
+        ):
+            self._request_client = self.client.with_options(max_retries=0)
         self.history = MessageHistory(
             model=self.config.model,
             system=self.system,
             context_window_tokens=self.config.context_window_tokens,
             client=self.client,
+            token_estimator=token_estimator,
+            compactor=compactor,
+        )
+        self.payload = RequestPayloadBuilder(self.history)
+        # Usage reported for each model turn, across runs
+        self.usage: list[Any] = []
+        # Only genuine SDK clients accept pre-serialized request bodies
+        self.preserialize_requests = preserialize_requests and isinstance(
+            self.client, (Anthropic, AsyncAnthropic)
         )
 
         if self.verbose:
@@ -87,84 +175,402 @@ class Agent:
             "model": self.config.model,
             "max_tokens": self.config.max_tokens,
             "temperature": self.config.temperature,
-            "system": self.system,
-            "messages": self.history.format_for_api(),
-            "tools": [tool.to_dict() for tool in self.tools],
+            "system": self.history.format_system(),
+            "messages": self.payload.messages(),
+            "tools": self.payload.tools(self.tools),
             **self.message_params,
         }
 
-    async def _agent_loop(self, user_input: str) -> list[dict[str, Any]]:
-        """Process user input and handle tool calls in a loop"""
+    async def _create_message(self, **kwargs: Any) -> Any:
+        """Call client.messages.create() without blocking the event loop."""
+        if self.preserialize_requests:
+            return await self._post_message(**kwargs)
+        messages = self._request_client.messages
+        # With a rate limiter, take the raw response to read its headers
+        raw = self.rate_limiter is not None
+        create = messages.with_raw_response.create if raw else messages.create
+        if self.is_async_client:
+            response = await create(**kwargs)
+        else:
+            response = await asyncio.to_thread(create, **kwargs)
+        if raw:
+            self.rate_limiter.update(kwargs["model"], response.headers)
+            return response.parse()
+        return response
+
+    async def _post_message(self, **kwargs: Any) -> Message:
+        """POST a pre-serialized request body to the Messages endpoint.
+
+        Skips the SDK's per-request transform and JSON encoding of the
+        whole conversation; cached fragments from the payload builder are
+        spliced in and only new messages are encoded.
+        """
+        extra_headers, extra_query, extra_body, timeout = (
+            kwargs.pop(key, None) for key in REQUEST_OPTION_KEYS
+        )
+        with span("request.encode"):
+            body = self.payload.encode({**kwargs, **(extra_body or {})})
+        options: dict[str, Any] = {"headers": extra_headers or {}}
+        if extra_query:
+            options["params"] = extra_query
+        if timeout is not None:
+            options["timeout"] = timeout
+
+        # With a rate limiter, take the raw response to read its headers
+        raw = self.rate_limiter is not None
+        post = functools.partial(
+            self._request_client.post,
+            "/v1/messages",
+            cast_to=httpx.Response if raw else Message,
+            content=body,
+            options=options,
+        )
+        if self.is_async_client:
+            response = await post()
+        else:
+            response = await asyncio.to_thread(post)
+        if raw:
+            self.rate_limiter.update(kwargs["model"], response.headers)
+            # Built without validation, as the SDK builds its responses,
+            # so fields and block types newer than the SDK are tolerated
+            return Message.construct(**response.json())
+        return response
+
+    async def _paced(self, request: Any, *args: Any, **kwargs: Any) -> Any:
+        """Await a model request within the rate limiter's budget.
+
+        Rate-limit (429) and overloaded (529) errors are retried after the
+        limiter's backoff, up to its max_retries. Connection errors,
+        timeouts and the other errors the SDK retries (408, 409 and 5xx)
+        are retried after an exponential backoff of this request only,
+        up to the client's max_retries, in place of the SDK's retries.
+        """
+        limiter = self.rate_limiter
+        if limiter is None:
+            return await request(*args, **kwargs)
+
+        model = kwargs["model"]
+        planner = self.history.cache_planner
+        # Cache reads do not count towards the input token limit
+        cached = planner.usage[-1].read_tokens if planner.usage else 0
+        input_tokens = max(0, self.history.total_tokens - cached)
+        request_span = current_span()
+        rate_limited = failures = 0
+        for attempt in itertools.count():
+            started = time.perf_counter()
+            reservation = await limiter.acquire(
+                model, input_tokens, kwargs["max_tokens"]
+            )
+            request_span.set(
+                rate_limit_wait_ms=round(
+                    (time.perf_counter() - started) * 1000, 3
+                ),
+                attempts=attempt + 1,
+            )
+            try:
+                result = await request(*args, **kwargs)
+            except APIStatusError as e:
+                limiter.release(reservation)
+                if e.status_code not in (429, 529):
+                    if not self._retryable(e, failures):
+                        raise
+                    failures += 1
+                    await self._retry_after_failure(e, failures)
+                    continue
+                if rate_limited >= limiter.max_retries:
+                    raise
+                rate_limited += 1
+                delay = limiter.backoff(model, e.response.headers)
+                request_span.add_event(
+                    "rate_limited", status_code=e.status_code, delay=delay
+                )
+                if self.verbose:
+                    print(
+                        f"\n[{self.name}] Rate limited ({e.status_code}), "
+                        f"retrying in {delay:.1f}s"
+                    )
+                continue
+            except APIConnectionError as e:
+                # Includes APITimeoutError
+                limiter.release(reservation)
+                if not self._retryable(e, failures):
+                    raise
+                failures += 1
+                await self._retry_after_failure(e, failures)
+                continue
+            except BaseException:
+                limiter.release(reservation)
+                raise
+            response = result[0] if isinstance(result, tuple) else result
+            limiter.settle(reservation, response.usage)
+            return result
+
+    def _retryable(self, error: Exception, failures: int) -> bool:
+        """Whether the SDK would have retried a failed request."""
+        if failures >= getattr(self.client, "max_retries", DEFAULT_RETRIES):
+            return False
+        if not isinstance(error, APIStatusError):
+            return True
+        should_retry = error.response.headers.get("x-should-retry")
+        if should_retry in ("true", "false"):
+            return should_retry == "true"
+        return error.status_code in (408, 409) or error.status_code >= 500
+
+    async def _retry_after_failure(
+        self, error: Exception, failures: int
+    ) -> None:
+        """Wait out the backoff before retrying a failed request."""
+        ceiling = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (failures - 1))
+        delay = random.uniform(ceiling * 0.75, ceiling)
+        current_span().add_event(
+            "retrying", error=type(error).__name__, delay=delay
+        )
+        if self.verbose:
+            print(
+                f"\n[{self.name}] {type(error).__name__}, "
+                f"retrying in {delay:.1f}s"
+            )
+        await asyncio.sleep(delay)
+
+    async def _stream_turn(
+        self, tool_dict: dict[str, Tool], **kwargs: Any
+    ) -> tuple[Any, list[dict[str, Any]]]:
+        """Stream one model turn, dispatching tools as their blocks complete.
+
+        Each tool_use block is handed to a ToolScheduler on its
+        content_block_stop event, so tool I/O overlaps with generation of
+        the remaining blocks. Returns the final message and tool results
+        in the order the tool calls were emitted.
+        """
+        scheduler = ToolScheduler(tool_dict, cache=self.tool_result_cache)
+        pending: list[asyncio.Task] = []
+        response = None
+        request_span = current_span()
+        started = time.perf_counter()
+        first_token = True
+        try:
+            on_response = None
+            if self.rate_limiter is not None:
+                on_response = functools.partial(
+                    self._observe_response, kwargs["model"]
+                )
+            async for event in stream_events(
+                self._request_client,
+                self.is_async_client,
+                on_response,
+                **kwargs,
+            ):
+                if event.type == "content_block_start":
+                    if first_token:
+                        first_token = False
+                        request_span.set(
+                            ttft_ms=round(
+                                (time.perf_counter() - started) * 1000, 3
+                            )
+                        )
+                    if self.verbose and event.content_block.type == "text":
+                        print(f"\n[{self.name}] Output: ", end="", flush=True)
+                elif event.type == "text":
+                    if self.verbose:
+                        print(event.text, end="", flush=True)
+                elif event.type == "content_block_stop":
+                    block = event.content_block
+                    if block.type == "tool_use":
+                        if self.verbose:
+                            self._print_tool_call(block)
+                        pending.append(scheduler.submit(block))
+                    elif self.verbose and block.type == "text":
+                        print()
+                elif event.type == "message_stop":
+                    response = event.message
+                    request_span.set(
+                        stream_ms=round(
+                            (time.perf_counter() - started) * 1000, 3
+                        )
+                    )
+        except BaseException:
+            for task in pending:
+                task.cancel()
+            raise
+
+        return response, list(await asyncio.gather(*pending))
+
+    def _observe_response(self, model: str, response: Any) -> None:
+        self.rate_limiter.update(model, response.headers)
+
+    def _print_tool_call(self, block: Any) -> None:
+        params_str = ", ".join([f"{k}={v}" for k, v in block.input.items()])
+        print(f"\n[{self.name}] Tool call: {block.name}({params_str})")
+
+    async def _agent_loop(
+        self, user_input: str, first_response: Message | None = None
+    ) -> list[dict[str, Any]]:
+        """Process user input and handle tool calls in a loop
+
+        If first_response is given, it is used as the model's reply to
+        user_input instead of making the first request.
+        """
         if self.verbose:
             print(f"\n[{self.name}] Received: {user_input}")
         await self.history.add_message("user", user_input, None)
 
         tool_dict = {tool.name: tool for tool in self.tools}
 
-        while True:
-            self.history.truncate()
-            params = self._prepare_message_params()
+        for turn in itertools.count(1):
+            with span("agent.turn", turn=turn) as turn_span:
+                response, tool_results = await self._turn(
+                    tool_dict, first_response
+                )
+                first_response = None
+                usage = response.usage
+                turn_span.set(
+                    stop_reason=response.stop_reason,
+                    input_tokens=usage.input_tokens,
+                    output_tokens=usage.output_tokens,
+                    cache_read_tokens=(
+                        getattr(usage, "cache_read_input_tokens", 0) or 0
+                    ),
+                    cache_creation_tokens=(
+                        getattr(usage, "cache_creation_input_tokens", 0) or 0
+                    ),
+                    tool_calls=len(tool_results),
+                    context_tokens=self.history.total_tokens,
+                )
+            if not tool_results:
+                return response
 
-            # Merge headers properly - default beta header can be overridden by message_params
-            default_headers = {"anthropic-beta": "code-execution-2025-05-22"}
-            if "extra_headers" in params:
-                # Pop extra_headers from params and merge with defaults
-                custom_headers = params.pop("extra_headers")
-                merged_headers = {**default_headers, **custom_headers}
-            else:
-                merged_headers = default_headers
+    async def _turn(
+        self, tool_dict: dict[str, Tool], first_response: Message | None
+    ) -> tuple[Any, list[dict[str, Any]]]:
+        """Run one model turn and its tool calls, recording both in history.
 
-            response = self.client.messages.create(
-                **params,
-                extra_headers=merged_headers
-            )
-            tool_calls = [
-                block for block in response.content if block.type == "tool_use"
-            ]
+        Returns the model's response and the tool results.
+        """
+        await self.history.compact()
+        with span("request.build"):
+            params = self._prepare_message_params()
+        cache = self.tool_result_cache
+        if cache is not None:
+            cache_counts = (cache.hits, cache.misses)
 
+        # Merge headers properly - default beta header can be overridden by message_params
+        default_headers = {"anthropic-beta": "code-execution-2025-05-22"}
+        if "extra_headers" in params:
+            # Pop extra_headers from params and merge with defaults
+            custom_headers = params.pop("extra_headers")
+            merged_headers = {**default_headers, **custom_headers}
+        else:
+            merged_headers = default_headers
+
+        if self.stream and first_response is None:
+            with span("model.request", model=params["model"], stream=True):
+                response, tool_results = await self._paced(
+                    self._stream_turn,
+                    tool_dict,
+                    **params,
+                    extra_headers=merged_headers,
+                )
+        else:
+            if first_response is not None:
+                # The first turn was answered ahead of time
+                response = first_response
+            else:
+                with span("model.request", model=params["model"]):
+                    response = await self._paced(
+                        self._create_message,
+                        **params,
+                        extra_headers=merged_headers
+                    )
             if self.verbose:
                 for block in response.content:
                     if block.type == "text":
                         print(f"\n[{self.name}] Output: {block.text}")
                     elif block.type == "tool_use":
-                        params_str = ", ".join(
-                            [f"{k}={v}" for k, v in block.input.items()]
-                        )
-                        print(
-                            f"\n[{self.name}] Tool call: "
-                            f"{block.name}({params_str})"
-                        )
+                        self._print_tool_call(block)
+            tool_calls = [
+                block
+                for block in response.content
+                if block.type == "tool_use"
+            ]
+            tool_results = await execute_tools(
+                tool_calls, tool_dict, cache=self.tool_result_cache
+            )
 
-            await self.history.add_message(
-                "assistant", response.content, response.usage
+        self.usage.append(response.usage)
+        await self.history.add_message(
+            "assistant", response.content, response.usage
+        )
+        if self.verbose and self.history.enable_caching:
+            cache_usage = self.history.cache_planner.usage[-1]
+            print(
+                f"\n[{self.name}] Cache: "
+                f"{cache_usage.read_tokens} tokens read, "
+                f"{cache_usage.creation_tokens} tokens written"
             )
 
-            if tool_calls:
-                tool_results = await execute_tools(
-                    tool_calls,
-                    tool_dict,
-                )
-                if self.verbose:
-                    for block in tool_results:
-                        print(
-                            f"\n[{self.name}] Tool result: "
-                            f"{block.get('content')}"
-                        )
-                await self.history.add_message("user", tool_results)
-            else:
-                return response
+        if tool_results:
+            if self.verbose:
+                for block in tool_results:
+                    print(
+                        f"\n[{self.name}] Tool result: "
+                        f"{block.get('content')}"
+                    )
+                if cache is not None:
+                    print(
+                        f"\n[{self.name}] Tool cache: "
+                        f"{cache.hits - cache_counts[0]} hits, "
+                        f"{cache.misses - cache_counts[1]} misses"
+                    )
+            await self.history.add_message("user", tool_results)
+        return response, tool_results
 
-    async def run_async(self, user_input: str) -> list[dict[str, Any]]:
-        """Run agent with MCP tools asynchronously."""
+    async def run_async(
+        self, user_input: str, first_response: Message | None = None
+    ) -> list[dict[str, Any]]:
+        """Run agent with MCP tools asynchronously.
+
+        Args:
+            user_input: The user's message
+            first_response: The model's reply to user_input, if it was
+                            already obtained (e.g. from a message batch);
+                            the loop then continues from its tool calls.
+        """
+        try:
+            with self._run_span(first_response is not None):
+                return await self._run(user_input, first_response)
+        finally:
+            if self.tracer is not None:
+                await asyncio.to_thread(self.tracer.flush)
+
+    def _run_span(self, resumed: bool) -> Any:
+        """Span for a run, from the agent's tracer or the active one."""
+        open_span = self.tracer.span if self.tracer is not None else span
+        return open_span(
+            "agent.run",
+            agent=self.name,
+            model=self.config.model,
+            resumed=resumed,
+        )
+
+    async def _run(
+        self, user_input: str, first_response: Message | None
+    ) -> Any:
         async with AsyncExitStack() as stack:
             original_tools = list(self.tools)
 
             try:
-                mcp_tools = await setup_mcp_connections(
-                    self.mcp_servers, stack
-                )
+                if self.mcp_pool:
+                    mcp_tools = await self.mcp_pool.connect(
+                        self.mcp_servers, stack
+                    )
+                else:
+                    mcp_tools = await setup_mcp_connections(
+                        self.mcp_servers,
+                        stack,
+                        schema_cache=self.tool_schema_cache,
+                    )
                 self.tools.extend(mcp_tools)
-                return await self._agent_loop(user_input)
+                return await self._agent_loop(user_input, first_response)
             finally:
                 self.tools = original_tools
 
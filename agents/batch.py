@@ -0,0 +1,413 @@
+"""Run many agent tasks concurrently with one agent configuration."""
+
+import asyncio
+import inspect
+import json
+import os
+import time
+from collections.abc import AsyncIterable, AsyncIterator, Iterable
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from anthropic import AsyncAnthropic
+
+from .agent import Agent
+from .utils.connections import MCPConnectionPool
+from .utils.payload_util import REQUEST_OPTION_KEYS
+from .utils.rate_limit import RateLimiter, default_rate_limiter
+
+
+@dataclass
+class BatchResult:
+    """Outcome of one batch task, with its latency and token usage."""
+
+    task_id: str
+    input: str
+    output: str = ""
+    error: str | None = None
+    latency: float = 0.0
+    turns: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_tokens: int = 0
+    metadata: dict[str, Any] = field(default_factory=dict)
+    response: Any = field(default=None, repr=False)
+
+    def to_dict(self) -> dict[str, Any]:
+        """JSON-serializable form, as written by BatchRunner.run_jsonl()."""
+        return {
+            "id": self.task_id,
+            "input": self.input,
+            "output": self.output,
+            "error": self.error,
+            "latency": round(self.latency, 4),
+            "turns": self.turns,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cache_read_tokens": self.cache_read_tokens,
+            **({"metadata": self.metadata} if self.metadata else {}),
+        }
+
+
+async def _iterate(items: Iterable[Any] | AsyncIterable[Any]):
+    if isinstance(items, AsyncIterable):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+async def _call(method: Any, *args: Any, **kwargs: Any) -> Any:
+    """Call a sync or async client method without blocking the loop."""
+    if inspect.iscoroutinefunction(method):
+        return await method(*args, **kwargs)
+    return await asyncio.to_thread(method, *args, **kwargs)
+
+
+def _add_usage(result: "BatchResult", usages: list[Any]) -> None:
+    for usage in usages:
+        cache_read = getattr(usage, "cache_read_input_tokens", 0) or 0
+        cache_creation = getattr(usage, "cache_creation_input_tokens", 0) or 0
+        result.turns += 1
+        result.input_tokens += usage.input_tokens + cache_read + cache_creation
+        result.output_tokens += usage.output_tokens
+        result.cache_read_tokens += cache_read
+
+
+def _text(message: Any) -> str:
+    return "".join(
+        block.text for block in message.content if block.type == "text"
+    )
+
+
+def _read_jsonl(path: str | Path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class BatchRunner:
+    """Runs a stream of inputs through a bounded pool of agent workers.
+
+    Every task gets a fresh Agent built from the same keyword arguments,
+    so histories are independent, while the HTTP client, MCP connection
+    pool and rate limiter are shared by all of them. Results are yielded
+    in completion order; inputs are read lazily, so the input stream can
+    be arbitrarily long.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 8,
+        client: Any | None = None,
+        mcp_pool: MCPConnectionPool | None = None,
+        rate_limiter: RateLimiter | None = default_rate_limiter,
+        **agent_kwargs: Any,
+    ):
+        """Initialize a BatchRunner.
+
+        Args:
+            concurrency: Maximum number of tasks running at once
+            client: Client shared by every agent. Defaults to an
+                    AsyncAnthropic client.
+            mcp_pool: Connection pool shared by every agent. Defaults to
+                      a pool owned by the runner when mcp_servers are set.
+            rate_limiter: Limiter pacing every agent's model requests.
+                          Defaults to the process-wide limiter; None
+                          disables pacing.
+            **agent_kwargs: Arguments for each task's Agent (name, system,
+                            tools, mcp_servers, config, ...)
+        """
+        self.concurrency = concurrency
+        self.client = client or AsyncAnthropic(
+            api_key=os.environ.get("ANTHROPIC_API_KEY", "")
+        )
+        self._owns_pool = mcp_pool is None and bool(
+            agent_kwargs.get("mcp_servers")
+        )
+        self.mcp_pool = MCPConnectionPool() if self._owns_pool else mcp_pool
+        self.rate_limiter = rate_limiter
+        self.agent_kwargs = agent_kwargs
+
+    def create_agent(self, task_id: str) -> Agent:
+        """Build the agent that runs one task."""
+        kwargs = {"name": "BatchAgent", **self.agent_kwargs}
+        kwargs["name"] = f"{kwargs['name']}[{task_id}]"
+        return Agent(
+            client=self.client,
+            mcp_pool=self.mcp_pool,
+            rate_limiter=self.rate_limiter,
+            **kwargs,
+        )
+
+    @staticmethod
+    def _new_result(index: int, item: Any) -> BatchResult:
+        """Result for an input, with an error if the input is malformed."""
+        if not isinstance(item, dict):
+            return BatchResult(task_id=str(index), input=str(item))
+        result = BatchResult(
+            task_id=str(item.get("id", index)),
+            input=str(item.get("input", "")),
+            metadata={
+                k: v for k, v in item.items() if k not in ("id", "input")
+            },
+        )
+        if "input" not in item:
+            result.error = "Task has no 'input'"
+        return result
+
+    async def _run_task(
+        self,
+        result: BatchResult,
+        first_response: Any = None,
+        start: float | None = None,
+    ) -> BatchResult:
+        """Run one task, turning any failure into an error result."""
+        if result.error:
+            return result
+        start = time.perf_counter() if start is None else start
+        agent = self.create_agent(result.task_id)
+        try:
+            response = await agent.run_async(result.input, first_response)
+            result.response = response
+            result.output = _text(response)
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+        result.latency = time.perf_counter() - start
+        _add_usage(result, agent.usage)
+        return result
+
+    async def run(
+        self, inputs: Iterable[Any] | AsyncIterable[Any]
+    ) -> AsyncIterator[BatchResult]:
+        """Run every input, yielding results as tasks complete.
+
+        Args:
+            inputs: Strings, or dicts with an "input" key and optional
+                    "id"; other keys are kept as result metadata
+
+        Yields:
+            A BatchResult per input, in completion order
+        """
+        pending: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency)
+        results: asyncio.Queue = asyncio.Queue()
+
+        async def stop_workers() -> None:
+            for _ in range(self.concurrency):
+                await pending.put(None)
+
+        async def feed() -> None:
+            try:
+                index = 0
+                async for item in _iterate(inputs):
+                    await pending.put((index, item))
+                    index += 1
+            except asyncio.CancelledError:
+                # The consumer stopped early; the workers are cancelled too
+                # and would never take the sentinels
+                raise
+            except Exception:
+                await stop_workers()
+                raise
+            await stop_workers()
+
+        async def work() -> None:
+            while (task := await pending.get()) is not None:
+                result = self._new_result(*task)
+                await results.put(await self._run_task(result))
+            await results.put(None)
+
+        feeder = asyncio.create_task(feed())
+        workers = [
+            asyncio.create_task(work()) for _ in range(self.concurrency)
+        ]
+        try:
+            running = self.concurrency
+            while running:
+                result = await results.get()
+                if result is None:
+                    running -= 1
+                else:
+                    yield result
+            # Surface errors reading the inputs
+            await feeder
+        finally:
+            for task in (feeder, *workers):
+                task.cancel()
+            await asyncio.gather(feeder, *workers, return_exceptions=True)
+            if self._owns_pool:
+                await self.mcp_pool.close()
+
+    async def run_jsonl(
+        self, input_path: str | Path, output_path: str | Path
+    ) -> dict[str, Any]:
+        """Run the tasks in a JSONL file, appending results as they finish.
+
+        Each input line is a JSON string or an object with an "input" key.
+
+        Returns:
+            Totals for the batch: tasks, errors, tokens and wall time
+        """
+        totals = {
+            "tasks": 0,
+            "errors": 0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+        }
+        start = time.perf_counter()
+        with open(output_path, "a", encoding="utf-8") as output:
+            async for result in self.run(_read_jsonl(input_path)):
+                output.write(json.dumps(result.to_dict()) + "\n")
+                output.flush()
+                totals["tasks"] += 1
+                totals["errors"] += result.error is not None
+                totals["input_tokens"] += result.input_tokens
+                totals["output_tokens"] += result.output_tokens
+        totals["wall_time"] = round(time.perf_counter() - start, 3)
+        return totals
+
+    async def _batch_request(
+        self, custom_id: str, result: BatchResult, mcp_tools: list[Any]
+    ) -> dict[str, Any]:
+        """Message Batches request for the first turn of a task."""
+        agent = self.create_agent(result.task_id)
+        agent.tools.extend(mcp_tools)
+        await agent.history.add_message("user", result.input, None)
+        params = agent._prepare_message_params()
+        # Per-request HTTP options do not apply inside a batch
+        extra_body = params.get("extra_body") or {}
+        for key in REQUEST_OPTION_KEYS:
+            params.pop(key, None)
+        return {"custom_id": custom_id, "params": {**params, **extra_body}}
+
+    async def _submit_batch(
+        self, tasks: dict[str, BatchResult], mcp_tools: list[Any]
+    ) -> str:
+        requests = [
+            await self._batch_request(custom_id, result, mcp_tools)
+            for custom_id, result in tasks.items()
+        ]
+        batch = await _call(
+            self.client.messages.batches.create, requests=requests
+        )
+        return batch.id
+
+    async def _batch_results(self, batch_id: str, poll_interval: float):
+        """Wait for a batch to end, then yield its individual results."""
+        batches = self.client.messages.batches
+        while True:
+            batch = await _call(batches.retrieve, batch_id)
+            if batch.processing_status == "ended":
+                break
+            await asyncio.sleep(poll_interval)
+        if inspect.iscoroutinefunction(batches.results):
+            async for entry in await batches.results(batch_id):
+                yield entry
+        else:
+            for entry in await _call(lambda: list(batches.results(batch_id))):
+                yield entry
+
+    async def run_message_batches(
+        self,
+        inputs: Iterable[Any] | AsyncIterable[Any],
+        poll_interval: float = 30.0,
+        max_batch_size: int = 10_000,
+    ) -> AsyncIterator[BatchResult]:
+        """Run inputs through the Message Batches API.
+
+        The first turn of every task is submitted as a batch request,
+        which costs less than interactive requests and is not limited by
+        their throughput. Tasks whose reply is final are done at that
+        point; tasks that call tools continue in the interactive loop,
+        up to concurrency at a time, starting from their batch reply.
+
+        Args:
+            inputs: Strings, or dicts with an "input" key and optional
+                    "id"; other keys are kept as result metadata
+            poll_interval: Seconds between batch status checks
+            max_batch_size: Maximum requests per submitted batch
+
+        Yields:
+            A BatchResult per input; batch-only results come first, then
+            tool-using tasks as they complete. Latency is measured from
+            batch submission.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        fallbacks: set[asyncio.Task] = set()
+
+        async def submit(tasks, mcp_tools):
+            batch_id = await self._submit_batch(tasks, mcp_tools)
+            return batch_id, tasks, time.perf_counter()
+
+        async def fall_back(result, message, start):
+            async with semaphore:
+                return await self._run_task(result, message, start)
+
+        try:
+            async with AsyncExitStack() as stack:
+                mcp_tools = []
+                if self.agent_kwargs.get("mcp_servers"):
+                    mcp_tools = await self.mcp_pool.connect(
+                        self.agent_kwargs["mcp_servers"], stack
+                    )
+
+                # Submit every batch before waiting, so they run together
+                submitted = []
+                tasks: dict[str, BatchResult] = {}
+                index = 0
+                async for item in _iterate(inputs):
+                    result = self._new_result(index, item)
+                    if result.error:
+                        yield result
+                    else:
+                        tasks[f"task-{index}"] = result
+                    index += 1
+                    if len(tasks) == max_batch_size:
+                        submitted.append(await submit(tasks, mcp_tools))
+                        tasks = {}
+                if tasks:
+                    submitted.append(await submit(tasks, mcp_tools))
+
+                for batch_id, tasks, start in submitted:
+                    async for entry in self._batch_results(
+                        batch_id, poll_interval
+                    ):
+                        result = tasks.pop(entry.custom_id, None)
+                        if result is None:
+                            continue
+                        outcome = entry.result
+                        if outcome.type != "succeeded":
+                            error = getattr(outcome, "error", None)
+                            detail = getattr(error, "error", None)
+                            result.error = f"Batch request {outcome.type}"
+                            if detail is not None:
+                                result.error += f": {detail.message}"
+                        elif outcome.message.stop_reason == "tool_use":
+                            fallbacks.add(
+                                asyncio.create_task(
+                                    fall_back(result, outcome.message, start)
+                                )
+                            )
+                            continue
+                        else:
+                            result.response = outcome.message
+                            result.output = _text(outcome.message)
+                            _add_usage(result, [outcome.message.usage])
+                        result.latency = time.perf_counter() - start
+                        yield result
+                    for result in tasks.values():
+                        result.error = "No result returned for batch request"
+                        yield result
+
+                for task in asyncio.as_completed(fallbacks):
+                    yield await task
+        finally:
+            for task in fallbacks:
+                task.cancel()
+            await asyncio.gather(*fallbacks, return_exceptions=True)
+            if self._owns_pool:
+                await self.mcp_pool.close()
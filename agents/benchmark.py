@@ -0,0 +1,497 @@
+"""Offline benchmarks for the agent loop against a local Messages API.
+
+Runs scenarios against MockMessagesServer, a stand-in for the Messages
+endpoint that answers with scripted tool calls after a configurable
+latency, and reports throughput, turn latency and CPU time per turn:
+
+    python -m agents.benchmark
+    python -m agents.benchmark --scenario parallel_tools --latency 0.05
+    python -m agents.benchmark --save baseline.json
+    python -m agents.benchmark --baseline baseline.json
+
+With --baseline, the exit status is 1 if a scenario's throughput or
+CPU per turn regressed by more than --tolerance.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+import httpx
+from anthropic import AsyncAnthropic
+
+from .agent import Agent, ModelConfig
+from .tools.base import Tool
+from .utils.connections import MCPConnectionPool
+from .utils.tracing import InMemoryExporter, Tracer
+
+CALCULATOR_SERVER = {
+    "type": "stdio",
+    "command": sys.executable,
+    "args": [
+        os.path.join(
+            os.path.dirname(os.path.abspath(__file__)),
+            "tools",
+            "calculator_mcp.py",
+        )
+    ],
+}
+
+
+@dataclass
+class Script:
+    """How the mock server answers each conversation.
+
+    Every user message is answered with tool_turns rounds of
+    tools_per_turn calls to tool_name, then with final text.
+    """
+
+    tool_name: str = "echo"
+    tool_input: dict[str, Any] = field(default_factory=lambda: {"text": "hi"})
+    tools_per_turn: int = 1
+    tool_turns: int = 1
+    text: str = "done"
+
+
+def _tool_rounds(messages: list[dict[str, Any]]) -> int:
+    """Tool rounds answered since the last user message that is not
+    made of tool results."""
+    rounds = 0
+    for message in reversed(messages):
+        content = message["content"]
+        if message["role"] != "user":
+            continue
+        if isinstance(content, list) and any(
+            block.get("type") == "tool_result" for block in content
+        ):
+            rounds += 1
+        else:
+            break
+    return rounds
+
+
+def _reply(script: Script, body: dict[str, Any], size: int) -> dict[str, Any]:
+    rounds = _tool_rounds(body["messages"])
+    if rounds < script.tool_turns:
+        content = [
+            {
+                "type": "tool_use",
+                "id": f"toolu_{len(body['messages'])}_{i}",
+                "name": script.tool_name,
+                "input": script.tool_input,
+            }
+            for i in range(script.tools_per_turn)
+        ]
+        stop_reason = "tool_use"
+    else:
+        content = [{"type": "text", "text": script.text}]
+        stop_reason = "end_turn"
+    return {
+        "id": f"msg_{rounds}",
+        "type": "message",
+        "role": "assistant",
+        "model": body["model"],
+        "content": content,
+        "stop_reason": stop_reason,
+        "stop_sequence": None,
+        "usage": {
+            # Roughly four bytes per token, so histories fill the window
+            "input_tokens": size // 4,
+            "output_tokens": len(json.dumps(content)) // 4 + 1,
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 0,
+        },
+    }
+
+
+def _sse(message: dict[str, Any]) -> bytes:
+    """Encode a response as the Messages API's server-sent events."""
+    events = [("message_start", {"message": {**message, "content": []}})]
+    for index, block in enumerate(message["content"]):
+        if block["type"] == "text":
+            start = {**block, "text": ""}
+            delta = {"type": "text_delta", "text": block["text"]}
+        else:
+            start = {**block, "input": {}}
+            delta = {
+                "type": "input_json_delta",
+                "partial_json": json.dumps(block["input"]),
+            }
+        events += [
+            ("content_block_start", {"index": index, "content_block": start}),
+            ("content_block_delta", {"index": index, "delta": delta}),
+            ("content_block_stop", {"index": index}),
+        ]
+    events += [
+        (
+            "message_delta",
+            {
+                "delta": {"stop_reason": message["stop_reason"]},
+                "usage": {"output_tokens": message["usage"]["output_tokens"]},
+            },
+        ),
+        ("message_stop", {}),
+    ]
+    return "".join(
+        f"event: {name}\ndata: {json.dumps({'type': name, **data})}\n\n"
+        for name, data in events
+    ).encode()
+
+
+class MockMessagesServer:
+    """Local HTTP stand-in for POST /v1/messages.
+
+    Serves each request from a thread of its own after latency seconds,
+    as JSON or as server-sent events when the request streams. Use as a
+    context manager, and point a client at base_url.
+    """
+
+    def __init__(self, script: Script | None = None, latency: float = 0.0):
+        """Initialize a MockMessagesServer.
+
+        Args:
+            script: How conversations are answered
+            latency: Seconds each response is delayed by
+        """
+        self.script = script or Script()
+        self.latency = latency
+        self.requests = 0
+        self._server: ThreadingHTTPServer | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "MockMessagesServer":
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately; without this,
+            # delayed ACKs add ~40ms to every response
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers["content-length"]))
+                body = json.loads(raw)
+                server.requests += 1
+                reply = _reply(server.script, body, len(raw))
+                if body.get("stream"):
+                    payload = _sse(reply)
+                    content_type = "text/event-stream"
+                else:
+                    payload = json.dumps(reply).encode()
+                    content_type = "application/json"
+                time.sleep(server.latency)
+                self.send_response(200)
+                self.send_header("content-type", content_type)
+                self.send_header("content-length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(
+            target=self._server.serve_forever, daemon=True
+        ).start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class EchoTool(Tool):
+    """Tool that answers immediately, so tool dispatch is measured."""
+
+    def __init__(self):
+        super().__init__(
+            name="echo",
+            description="Echo the given text.",
+            input_schema={
+                "type": "object",
+                "properties": {"text": {"type": "string"}},
+                "required": ["text"],
+            },
+        )
+
+    async def execute(self, text: str) -> str:
+        return f"echo: {text}"
+
+
+@dataclass
+class Scenario:
+    """A workload: runs user messages sent to each of agents agents.
+
+    Each agent keeps its history across its runs, so later runs carry
+    longer conversations.
+    """
+
+    name: str
+    script: Script = field(default_factory=Script)
+    runs: int = 20
+    agents: int = 1
+    user_input: str = "hello"
+    tools: list[Tool] = field(default_factory=lambda: [EchoTool()])
+    mcp_servers: list[dict[str, Any]] = field(default_factory=list)
+    config: ModelConfig = field(default_factory=ModelConfig)
+
+
+def _percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+@dataclass
+class BenchmarkResult:
+    """Measurements of one scenario."""
+
+    scenario: str
+    turns: int
+    seconds: float
+    cpu_seconds: float
+    turn_latencies: list[float] = field(repr=False, default_factory=list)
+
+    @property
+    def turns_per_sec(self) -> float:
+        return self.turns / self.seconds if self.seconds else 0.0
+
+    @property
+    def p50_ms(self) -> float:
+        return _percentile(self.turn_latencies, 0.5)
+
+    @property
+    def p99_ms(self) -> float:
+        return _percentile(self.turn_latencies, 0.99)
+
+    @property
+    def cpu_ms_per_turn(self) -> float:
+        return self.cpu_seconds * 1000 / self.turns if self.turns else 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "scenario": self.scenario,
+            "turns": self.turns,
+            "seconds": round(self.seconds, 4),
+            "turns_per_sec": round(self.turns_per_sec, 2),
+            "p50_ms": round(self.p50_ms, 3),
+            "p99_ms": round(self.p99_ms, 3),
+            "cpu_ms_per_turn": round(self.cpu_ms_per_turn, 3),
+        }
+
+
+def default_scenarios() -> list[Scenario]:
+    """The standard suite."""
+    return [
+        Scenario(
+            "long_history",
+            script=Script(tool_turns=0),
+            runs=200,
+            user_input="Summarize the following notes. " + "lorem " * 300,
+        ),
+        Scenario(
+            "parallel_tools",
+            script=Script(tools_per_turn=32, tool_turns=2),
+        ),
+        Scenario(
+            "mcp_calculator",
+            script=Script(
+                tool_name="calculator",
+                tool_input={"number1": 6, "number2": 7, "operator": "*"},
+                tools_per_turn=4,
+            ),
+            tools=[],
+            mcp_servers=[CALCULATOR_SERVER],
+        ),
+        Scenario(
+            "mcp_inprocess",
+            script=Script(
+                tool_name="calculator",
+                tool_input={"number1": 6, "number2": 7, "operator": "*"},
+                tools_per_turn=4,
+            ),
+            tools=[],
+            mcp_servers=[
+                {"type": "inprocess", "server": "agents.tools.calculator_mcp"}
+            ],
+        ),
+        Scenario(
+            "truncation",
+            script=Script(tools_per_turn=2),
+            runs=50,
+            user_input="Keep this in mind. " + "ipsum " * 300,
+            config=ModelConfig(context_window_tokens=4000),
+        ),
+    ]
+
+
+async def run_scenario(
+    scenario: Scenario, latency: float = 0.0, stream: bool = False
+) -> BenchmarkResult:
+    """Run a scenario against a fresh mock server.
+
+    Turn latency is taken from the agents' turn spans. CPU time is that
+    of the event loop's thread, so the mock server, running in threads
+    of its own, and MCP server subprocesses are not counted.
+    """
+    exporter = InMemoryExporter()
+    pool = MCPConnectionPool()
+    with MockMessagesServer(scenario.script, latency) as server:
+        client = AsyncAnthropic(
+            api_key="benchmark",
+            base_url=server.base_url,
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=None)
+            ),
+        )
+        agents = [
+            Agent(
+                name=f"{scenario.name}-{i}",
+                system="You are a benchmark.",
+                tools=list(scenario.tools),
+                mcp_servers=scenario.mcp_servers,
+                config=scenario.config,
+                client=client,
+                stream=stream,
+                mcp_pool=pool,
+                tracer=Tracer(exporter),
+                preserialize_requests=True,
+            )
+            for i in range(scenario.agents)
+        ]
+
+        async def drive(agent: Agent) -> None:
+            for _ in range(scenario.runs):
+                await agent.run_async(scenario.user_input)
+
+        try:
+            # Start MCP servers before measuring
+            if scenario.mcp_servers:
+                for config in scenario.mcp_servers:
+                    await pool.acquire(config)
+                    pool.release(config)
+            start, cpu_start = time.perf_counter(), time.thread_time()
+            await asyncio.gather(*[drive(agent) for agent in agents])
+            seconds = time.perf_counter() - start
+            cpu_seconds = time.thread_time() - cpu_start
+        finally:
+            await pool.close()
+            await client.close()
+
+    latencies = [
+        span.duration_ms
+        for span in exporter.spans
+        if span.name == "agent.turn"
+    ]
+    return BenchmarkResult(
+        scenario.name, len(latencies), seconds, cpu_seconds, latencies
+    )
+
+
+def compare(
+    results: list[dict[str, Any]],
+    baseline: list[dict[str, Any]],
+    tolerance: float = 0.2,
+) -> list[str]:
+    """Describe each regression of results against a baseline run."""
+    before = {result["scenario"]: result for result in baseline}
+    regressions = []
+    for result in results:
+        old = before.get(result["scenario"])
+        if old is None:
+            continue
+        if result["turns_per_sec"] < old["turns_per_sec"] * (1 - tolerance):
+            regressions.append(
+                f"{result['scenario']}: {result['turns_per_sec']} turns/s, "
+                f"was {old['turns_per_sec']}"
+            )
+        if result["cpu_ms_per_turn"] > old["cpu_ms_per_turn"] * (
+            1 + tolerance
+        ):
+            regressions.append(
+                f"{result['scenario']}: {result['cpu_ms_per_turn']} ms CPU "
+                f"per turn, was {old['cpu_ms_per_turn']}"
+            )
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        help="Scenario to run (repeatable); default: all",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds the mock server delays each response",
+    )
+    parser.add_argument(
+        "--stream", action="store_true", help="Use the streaming API"
+    )
+    parser.add_argument("--save", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare with a saved JSON file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Relative change tolerated against the baseline",
+    )
+    args = parser.parse_args(argv)
+
+    scenarios = default_scenarios()
+    if args.scenario:
+        known = {scenario.name for scenario in scenarios}
+        unknown = set(args.scenario) - known
+        if unknown:
+            parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+        scenarios = [s for s in scenarios if s.name in args.scenario]
+
+    results = []
+    print(
+        f"{'scenario':<16}{'turns':>7}{'turns/s':>10}"
+        f"{'p50 ms':>10}{'p99 ms':>10}{'cpu ms/turn':>13}"
+    )
+    for scenario in scenarios:
+        result = asyncio.run(
+            run_scenario(scenario, args.latency, args.stream)
+        ).to_dict()
+        results.append(result)
+        print(
+            f"{result['scenario']:<16}{result['turns']:>7}"
+            f"{result['turns_per_sec']:>10}{result['p50_ms']:>10}"
+            f"{result['p99_ms']:>10}{result['cpu_ms_per_turn']:>13}"
+        )
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
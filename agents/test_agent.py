@@ -0,0 +1,962 @@
+"""Offline tests for the Agent loop.
+
+These tests drive a real Anthropic client against an in-memory httpx
+transport that returns scripted Messages API responses, so they run
+without network access or an API key.
+"""
+
+import asyncio
+import base64
+import json
+import os
+import sys
+import threading
+import time
+
+import httpx
+import pytest
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from anthropic import (
+    Anthropic,
+    APIStatusError,
+    AsyncAnthropic,
+    NotFoundError,
+)
+from anthropic.types import ToolUseBlock
+
+from agents.agent import Agent
+from agents.benchmark import _sse
+from agents.tools.base import Tool
+from agents.tools.file_tools import FileReadTool
+from agents.utils.cassette import Cassette
+from agents.utils.rate_limit import RateLimiter
+from agents.utils.result_cache import ToolResultCache
+from agents.utils.stream_util import stream_events
+from agents.utils import tool_util
+from agents.utils.tool_util import execute_tools
+from agents.utils.tracing import (
+    InMemoryExporter,
+    JSONLExporter,
+    OTLPExporter,
+    Tracer,
+)
+
+
+def _message(content: list[dict], stop_reason: str = "end_turn") -> dict:
+    """Build a Messages API response body."""
+    return {
+        "id": "msg_test",
+        "type": "message",
+        "role": "assistant",
+        "model": "claude-sonnet-4-20250514",
+        "content": content,
+        "stop_reason": stop_reason,
+        "stop_sequence": None,
+        "usage": {
+            "input_tokens": 10,
+            "output_tokens": 5,
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 0,
+        },
+    }
+
+
+class ScriptedTransport:
+    """Serves scripted responses and records the request bodies it receives."""
+
+    def __init__(self, responses: list[dict]):
+        self.responses = list(responses)
+        self.requests: list[dict] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        self.requests.append(body)
+        self.headers = request.headers
+        if body.get("stream"):
+            return httpx.Response(
+                200,
+                content=_sse(self.responses.pop(0)),
+                headers={"content-type": "text/event-stream"},
+            )
+        return httpx.Response(200, json=self.responses.pop(0))
+
+
+class EchoTool(Tool):
+    """Test tool that echoes its input after an optional delay."""
+
+    def __init__(self, delay: float = 0.0):
+        super().__init__(
+            name="echo",
+            description="Echo the given text.",
+            input_schema={
+                "type": "object",
+                "properties": {"text": {"type": "string"}},
+                "required": ["text"],
+            },
+        )
+        self.delay = delay
+
+    async def execute(self, text: str) -> str:
+        await asyncio.sleep(self.delay)
+        return f"echo: {text}"
+
+
+class TracingTool(EchoTool):
+    """Echo tool that logs when each call starts and ends."""
+
+    def __init__(self, name: str, log: list, delay: float = 0.05, **limits):
+        super().__init__(delay)
+        self.name = name
+        self.log = log
+        for key, value in limits.items():
+            setattr(self, key, value)
+
+    async def execute(self, text: str) -> str:
+        self.log.append(("start", text))
+        try:
+            return await super().execute(text)
+        finally:
+            self.log.append(("end", text))
+
+
+def _tool_call(name: str, text: str) -> ToolUseBlock:
+    return ToolUseBlock(
+        type="tool_use", id=f"toolu_{text}", name=name, input={"text": text}
+    )
+
+
+def _tool_then_text() -> list[dict]:
+    return [
+        _message(
+            [
+                {
+                    "type": "tool_use",
+                    "id": "toolu_1",
+                    "name": "echo",
+                    "input": {"text": "hi"},
+                }
+            ],
+            stop_reason="tool_use",
+        ),
+        _message([{"type": "text", "text": "done"}]),
+    ]
+
+
+def _async_client(transport: ScriptedTransport) -> AsyncAnthropic:
+    return AsyncAnthropic(
+        api_key="test",
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(transport)),
+    )
+
+
+def _sync_client(transport: ScriptedTransport) -> Anthropic:
+    return Anthropic(
+        api_key="test",
+        http_client=httpx.Client(transport=httpx.MockTransport(transport)),
+    )
+
+
+class TestAgentLoop:
+    """Agent loop behaviour with sync and async clients."""
+
+    def test_async_client_tool_round_trip(self):
+        transport = ScriptedTransport(_tool_then_text())
+        agent = Agent(
+            name="AsyncAgent",
+            system="You are a test.",
+            tools=[EchoTool()],
+            client=_async_client(transport),
+        )
+
+        response = agent.run("hello")
+
+        assert agent.is_async_client
+        assert response.content[0].text == "done"
+        tool_result = transport.requests[1]["messages"][2]["content"][0]
+        assert tool_result["tool_use_id"] == "toolu_1"
+        assert tool_result["content"] == "echo: hi"
+
+    def test_sync_client_tool_round_trip(self):
+        transport = ScriptedTransport(_tool_then_text())
+        agent = Agent(
+            name="SyncAgent",
+            system="You are a test.",
+            tools=[EchoTool()],
+            client=_sync_client(transport),
+        )
+
+        response = agent.run("hello")
+
+        assert not agent.is_async_client
+        assert response.content[0].text == "done"
+        assert len(transport.requests) == 2
+
+    def test_async_agents_share_one_loop(self):
+        latency = 0.2
+
+        def slow_sync_client(transport: ScriptedTransport) -> Anthropic:
+            def handler(request: httpx.Request) -> httpx.Response:
+                time.sleep(latency)
+                return transport(request)
+
+            return Anthropic(
+                api_key="test",
+                http_client=httpx.Client(
+                    transport=httpx.MockTransport(handler)
+                ),
+            )
+
+        def slow_async_client(transport: ScriptedTransport) -> AsyncAnthropic:
+            async def handler(request: httpx.Request) -> httpx.Response:
+                await asyncio.sleep(latency)
+                return transport(request)
+
+            return AsyncAnthropic(
+                api_key="test",
+                http_client=httpx.AsyncClient(
+                    transport=httpx.MockTransport(handler)
+                ),
+            )
+
+        for make_client in (slow_async_client, slow_sync_client):
+            agents = [
+                Agent(
+                    name=f"Agent{i}",
+                    system="You are a test.",
+                    tools=[EchoTool()],
+                    client=make_client(ScriptedTransport(_tool_then_text())),
+                )
+                for i in range(5)
+            ]
+
+            async def run_all():
+                loop = asyncio.get_running_loop()
+                start = loop.time()
+                await asyncio.gather(*[a.run_async("hello") for a in agents])
+                return loop.time() - start
+
+            # Each agent makes two 0.2s model calls. They overlap across
+            # agents (0.4s), where calls blocking the loop would take 2s
+            assert asyncio.run(run_all()) < 1.0
+
+    def test_streaming_dispatches_tools_in_order(self):
+        for make_client in (_async_client, _sync_client):
+            transport = ScriptedTransport(
+                [
+                    _message(
+                        [
+                            {"type": "text", "text": "calling"},
+                            {
+                                "type": "tool_use",
+                                "id": "toolu_1",
+                                "name": "echo",
+                                "input": {"text": "a"},
+                            },
+                            {
+                                "type": "tool_use",
+                                "id": "toolu_2",
+                                "name": "echo",
+                                "input": {"text": "b"},
+                            },
+                        ],
+                        stop_reason="tool_use",
+                    ),
+                    _message([{"type": "text", "text": "done"}]),
+                ]
+            )
+            agent = Agent(
+                name="StreamAgent",
+                system="You are a test.",
+                tools=[EchoTool()],
+                client=make_client(transport),
+                stream=True,
+            )
+
+            response = agent.run("hello")
+
+            assert response.content[0].text == "done"
+            assert transport.requests[0]["stream"] is True
+            results = transport.requests[1]["messages"][2]["content"]
+            assert [r["tool_use_id"] for r in results] == ["toolu_1", "toolu_2"]
+            assert [r["content"] for r in results] == ["echo: a", "echo: b"]
+
+
+    def test_stopping_early_closes_a_sync_stream(self):
+        body = _sse(_message([{"type": "text", "text": "hi"}] * 40))
+        sent = []
+
+        def slow_events():
+            for chunk in body.split(b"\n\n")[:-1]:
+                sent.append(chunk)
+                time.sleep(0.05)
+                yield chunk + b"\n\n"
+
+        client = Anthropic(
+            api_key="test",
+            http_client=httpx.Client(
+                transport=httpx.MockTransport(
+                    lambda request: httpx.Response(
+                        200,
+                        content=slow_events(),
+                        headers={"content-type": "text/event-stream"},
+                    )
+                )
+            ),
+        )
+
+        async def first_event():
+            events = stream_events(
+                client,
+                False,
+                model="m",
+                max_tokens=10,
+                messages=[{"role": "user", "content": "hi"}],
+            )
+            try:
+                return await anext(events)
+            finally:
+                await events.aclose()
+
+        assert asyncio.run(first_event()).type == "message_start"
+        # The worker stopped instead of reading all 124 events
+        assert len(sent) < 10
+
+    def test_preserialized_body_matches_sdk_encoding(self):
+        bodies = []
+        for preserialize in (True, False):
+            transport = ScriptedTransport(_tool_then_text())
+            agent = Agent(
+                name="PayloadAgent",
+                system="You are a test.",
+                tools=[EchoTool()],
+                client=_sync_client(transport),
+                message_params={"metadata": {"user_id": "u1"}},
+                preserialize_requests=preserialize,
+            )
+            assert agent.preserialize_requests is preserialize
+            agent.run("hello")
+            assert transport.headers["content-type"] == "application/json"
+            bodies.append(transport.requests)
+
+        assert bodies[0] == bodies[1]
+
+    def test_preserialized_responses_tolerate_api_additions(self):
+        reply = _message([{"type": "text", "text": "done", "extra": 1}])
+        reply["content"].append({"type": "future_block", "data": "x"})
+        reply["future_field"] = True
+        agent = Agent(
+            name="PayloadAgent",
+            system="You are a test.",
+            client=_async_client(ScriptedTransport([reply])),
+            rate_limiter=RateLimiter(jitter=0),
+            preserialize_requests=True,
+        )
+
+        response = agent.run("hello")
+
+        assert response.content[0].text == "done"
+        assert len(response.content) == 2
+
+
+class ScreenshotTool(Tool):
+    """Test tool returning text and a PNG image as raw bytes."""
+
+    def __init__(self):
+        super().__init__(
+            name="echo",
+            description="Take a screenshot.",
+            input_schema={"type": "object", "properties": {}},
+        )
+
+    async def execute(self, **kwargs) -> list[dict]:
+        return [
+            {"type": "text", "text": "screenshot"},
+            {
+                "type": "image",
+                "source": {
+                    "type": "base64",
+                    "media_type": "image/png",
+                    "data": PNG,
+                },
+            },
+        ]
+
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256))
+
+
+class TestRichToolResults:
+    """Content blocks from tools reach the API intact."""
+
+    def test_image_bytes_are_encoded_once_per_message(self):
+        modes = [(True, False), (False, False), (False, True)]
+        for preserialize, stream in modes:
+            transport = ScriptedTransport(_tool_then_text())
+            agent = Agent(
+                name="ScreenshotAgent",
+                system="You are a test.",
+                tools=[ScreenshotTool()],
+                client=_sync_client(transport),
+                stream=stream,
+                preserialize_requests=preserialize,
+            )
+
+            agent.run("hello")
+
+            result = transport.requests[1]["messages"][2]["content"][0]
+            text, image = result["content"]
+            assert text == {"type": "text", "text": "screenshot"}
+            assert image["source"]["data"] == base64.b64encode(PNG).decode()
+            # The history keeps the bytes; the encoded copy is cached
+            record = agent.history.records[2]
+            stored = record.content[0]["content"][1]["source"]["data"]
+            assert stored is PNG
+            assert record.has_media
+            assert record.api_message() is record.api_message()
+
+
+class TestToolScheduling:
+    """Per-tool concurrency limits, timeouts and ordering."""
+
+    def test_timeout_returns_error_result(self):
+        log = []
+        tools = {
+            "slow": TracingTool("slow", log, delay=10, timeout=0.05),
+            "fast": TracingTool("fast", log),
+        }
+        calls = [_tool_call("slow", "a"), _tool_call("fast", "b")]
+
+        results = asyncio.run(execute_tools(calls, tools))
+
+        assert results[0]["is_error"] is True
+        assert results[0]["content"] == "Tool 'slow' timed out after 0.05s"
+        assert results[1]["content"] == "echo: b"
+        # The timed-out call was cancelled rather than left running
+        assert ("end", "a") in log
+
+    def test_timeouts_raised_by_tools_are_their_own_errors(self):
+        class ConnectTool(EchoTool):
+            async def execute(self, text: str) -> str:
+                raise TimeoutError("connect timed out")
+
+        for timeout in (None, 10):
+            tool = ConnectTool()
+            tool.timeout = timeout
+            results = asyncio.run(
+                execute_tools([_tool_call("echo", "a")], {"echo": tool})
+            )
+
+            assert results[0]["is_error"] is True
+            assert results[0]["content"] == (
+                "Error executing tool: connect timed out"
+            )
+
+    def test_max_concurrency_is_respected(self):
+        log = []
+        tools = {"echo": TracingTool("echo", log, max_concurrency=2)}
+        calls = [_tool_call("echo", str(i)) for i in range(5)]
+
+        asyncio.run(execute_tools(calls, tools))
+
+        running = peak = 0
+        for event, _ in log:
+            running += 1 if event == "start" else -1
+            peak = max(peak, running)
+        assert peak == 2
+
+    def test_limits_follow_changes_and_release_tools(self):
+        def peak(log: list) -> int:
+            running = peak = 0
+            for event, _ in log:
+                running += 1 if event == "start" else -1
+                peak = max(peak, running)
+            return peak
+
+        log = []
+        tool = TracingTool("echo", log, max_concurrency=1)
+        calls = [_tool_call("echo", str(i)) for i in range(4)]
+
+        async def run():
+            await execute_tools(calls, {"echo": tool})
+            first = peak(log)
+            log.clear()
+            tool.max_concurrency = 3
+            await execute_tools(calls, {"echo": tool})
+            limits = tool_util._limits[asyncio.get_running_loop()]
+            return first, peak(log), limits
+
+        first, second, limits = asyncio.run(run())
+
+        assert (first, second, len(limits)) == (1, 3, 1)
+        # The cached limit does not keep the tool alive
+        tool = None
+        assert limits == {}
+
+    def test_unsafe_tool_runs_alone(self):
+        log = []
+        tools = {
+            "read": TracingTool("read", log),
+            "write": TracingTool("write", log, parallel_safe=False),
+        }
+        calls = [
+            _tool_call("read", "a"),
+            _tool_call("read", "b"),
+            _tool_call("write", "c"),
+            _tool_call("read", "d"),
+        ]
+
+        results = asyncio.run(execute_tools(calls, tools))
+
+        assert [r["content"] for r in results] == [
+            "echo: a",
+            "echo: b",
+            "echo: c",
+            "echo: d",
+        ]
+        write_start = log.index(("start", "c"))
+        write_end = log.index(("end", "c"))
+        assert {("end", "a"), ("end", "b")} <= set(log[:write_start])
+        assert log[write_start + 1] == ("end", "c")
+        assert log.index(("start", "d")) > write_end
+
+
+class TestToolResultCache:
+    """Memoized results of cacheable tools."""
+
+    def test_file_reads_are_cached_until_the_file_changes(self, tmp_path):
+        path = tmp_path / "notes.txt"
+        path.write_text("v1")
+        cache = ToolResultCache()
+        tools = {"file_read": FileReadTool()}
+        call = ToolUseBlock(
+            type="tool_use",
+            id="toolu_1",
+            name="file_read",
+            input={"operation": "read", "path": str(path)},
+        )
+
+        async def read():
+            results = await execute_tools([call], tools, cache=cache)
+            return results[0]["content"]
+
+        assert asyncio.run(read()) == "v1"
+        assert asyncio.run(read()) == "v1"
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        path.write_text("v2 is longer")
+        assert asyncio.run(read()) == "v2 is longer"
+        assert (cache.hits, cache.misses) == (1, 2)
+
+    def test_listings_are_cached_until_they_change(self, tmp_path):
+        (tmp_path / "src").mkdir()
+        (tmp_path / "src" / "a.py").write_text("a")
+        (tmp_path / "debug.log").write_text("log")
+        (tmp_path / ".gitignore").write_text("*.log\n")
+        cache = ToolResultCache()
+        tools = {"file_read": FileReadTool()}
+
+        def listing(pattern: str) -> str:
+            call = ToolUseBlock(
+                type="tool_use",
+                id="toolu_1",
+                name="file_read",
+                input={
+                    "operation": "list",
+                    "path": str(tmp_path),
+                    "pattern": pattern,
+                },
+            )
+            results = asyncio.run(execute_tools([call], tools, cache=cache))
+            return results[0]["content"]
+
+        # Path patterns reach below the root, so they are never cached
+        assert listing("src/*.py") == "📄 src/a.py"
+        (tmp_path / "src" / "b.py").write_text("b")
+        assert listing("src/*.py") == "📄 src/a.py\n📄 src/b.py"
+        assert cache.hits == 0
+
+        assert listing("*") == "📁 src/"
+        assert listing("*") == "📁 src/"
+        assert cache.hits == 1
+        # Editing the .gitignore leaves the directory's mtime unchanged
+        (tmp_path / ".gitignore").write_text("")
+        assert listing("*") == "📄 debug.log\n📁 src/"
+        assert cache.hits == 1
+
+    def test_eviction_and_invalidation(self):
+        log = []
+        tool = TracingTool("echo", log, delay=0, cacheable=True)
+        tools = {"echo": tool}
+        cache = ToolResultCache(max_entries=2)
+
+        def run(*texts):
+            calls = [_tool_call("echo", text) for text in texts]
+            asyncio.run(execute_tools(calls, tools, cache=cache))
+
+        run("a", "b")
+        run("a", "c")
+        assert len(cache) == 2
+        assert cache.get(tool, {"text": "b"}) is None
+        assert cache.get(tool, {"text": "a"}) == "echo: a"
+
+        cache.invalidate(tool, {"text": "a"})
+        assert cache.get(tool, {"text": "a"}) is None
+        cache.invalidate(tool)
+        assert len(cache) == 0
+
+    def test_uncacheable_tools_always_run(self):
+        log = []
+        tools = {"echo": TracingTool("echo", log, delay=0)}
+        cache = ToolResultCache()
+        calls = [_tool_call("echo", "a")]
+
+        asyncio.run(execute_tools(calls, tools, cache=cache))
+        asyncio.run(execute_tools(calls, tools, cache=cache))
+
+        assert log.count(("start", "a")) == 2
+        assert len(cache) == 0
+
+
+class TestRateLimiter:
+    """Header-driven pacing and rate-limit retries."""
+
+    def test_requests_wait_for_token_budget(self):
+        limiter = RateLimiter(jitter=0)
+        limiter.update(
+            "m",
+            {
+                "anthropic-ratelimit-input-tokens-limit": "6000",
+                "anthropic-ratelimit-input-tokens-remaining": "0",
+            },
+        )
+
+        async def acquire():
+            start = time.perf_counter()
+            await limiter.acquire("m", 20, 10)
+            return time.perf_counter() - start
+
+        # 6000 tokens per minute refill 100 per second
+        assert 0.15 < asyncio.run(acquire()) < 1.0
+
+    def test_rate_limited_requests_are_retried(self):
+        responses = [
+            httpx.Response(
+                429,
+                json={
+                    "type": "error",
+                    "error": {"type": "rate_limit_error", "message": "slow"},
+                },
+                headers={"retry-after": "0.2"},
+            ),
+            httpx.Response(
+                200,
+                json=_message([{"type": "text", "text": "done"}]),
+                headers={
+                    "anthropic-ratelimit-output-tokens-limit": "600",
+                    "anthropic-ratelimit-output-tokens-remaining": "595",
+                },
+            ),
+        ]
+        limiter = RateLimiter(jitter=0)
+        agent = Agent(
+            name="LimitedAgent",
+            system="You are a test.",
+            client=AsyncAnthropic(
+                api_key="test",
+                max_retries=0,
+                http_client=httpx.AsyncClient(
+                    transport=httpx.MockTransport(
+                        lambda request: responses.pop(0)
+                    )
+                ),
+            ),
+            rate_limiter=limiter,
+        )
+
+        start = time.perf_counter()
+        response = agent.run("hello")
+
+        assert response.content[0].text == "done"
+        assert time.perf_counter() - start >= 0.2
+        bucket = limiter._models[agent.config.model].buckets["output-tokens"]
+        assert bucket.capacity == 600
+
+    def test_paced_requests_replace_sdk_retries(self, monkeypatch):
+        monkeypatch.setattr("agents.agent.RETRY_BASE_DELAY", 0.01)
+        requests = []
+
+        def failing(request):
+            requests.append(request)
+            return httpx.Response(
+                500,
+                json={
+                    "type": "error",
+                    "error": {"type": "api_error", "message": "down"},
+                },
+            )
+
+        for stream in (False, True):
+            requests.clear()
+            limiter = RateLimiter(jitter=0)
+            agent = Agent(
+                name="LimitedAgent",
+                system="You are a test.",
+                # The client keeps the SDK's default of 2 retries
+                client=AsyncAnthropic(
+                    api_key="test",
+                    http_client=httpx.AsyncClient(
+                        transport=httpx.MockTransport(failing)
+                    ),
+                ),
+                stream=stream,
+                rate_limiter=limiter,
+            )
+
+            with pytest.raises(APIStatusError):
+                agent.run("hello")
+
+            # Two retries in all, each paced by the limiter, rather than
+            # the SDK's two for each of them
+            assert len(requests) == 3
+            assert agent.client.max_retries == 2
+            # Server errors do not hold back other requests for the model
+            assert limiter._limits(agent.config.model).failures == 0
+
+    def test_server_errors_are_retried(self, monkeypatch):
+        monkeypatch.setattr("agents.agent.RETRY_BASE_DELAY", 0.01)
+        for stream in (False, True):
+            transport = ScriptedTransport(
+                [_message([{"type": "text", "text": "done"}])]
+            )
+            failures = [
+                httpx.Response(
+                    500,
+                    json={
+                        "type": "error",
+                        "error": {"type": "api_error", "message": "down"},
+                    },
+                )
+            ]
+
+            def flaky(request):
+                return failures.pop() if failures else transport(request)
+
+            agent = Agent(
+                name="LimitedAgent",
+                system="You are a test.",
+                client=AsyncAnthropic(
+                    api_key="test",
+                    http_client=httpx.AsyncClient(
+                        transport=httpx.MockTransport(flaky)
+                    ),
+                ),
+                stream=stream,
+                rate_limiter=RateLimiter(jitter=0),
+            )
+
+            response = agent.run("hello")
+
+            assert response.content[0].text == "done"
+
+
+class TestTracing:
+    """Spans for runs, turns, model requests and tool calls."""
+
+    def test_spans_nest_and_record_usage(self):
+        for stream in (False, True):
+            exporter = InMemoryExporter()
+            agent = Agent(
+                name="TracedAgent",
+                system="You are a test.",
+                tools=[EchoTool()],
+                client=_async_client(ScriptedTransport(_tool_then_text())),
+                stream=stream,
+                tracer=Tracer(exporter),
+            )
+
+            agent.run("hello")
+
+            spans = {s.span_id: s for s in exporter.spans}
+            names = [s.name for s in exporter.spans]
+            assert names.count("agent.turn") == 2
+            assert names.count("model.request") == 2
+            assert names.count("request.build") == 2
+            (run,) = [s for s in exporter.spans if s.name == "agent.run"]
+            assert run.parent_id is None
+            assert {s.trace_id for s in exporter.spans} == {run.trace_id}
+
+            turn = next(s for s in exporter.spans if s.name == "agent.turn")
+            assert turn.parent_id == run.span_id
+            assert turn.attributes["input_tokens"] == 10
+            assert turn.attributes["output_tokens"] == 5
+            assert turn.attributes["cache_read_tokens"] == 0
+            assert turn.attributes["tool_calls"] == 1
+
+            (tool,) = [s for s in exporter.spans if s.name == "tool.execute"]
+            assert tool.attributes == {"tool": "echo", "is_error": False}
+            # Tools run under the turn, or the request they overlap with
+            assert spans[tool.parent_id].name == (
+                "model.request" if stream else "agent.turn"
+            )
+            request = next(
+                s for s in exporter.spans if s.name == "model.request"
+            )
+            assert ("ttft_ms" in request.attributes) == stream
+
+    def test_truncation_is_recorded_on_the_turn(self):
+        exporter = InMemoryExporter()
+        transport = ScriptedTransport(
+            [_message([{"type": "text", "text": "ok"}])] * 3
+        )
+        agent = Agent(
+            name="TruncatedAgent",
+            system="You are a test.",
+            client=_async_client(transport),
+            tracer=Tracer(exporter),
+        )
+        agent.history.context_window_tokens = 10
+
+        for text in ("first", "second", "third"):
+            agent.run(text)
+
+        events = [
+            event
+            for s in exporter.spans
+            if s.name == "agent.turn"
+            for event in s.events
+        ]
+        assert events and events[0]["name"] == "history.truncated"
+        assert events[0]["attributes"]["messages_evicted"] >= 1
+
+    def test_jsonl_exporter(self, tmp_path):
+        path = tmp_path / "spans.jsonl"
+        tracer = Tracer(JSONLExporter(path))
+
+        with tracer.span("outer", step=1):
+            with tracer.span("inner") as inner:
+                inner.add_event("note", detail="x")
+        tracer.flush()
+
+        outer, = [
+            json.loads(line)
+            for line in path.read_text().splitlines()
+            if json.loads(line)["name"] == "outer"
+        ]
+        inner = json.loads(path.read_text().splitlines()[0])
+        assert inner["name"] == "inner"
+        assert inner["parent_id"] == outer["span_id"]
+        assert inner["events"][0]["attributes"] == {"detail": "x"}
+        assert outer["attributes"] == {"step": 1}
+
+    def test_otlp_exporter_posts_to_collector(self):
+        received, threads = [], []
+
+        def collector(request: httpx.Request) -> httpx.Response:
+            received.append(json.loads(request.content))
+            threads.append(threading.current_thread())
+            return httpx.Response(200, json={})
+
+        exporter = OTLPExporter(
+            batch_size=2,
+            client=httpx.Client(transport=httpx.MockTransport(collector)),
+        )
+        tracer = Tracer(exporter)
+        try:
+            with tracer.span("run"):
+                with tracer.span("turn", tokens=3, ratio=0.5, ok=True):
+                    pass
+                raise ValueError("boom")
+        except ValueError:
+            pass
+        with tracer.span("tail"):
+            pass
+        tracer.flush()
+
+        assert len(received) == 2
+        # Full batches are posted off the thread that ended the span
+        assert threading.main_thread() not in threads
+        spans = received[0]["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        turn, run = spans
+        assert turn["parentSpanId"] == run["spanId"]
+        assert "parentSpanId" not in run
+        assert turn["attributes"] == [
+            {"key": "tokens", "value": {"intValue": "3"}},
+            {"key": "ratio", "value": {"doubleValue": 0.5}},
+            {"key": "ok", "value": {"boolValue": True}},
+        ]
+        assert run["status"] == {"code": 2, "message": "ValueError: boom"}
+        assert turn["status"] == {"code": 1}
+
+
+class TestCassette:
+    """Recording model calls and replaying them offline."""
+
+    def _agent(self, client, stream=False) -> Agent:
+        return Agent(
+            name="CassetteAgent",
+            system="You are a test.",
+            tools=[EchoTool()],
+            client=client,
+            stream=stream,
+        )
+
+    def test_recorded_runs_replay_without_the_api(self, tmp_path):
+        path = tmp_path / "agent.cassette"
+
+        def offline(request: httpx.Request) -> httpx.Response:
+            raise AssertionError("The API was called during replay")
+
+        for stream in (False, True):
+            for async_client in (True, False):
+                transport = ScriptedTransport(_tool_then_text())
+                recorder = Cassette(path)
+                agent = self._agent(
+                    recorder.client(
+                        async_client,
+                        httpx.MockTransport(transport),
+                        api_key="test",
+                    ),
+                    stream,
+                )
+                recorded = agent.run("hello")
+
+                player = Cassette(path, mode="replay")
+                agent = self._agent(
+                    player.client(async_client, httpx.MockTransport(offline)),
+                    stream,
+                )
+                replayed = agent.run("hello")
+
+                assert replayed.content[0].text == recorded.content[0].text
+                assert player.hits == 2
+                # The sync client's requests match the async recordings
+                assert len(transport.requests) == (2 if async_client else 0)
+            # A stream and a plain request are different recordings
+            assert len(Cassette(path)) == (2 if not stream else 4)
+
+    def test_unrecorded_requests_fail_in_replay_mode(self, tmp_path):
+        agent = self._agent(
+            Cassette(tmp_path / "empty.cassette", mode="replay").client()
+        )
+
+        with pytest.raises(NotFoundError):
+            agent.run("hello")
+
+    def test_keys_ignore_serialization_details(self):
+        def request(content: bytes) -> httpx.Request:
+            return httpx.Request(
+                "POST",
+                "https://api.anthropic.com/v1/messages",
+                content=content,
+                headers={"anthropic-version": "2023-06-01"},
+            )
+
+        first = request(b'{"model":"m","max_tokens":5}')
+        second = request(b'{ "max_tokens": 5, "model": "m" }')
+        third = request(b'{"model":"m","max_tokens":6}')
+
+        assert Cassette.request_key(first) == Cassette.request_key(second)
+        assert Cassette.request_key(first) != Cassette.request_key(third)
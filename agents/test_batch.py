@@ -0,0 +1,239 @@
+"""Offline tests for the batch runner."""
+
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from anthropic import AsyncAnthropic
+
+from agents.batch import BatchRunner
+from agents.test_agent import EchoTool, _message
+
+
+class ConcurrencyTool(EchoTool):
+    """Echo tool that sleeps for the requested time and tracks overlap."""
+
+    def __init__(self):
+        super().__init__()
+        self.running = 0
+        self.peak = 0
+
+    async def execute(self, text: str) -> str:
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(float(text))
+            return f"echo: {text}"
+        finally:
+            self.running -= 1
+
+
+def _reply(params: dict) -> dict:
+    """Call echo with the task's input, then answer with the tool result.
+
+    Inputs starting with "say " are answered directly.
+    """
+    block = params["messages"][-1]["content"][-1]
+    if block["type"] == "tool_result":
+        return _message([{"type": "text", "text": f"done {block['content']}"}])
+    if block["text"].startswith("say "):
+        return _message([{"type": "text", "text": block["text"][4:]}])
+    tool_use = {
+        "type": "tool_use",
+        "id": "toolu_1",
+        "name": "echo",
+        "input": {"text": block["text"]},
+    }
+    return _message([tool_use], stop_reason="tool_use")
+
+
+def _route(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, json=_reply(json.loads(request.content)))
+
+
+class MockBatchServer:
+    """Local stand-in for the Messages and Message Batches endpoints.
+
+    A batch reports in_progress on its first status check and ended on
+    the next, so clients exercise polling.
+    """
+
+    def __init__(self):
+        self.batches: dict[str, dict] = {}
+        self.status_checks: dict[str, int] = {}
+        self.message_requests: list[dict] = []
+
+    def _batch(self, batch_id: str, ended: bool) -> dict:
+        url = f"https://api.anthropic.com/v1/messages/batches/{batch_id}"
+        count = len(self.batches[batch_id]["requests"])
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else count,
+                "succeeded": count if ended else 0,
+                "errored": 0,
+                "canceled": 0,
+                "expired": 0,
+            },
+            "created_at": "2025-01-01T00:00:00Z",
+            "expires_at": "2025-01-02T00:00:00Z",
+            "ended_at": "2025-01-01T00:01:00Z" if ended else None,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": f"{url}/results" if ended else None,
+        }
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path == "/v1/messages":
+            body = json.loads(request.content)
+            self.message_requests.append(body)
+            return httpx.Response(200, json=_reply(body))
+        if path == "/v1/messages/batches":
+            batch_id = f"msgbatch_{len(self.batches)}"
+            self.batches[batch_id] = json.loads(request.content)
+            self.status_checks[batch_id] = 0
+            return httpx.Response(200, json=self._batch(batch_id, False))
+        batch_id = path.split("/")[4]
+        if path.endswith("/results"):
+            lines = [
+                {
+                    "custom_id": item["custom_id"],
+                    "result": {
+                        "type": "succeeded",
+                        "message": _reply(item["params"]),
+                    },
+                }
+                for item in self.batches[batch_id]["requests"]
+            ]
+            return httpx.Response(
+                200, text="".join(json.dumps(line) + "\n" for line in lines)
+            )
+        self.status_checks[batch_id] += 1
+        ended = self.status_checks[batch_id] > 1
+        return httpx.Response(200, json=self._batch(batch_id, ended))
+
+
+def _runner(
+    tool: EchoTool, concurrency: int, handler=_route
+) -> BatchRunner:
+    client = AsyncAnthropic(
+        api_key="test",
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+    return BatchRunner(
+        concurrency=concurrency,
+        client=client,
+        name="Batch",
+        system="You are a test.",
+        tools=[tool],
+    )
+
+
+class TestBatchRunner:
+    """Bounded, streaming execution of many tasks."""
+
+    def test_results_stream_in_completion_order(self):
+        tool = ConcurrencyTool()
+        runner = _runner(tool, concurrency=2)
+        inputs = ["0.3", {"id": "fast", "input": "0.01", "split": "dev"}]
+        inputs += ["0.05", "0.05", {"id": "bad"}]
+
+        async def run():
+            return [result async for result in runner.run(inputs)]
+
+        results = asyncio.run(run())
+
+        assert tool.peak == 2
+        # The slow first task holds one worker while the other drains
+        # the rest of the queue
+        assert [r.task_id for r in results] == ["fast", "2", "3", "bad", "0"]
+        fast = results[0]
+        assert fast.output == "done echo: 0.01"
+        assert fast.metadata == {"split": "dev"}
+        assert (fast.turns, fast.input_tokens, fast.output_tokens) == (
+            2,
+            20,
+            10,
+        )
+        assert results[3].error == "Task has no 'input'"
+        assert results[-1].latency > 0.3
+
+    def test_stopping_early_cancels_the_rest(self):
+        tool = ConcurrencyTool()
+        runner = _runner(tool, concurrency=2)
+
+        async def first():
+            results = runner.run(["0.3"] * 100)
+            try:
+                async for result in results:
+                    return result
+            finally:
+                await asyncio.wait_for(results.aclose(), 5)
+
+        result = asyncio.run(first())
+
+        assert result.output == "done echo: 0.3"
+        assert tool.running == 0
+
+    def test_jsonl_files(self, tmp_path):
+        input_path = tmp_path / "tasks.jsonl"
+        output_path = tmp_path / "results.jsonl"
+        input_path.write_text(
+            "".join(json.dumps(f"0.0{i}") + "\n" for i in range(5))
+        )
+        runner = _runner(ConcurrencyTool(), concurrency=3)
+
+        totals = asyncio.run(runner.run_jsonl(input_path, output_path))
+
+        lines = [
+            json.loads(line) for line in output_path.read_text().splitlines()
+        ]
+        assert sorted(line["id"] for line in lines) == list("01234")
+        assert totals["tasks"] == 5
+        assert totals["errors"] == 0
+        assert totals["output_tokens"] == 50
+
+
+class TestMessageBatches:
+    """First turns submitted through the Message Batches API."""
+
+    def test_tool_calls_continue_interactively(self):
+        server = MockBatchServer()
+        runner = _runner(ConcurrencyTool(), concurrency=2, handler=server)
+        inputs = ["say hi", "0.01", {"id": "x", "input": "say bye"}, "0.02"]
+
+        async def run():
+            return [
+                result
+                async for result in runner.run_message_batches(
+                    inputs, poll_interval=0, max_batch_size=3
+                )
+            ]
+
+        results = asyncio.run(run())
+
+        assert len(server.batches) == 2
+        first = server.batches["msgbatch_0"]["requests"][0]
+        assert first["custom_id"] == "task-0"
+        assert first["params"]["system"][0]["text"] == "You are a test."
+        assert first["params"]["tools"][0]["name"] == "echo"
+        assert min(server.status_checks.values()) >= 2
+
+        by_id = {result.task_id: result for result in results}
+        assert [r.task_id for r in results[:2]] == ["0", "x"]
+        assert by_id["0"].output == "hi"
+        assert by_id["0"].turns == 1
+        assert by_id["1"].output == "done echo: 0.01"
+        assert by_id["1"].turns == 2
+        assert by_id["3"].output == "done echo: 0.02"
+        # Only the turns after a tool call used the interactive endpoint
+        assert len(server.message_requests) == 2
@@ -0,0 +1,103 @@
+"""Tests for the offline benchmark harness and its mock Messages API."""
+
+import asyncio
+import os
+import sys
+
+from anthropic import Anthropic
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.benchmark import (
+    MockMessagesServer,
+    Scenario,
+    Script,
+    compare,
+    run_scenario,
+)
+
+
+class TestMockMessagesServer:
+    """Scripted replies over real HTTP."""
+
+    def test_tool_rounds_then_text(self):
+        script = Script(tools_per_turn=3, tool_turns=2)
+        with MockMessagesServer(script) as server:
+            client = Anthropic(api_key="test", base_url=server.base_url)
+            messages = [{"role": "user", "content": "hello"}]
+            replies = []
+            for _ in range(3):
+                reply = client.messages.create(
+                    model="m", max_tokens=10, messages=messages
+                )
+                replies.append(reply)
+                if reply.stop_reason != "tool_use":
+                    break
+                content = reply.to_dict()["content"]
+                messages += [
+                    {"role": "assistant", "content": content},
+                    {
+                        "role": "user",
+                        "content": [
+                            {
+                                "type": "tool_result",
+                                "tool_use_id": block.id,
+                                "content": "ok",
+                            }
+                            for block in reply.content
+                        ],
+                    },
+                ]
+            client.close()
+
+        assert [r.stop_reason for r in replies] == [
+            "tool_use",
+            "tool_use",
+            "end_turn",
+        ]
+        assert len(replies[0].content) == 3
+        assert replies[1].usage.input_tokens > replies[0].usage.input_tokens
+        assert server.requests == 3
+
+
+class TestBenchmark:
+    """Scenario measurements and baseline comparison."""
+
+    def test_scenario_reports_every_turn(self):
+        for stream in (False, True):
+            scenario = Scenario(
+                "tiny", script=Script(tools_per_turn=4), runs=3, agents=2
+            )
+
+            result = asyncio.run(run_scenario(scenario, stream=stream))
+
+            # Each run is a tool round and a final answer, for each agent
+            assert result.turns == 12
+            assert len(result.turn_latencies) == 12
+            assert result.turns_per_sec > 0
+            assert 0 < result.p50_ms <= result.p99_ms
+            assert result.cpu_ms_per_turn > 0
+
+    def test_latency_is_applied(self):
+        scenario = Scenario("slow", script=Script(tool_turns=0), runs=2)
+
+        result = asyncio.run(run_scenario(scenario, latency=0.1))
+
+        assert result.p50_ms >= 100
+
+    def test_compare_flags_regressions(self):
+        baseline = [
+            {"scenario": "a", "turns_per_sec": 100, "cpu_ms_per_turn": 2.0},
+            {"scenario": "b", "turns_per_sec": 100, "cpu_ms_per_turn": 2.0},
+        ]
+        results = [
+            {"scenario": "a", "turns_per_sec": 95, "cpu_ms_per_turn": 2.1},
+            {"scenario": "b", "turns_per_sec": 50, "cpu_ms_per_turn": 3.0},
+            {"scenario": "c", "turns_per_sec": 1, "cpu_ms_per_turn": 9.0},
+        ]
+
+        regressions = compare(results, baseline, tolerance=0.2)
+
+        assert len(regressions) == 2
+        assert all(r.startswith("b:") for r in regressions)
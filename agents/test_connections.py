@@ -0,0 +1,497 @@
+"""Tests for MCP server connections.
+
+These start the calculator MCP server from tools/calculator_mcp.py as a
+local subprocess, so they need the `mcp` package but no network access.
+"""
+
+import asyncio
+import base64
+import json
+import math
+import os
+import socket
+import sys
+import threading
+import time
+from contextlib import AsyncExitStack
+from types import SimpleNamespace
+
+import pytest
+import uvicorn
+from uvicorn.protocols.http.h11_impl import H11Protocol
+from mcp.server.fastmcp import FastMCP, Image
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.tools.calculator_mcp import calculator, calculator_batch
+from agents.utils.connections import (
+    HTTP_POOL_LIMITS,
+    MCPConnectionPool,
+    create_mcp_connection,
+    setup_mcp_connections,
+)
+from agents.utils.result_cache import ToolResultCache
+from agents.utils.schema_cache import ToolSchemaCache
+from agents.utils.tool_util import execute_tools
+
+CALCULATOR_SERVER = {
+    "type": "stdio",
+    "command": sys.executable,
+    "args": [
+        os.path.join(
+            os.path.dirname(os.path.abspath(__file__)),
+            "tools",
+            "calculator_mcp.py",
+        )
+    ],
+}
+
+
+class LocalHTTPServer:
+    """The calculator served over streamable HTTP on a local port.
+
+    Counts the TCP connections it accepts, to check connection reuse.
+    """
+
+    def __init__(self, stateless: bool = True):
+        app = FastMCP(
+            "Calculator",
+            stateless_http=stateless,
+            json_response=stateless,
+            log_level="WARNING",
+        )
+        app.tool(name="calculator")(calculator)
+        self.app = app.streamable_http_app()
+        self.connections = 0
+
+    def __enter__(self) -> "LocalHTTPServer":
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        self.url = f"http://127.0.0.1:{sock.getsockname()[1]}/mcp"
+        server = self
+
+        class Protocol(H11Protocol):
+            def connection_made(self, transport):
+                server.connections += 1
+                super().connection_made(transport)
+
+        config = uvicorn.Config(
+            self.app, log_level="warning", http=Protocol, lifespan="on"
+        )
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(
+            target=self.server.run, kwargs={"sockets": [sock]}, daemon=True
+        )
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.should_exit = True
+        self.thread.join(5)
+
+
+class TestSetupConnections:
+    """Concurrent MCP server startup."""
+
+    def test_failures_are_isolated_and_order_is_kept(self):
+        hanging_server = {
+            "type": "stdio",
+            "command": sys.executable,
+            "args": ["-c", "import time; time.sleep(30)"],
+            "timeout": 1,
+        }
+        missing_server = {"type": "stdio", "command": "no-such-mcp-server"}
+
+        async def run():
+            async with AsyncExitStack() as stack:
+                tools = await setup_mcp_connections(
+                    [
+                        hanging_server,
+                        CALCULATOR_SERVER,
+                        missing_server,
+                        CALCULATOR_SERVER,
+                    ],
+                    stack,
+                )
+                result = await tools[2].execute(
+                    number1=6, number2=7, operator="*"
+                )
+                return tools, result
+
+        tools, result = asyncio.run(run())
+
+        assert [tool.name for tool in tools] == [
+            "calculator",
+            "calculator_batch",
+        ] * 2
+        assert tools[0].connection is not tools[2].connection
+        assert result == "Result: 42"
+
+
+class TestInProcessConnection:
+    """FastMCP servers mounted in the agent's event loop."""
+
+    def test_calculator_runs_in_process(self):
+        from agents.tools.calculator_mcp import mcp as calculator
+
+        async def run():
+            async with AsyncExitStack() as stack:
+                tools = await setup_mcp_connections(
+                    [
+                        {"type": "inprocess", "server": calculator},
+                        {
+                            "type": "inprocess",
+                            "server": "agents.tools.calculator_mcp",
+                        },
+                    ],
+                    stack,
+                )
+                results = await asyncio.gather(
+                    *[
+                        tools[i % 2 * 2].execute(
+                            number1=i, number2=2, operator="*"
+                        )
+                        for i in range(20)
+                    ]
+                )
+                return tools, results
+
+        tools, results = asyncio.run(run())
+
+        assert [tool.name for tool in tools] == [
+            "calculator",
+            "calculator_batch",
+        ] * 2
+        assert results == [f"Result: {i * 2}" for i in range(20)]
+
+    def test_images_are_returned_as_content_blocks(self):
+        server = FastMCP("Screens", log_level="WARNING")
+
+        @server.tool()
+        def screenshot() -> list:
+            return ["captured", Image(data=b"\x89PNG", format="png")]
+
+        async def run():
+            async with AsyncExitStack() as stack:
+                tools = await setup_mcp_connections(
+                    [{"type": "inprocess", "server": server}], stack
+                )
+                return await tools[0].execute()
+
+        text, image = asyncio.run(run())
+
+        assert text == {"type": "text", "text": "captured"}
+        assert image == {
+            "type": "image",
+            "source": {
+                "type": "base64",
+                "media_type": "image/png",
+                "data": base64.b64encode(b"\x89PNG").decode(),
+            },
+        }
+
+    def test_server_is_required(self):
+        with pytest.raises(ValueError):
+            create_mcp_connection({"type": "inprocess"})
+
+    def test_tool_errors_are_reported_and_not_cached(self):
+        server = FastMCP("Failing", log_level="WARNING")
+
+        @server.tool()
+        def boom() -> str:
+            raise ValueError("kaboom")
+
+        cache = ToolResultCache()
+        call = SimpleNamespace(id="call_1", name="boom", input={})
+
+        async def run():
+            async with AsyncExitStack() as stack:
+                tools = await setup_mcp_connections(
+                    [
+                        {
+                            "type": "inprocess",
+                            "server": server,
+                            "cache_results": True,
+                        }
+                    ],
+                    stack,
+                )
+                tool_dict = {tool.name: tool for tool in tools}
+                first = await execute_tools([call], tool_dict, cache=cache)
+                second = await execute_tools([call], tool_dict, cache=cache)
+                return first + second
+
+        results = asyncio.run(run())
+
+        for result in results:
+            assert result["is_error"] is True
+            assert "kaboom" in result["content"]
+        assert cache.hits == 0
+
+
+class TestCalculatorBatch:
+    """The vectorized calculator tool."""
+
+    def test_matches_the_scalar_calculator(self):
+        cases = [
+            (6, 7, "*"),
+            (1, 0, "/"),
+            (7, 2, "/"),
+            (2, 10, "^"),
+            (9, 0, "sqrt"),
+            (-9, 0, "sqrt"),
+            (1.5, 2.25, "-"),
+            (1, 1, "%"),
+        ]
+        numbers1, numbers2, operators = map(list, zip(*cases))
+
+        async def run():
+            async with AsyncExitStack() as stack:
+                tools = await setup_mcp_connections(
+                    [
+                        {
+                            "type": "inprocess",
+                            "server": "agents.tools.calculator_mcp",
+                        }
+                    ],
+                    stack,
+                )
+                batch = {tool.name: tool for tool in tools}["calculator_batch"]
+                return await batch.execute(
+                    numbers1=numbers1, numbers2=numbers2, operators=operators
+                )
+
+        results = json.loads(asyncio.run(run()))
+
+        for result, case in zip(results, cases):
+            expected = calculator(*case)
+            if isinstance(result, str):
+                assert result == expected
+            else:
+                assert expected == f"Result: {result}"
+
+    def test_aggregates_a_column(self):
+        column = [float(i) for i in range(500)]
+
+        assert calculator_batch(column, "+", aggregate="sum") == (
+            "Result: 124750"
+        )
+        assert calculator_batch(column, "sqrt", aggregate="max") == (
+            f"Result: {math.sqrt(499)}"
+        )
+        assert calculator_batch([1, 2], "/", [1, 0], aggregate="sum") == (
+            "Error: Calculation(s) 1 failed"
+        )
+        assert calculator_batch([1], ["+", "-"]).startswith("Error")
+
+    def test_empty_aggregates(self):
+        assert calculator_batch([], "+", aggregate="sum") == "Result: 0"
+        assert calculator_batch([], "+", aggregate="prod") == "Result: 1"
+        for aggregate in ("min", "max", "mean"):
+            assert calculator_batch([], "+", aggregate=aggregate) == (
+                f"Error: Cannot take the {aggregate} of no numbers"
+            )
+
+
+class TestStreamableHTTPConnection:
+    """Remote servers reached over a shared keep-alive pool."""
+
+    def test_agents_share_pooled_connections(self):
+        for stateless in (True, False):
+            with LocalHTTPServer(stateless) as server:
+                config = {"type": "streamable_http", "url": server.url}
+
+                async def run():
+                    # Eight agents, each with its own MCP session
+                    async with AsyncExitStack() as stack:
+                        sessions = await asyncio.gather(
+                            *[
+                                setup_mcp_connections([config], stack)
+                                for _ in range(8)
+                            ]
+                        )
+                        waves = []
+                        for _ in range(2):
+                            results = await asyncio.gather(
+                                *[
+                                    tools[0].execute(
+                                        number1=i, number2=j, operator="+"
+                                    )
+                                    for i, tools in enumerate(sessions)
+                                    for j in range(10)
+                                ]
+                            )
+                            waves.append((results, server.connections))
+                        return waves
+
+                (first, opened), (second, reopened) = asyncio.run(run())
+
+            expected = [
+                f"Result: {i + j}" for i in range(8) for j in range(10)
+            ]
+            assert first == second == expected
+            if stateless:
+                # The second wave of calls runs on kept-alive connections
+                assert reopened == opened
+                assert opened <= HTTP_POOL_LIMITS.max_connections + 8
+
+    def test_url_is_required(self):
+        with pytest.raises(ValueError):
+            create_mcp_connection({"type": "streamable_http"})
+
+
+class TestConnectionPool:
+    """Pooled MCP connections shared across runs."""
+
+    def test_connections_are_reused_and_restarted(self):
+        pool = MCPConnectionPool(idle_timeout=60)
+
+        async def run():
+            async with AsyncExitStack() as stack:
+                first = await pool.connect([CALCULATOR_SERVER], stack)
+            async with AsyncExitStack() as stack:
+                second = await pool.connect([CALCULATOR_SERVER], stack)
+                entry = second[0].connection
+                process_task = entry.served.task
+
+                # Simulate the server dying between calls
+                await entry.served.close()
+                result = await second[0].execute(
+                    number1=1, number2=2, operator="+"
+                )
+                restarted = entry.served.task is not process_task
+            await pool.close()
+            return first, second, result, restarted
+
+        first, second, result, restarted = asyncio.run(run())
+
+        assert first[0] is second[0]
+        assert result == "Result: 3"
+        assert restarted
+
+    def test_idle_connections_expire(self):
+        pool = MCPConnectionPool(idle_timeout=0.05)
+
+        async def run():
+            async with AsyncExitStack() as stack:
+                tools = await pool.connect([CALCULATOR_SERVER], stack)
+            served = tools[0].connection.served
+            for _ in range(100):
+                if not served.task.done():
+                    await asyncio.sleep(0.05)
+            return len(pool._entries), served.alive
+
+        assert asyncio.run(run()) == (0, False)
+
+    def test_closing_a_pool_keeps_shared_http_connections(self):
+        with LocalHTTPServer() as server:
+            config = {"type": "streamable_http", "url": server.url}
+
+            async def run():
+                pool = MCPConnectionPool()
+                async with AsyncExitStack() as stack:
+                    own = await setup_mcp_connections([config], stack)
+                    async with AsyncExitStack() as pooled_stack:
+                        pooled = await pool.connect([config], pooled_stack)
+                        await pooled[0].execute(
+                            number1=1, number2=1, operator="+"
+                        )
+                    opened = server.connections
+                    await pool.close()
+                    result = await own[0].execute(
+                        number1=2, number2=3, operator="+"
+                    )
+                    return result, server.connections - opened
+
+            result, reconnects = asyncio.run(run())
+
+        assert result == "Result: 5"
+        # The other session's kept-alive connection was left open
+        assert reconnects == 0
+
+
+class TestToolSchemaCache:
+    """Cached tool catalogues and lazy server startup."""
+
+    def test_cached_servers_start_on_first_call(self, tmp_path):
+        cache = ToolSchemaCache(tmp_path)
+
+        async def run():
+            # First run lists tools from the server and caches them
+            async with AsyncExitStack() as stack:
+                await setup_mcp_connections(
+                    [CALCULATOR_SERVER], stack, schema_cache=cache
+                )
+            async with AsyncExitStack() as stack:
+                tools = await setup_mcp_connections(
+                    [CALCULATOR_SERVER], stack, schema_cache=cache
+                )
+                started_before_call = tools[0].connection.served is not None
+                result = await tools[0].execute(
+                    number1=9, number2=0, operator="sqrt"
+                )
+                return tools, started_before_call, result
+
+        tools, started_before_call, result = asyncio.run(run())
+
+        assert [tool.name for tool in tools] == [
+            "calculator",
+            "calculator_batch",
+        ]
+        assert "number1" in tools[0].input_schema["properties"]
+        assert not started_before_call
+        assert result == "Result: 3"
+
+    def test_timed_out_first_calls_stop_their_server(self, tmp_path):
+        cache = ToolSchemaCache(tmp_path)
+        config = {**CALCULATOR_SERVER, "tool_timeout": 0.01}
+        call = SimpleNamespace(
+            id="call_1",
+            name="calculator",
+            input={"number1": 1, "number2": 2, "operator": "+"},
+        )
+
+        def serving() -> list[asyncio.Task]:
+            return [
+                task
+                for task in asyncio.all_tasks()
+                if task.get_coro().__name__ == "_serve_connection"
+            ]
+
+        async def run():
+            async with AsyncExitStack() as stack:
+                await setup_mcp_connections(
+                    [config], stack, schema_cache=cache
+                )
+            async with AsyncExitStack() as stack:
+                tools = await setup_mcp_connections(
+                    [config], stack, schema_cache=cache
+                )
+                # The call times out while the server is still starting
+                (result,) = await execute_tools(
+                    [call], {tool.name: tool for tool in tools}
+                )
+                for _ in range(100):
+                    if not serving():
+                        break
+                    await asyncio.sleep(0.05)
+                return result, serving()
+
+        result, leaked = asyncio.run(run())
+
+        assert result["is_error"] is True
+        assert leaked == []
+
+    def test_editing_the_server_invalidates_its_entry(self, tmp_path):
+        script = tmp_path / "server.py"
+        script.write_text("# v1")
+        config = {"command": sys.executable, "args": [str(script)]}
+        cache = ToolSchemaCache(tmp_path / "cache")
+        cache.store(config, [])
+
+        assert cache.load(config) == []
+        script.write_text("# version 2")
+        assert cache.load(config) is None
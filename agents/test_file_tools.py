@@ -0,0 +1,242 @@
+"""Tests for the file tools."""
+
+import asyncio
+import os
+import sys
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.tools import file_tools
+from agents.tools.file_tools import FileReadTool, FileWriteTool
+
+
+def _read(**kwargs) -> str:
+    return asyncio.run(FileReadTool().execute(**kwargs))
+
+
+class TestRangedReads:
+    """Line ranges, byte ranges and tails of files."""
+
+    def test_line_ranges_cross_index_blocks(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(file_tools, "_INDEX_BLOCK", 64)
+        path = tmp_path / "log.txt"
+        lines = [f"line {i}\n" for i in range(500)]
+        path.write_text("".join(lines))
+
+        for offset in (1, 7, 250, 499):
+            assert _read(
+                operation="read", path=str(path), offset=offset, limit=3
+            ) == "".join(lines[offset : offset + 3])
+        assert _read(operation="read", path=str(path), offset=500) == ""
+        assert _read(
+            operation="read", path=str(path), offset=498
+        ) == "".join(lines[498:])
+
+    def test_index_is_rebuilt_when_the_file_changes(self, tmp_path):
+        path = tmp_path / "log.txt"
+        path.write_text("a\nb\nc")
+        assert _read(operation="read", path=str(path), offset=2) == "c"
+
+        path.write_text("a\nb\nc\nd\ne\n")
+        assert _read(
+            operation="read", path=str(path), offset=2, limit=2
+        ) == "c\nd\n"
+
+    def test_byte_ranges_and_tails(self, tmp_path):
+        path = tmp_path / "log.txt"
+        path.write_text("first\nsecond\nthird\n")
+
+        assert _read(
+            operation="read", path=str(path), byte_offset=6, byte_length=6
+        ) == "second"
+        assert _read(operation="read", path=str(path), byte_offset=13) == (
+            "third\n"
+        )
+        assert _read(operation="tail", path=str(path), limit=2) == (
+            "second\nthird\n"
+        )
+        assert _read(operation="tail", path=str(path), limit=10) == (
+            "first\nsecond\nthird\n"
+        )
+
+        empty = tmp_path / "empty.txt"
+        empty.write_text("")
+        assert _read(operation="tail", path=str(empty)) == ""
+
+
+def _list(**kwargs) -> list[str]:
+    return _read(operation="list", **kwargs).splitlines()
+
+
+class TestListing:
+    """Recursive, paginated and ignore-aware directory listings."""
+
+    def _tree(self, root):
+        for path in [
+            "README.md",
+            "src/app.py",
+            "src/app.pyc",
+            "src/lib/util.py",
+            "build/out.bin",
+            "logs/keep.log",
+            "logs/debug.log",
+            ".env",
+        ]:
+            (root / path).parent.mkdir(parents=True, exist_ok=True)
+            (root / path).write_text(path)
+        (root / ".gitignore").write_text(
+            "*.pyc\nbuild/\n/logs/*.log\n!/logs/keep.log\n"
+        )
+
+    def test_depth_and_ignore_rules(self, tmp_path):
+        self._tree(tmp_path)
+
+        assert _list(path=str(tmp_path)) == [
+            "📄 README.md",
+            "📁 logs/",
+            "📁 src/",
+        ]
+        assert _list(path=str(tmp_path), max_depth=0) == [
+            "📄 README.md",
+            "📁 logs/",
+            "📄 logs/keep.log",
+            "📁 src/",
+            "📄 src/app.py",
+            "📁 src/lib/",
+            "📄 src/lib/util.py",
+        ]
+        assert _list(path=str(tmp_path), max_depth=0, pattern="*.py") == [
+            "📄 src/app.py",
+            "📄 src/lib/util.py",
+        ]
+        assert _list(path=str(tmp_path), pattern=".*") == [
+            "📄 .env",
+            "📄 .gitignore",
+        ]
+
+    def test_path_patterns_match_like_glob(self, tmp_path):
+        self._tree(tmp_path)
+
+        assert _list(path=str(tmp_path), pattern="src/*.py") == [
+            "📄 src/app.py"
+        ]
+        assert _list(path=str(tmp_path), pattern="*/*.py") == [
+            "📄 src/app.py"
+        ]
+        assert _list(path=str(tmp_path), pattern="*/*/*.py") == [
+            "📄 src/lib/util.py"
+        ]
+
+    def test_star_does_not_cross_slashes(self, tmp_path):
+        self._tree(tmp_path)
+
+        assert _list(path=str(tmp_path), max_depth=0, pattern="src/*") == [
+            "📄 src/app.py",
+            "📁 src/lib/",
+        ]
+
+    def test_pages_resume_after_the_last_entry(self, tmp_path):
+        self._tree(tmp_path)
+        full = _list(path=str(tmp_path), max_depth=0)
+
+        tool = FileReadTool()
+        pages, token = [], None
+        while True:
+            output = asyncio.run(
+                tool._list_files(str(tmp_path), "*", 0, token, page_size=3)
+            ).splitlines()
+            if output[-1].startswith("... more files"):
+                token = output.pop().split("page_token=")[1]
+                pages.append(output)
+            else:
+                pages.append(output)
+                break
+
+        assert [len(page) for page in pages] == [3, 3, 1]
+        assert sum(pages, []) == full
+
+    def test_new_entries_are_listed(self, tmp_path):
+        (tmp_path / "a.txt").write_text("a")
+        assert _list(path=str(tmp_path)) == ["📄 a.txt"]
+
+        (tmp_path / "b.txt").write_text("b")
+        assert _list(path=str(tmp_path)) == ["📄 a.txt", "📄 b.txt"]
+
+
+def _edit(path, **kwargs) -> str:
+    return asyncio.run(
+        FileWriteTool().execute(operation="edit", path=str(path), **kwargs)
+    )
+
+
+class TestStreamingEdits:
+    """Single-pass, atomic edits through a temp file."""
+
+    def test_matches_spanning_chunks_are_replaced(
+        self, tmp_path, monkeypatch
+    ):
+        monkeypatch.setattr(file_tools, "_EDIT_CHUNK", 7)
+        path = tmp_path / "gen.py"
+        path.write_text("alpha = old_name(1)\r\nbeta = old_name(2)\r\n")
+        path.chmod(0o640)
+
+        result = _edit(path, old_text="old_name", new_text="new_name")
+
+        assert result == (
+            f"Warning: Found 2 occurrences. All were replaced in {path}"
+        )
+        assert path.read_bytes() == (
+            b"alpha = new_name(1)\r\nbeta = new_name(2)\r\n"
+        )
+        assert path.stat().st_mode & 0o777 == 0o640
+        assert [p.name for p in tmp_path.iterdir()] == ["gen.py"]
+
+    def test_batched_edits_apply_in_one_pass(self, tmp_path):
+        path = tmp_path / "gen.py"
+        path.write_text("a b ab a")
+
+        result = _edit(
+            path,
+            edits=[
+                {"old_text": "a", "new_text": "b"},
+                {"old_text": "b", "new_text": "a"},
+                {"old_text": "ab", "new_text": "X"},
+            ],
+        )
+
+        assert result.endswith("(4 replacements; matches per edit: 2, 1, 1)")
+        assert path.read_text() == "b a X b"
+
+    def test_missing_text_leaves_the_file_unchanged(self, tmp_path):
+        path = tmp_path / "gen.py"
+        path.write_text("keep me")
+
+        result = _edit(
+            path,
+            edits=[
+                {"old_text": "keep", "new_text": "drop"},
+                {"old_text": "absent", "new_text": ""},
+            ],
+        )
+
+        assert result.startswith(
+            "Error: The text of edit(s) 2 was not found"
+        )
+        assert path.read_text() == "keep me"
+        assert [p.name for p in tmp_path.iterdir()] == ["gen.py"]
+
+    def test_writes_go_through_symlinks(self, tmp_path):
+        target = tmp_path / "config.toml"
+        target.write_text("old")
+        link = tmp_path / "link.toml"
+        link.symlink_to(target)
+
+        asyncio.run(
+            FileWriteTool().execute(
+                operation="write", path=str(link), content="new"
+            )
+        )
+
+        assert link.is_symlink()
+        assert target.read_text() == "new"
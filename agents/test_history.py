@@ -0,0 +1,353 @@
+"""Offline tests for MessageHistory token tracking and truncation."""
+
+import asyncio
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import httpx
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from anthropic import Anthropic, AsyncAnthropic
+
+from agents.test_agent import _message
+from agents.utils.compaction_util import (
+    SUMMARY_PREFIX,
+    SUMMARY_PROMPT,
+    Compactor,
+    ModelSummarizer,
+)
+from agents.utils.history_util import TRUNCATION_NOTICE, MessageHistory
+from agents.utils.token_util import APITokenCounter, TokenEstimator
+
+
+class OfflineClient:
+    """Client stub whose count_tokens call always fails."""
+
+    class messages:
+        calls = 0
+
+        @classmethod
+        def count_tokens(cls, **kwargs):
+            cls.calls += 1
+            raise ConnectionError("offline")
+
+
+def _usage(input_tokens: int, output_tokens: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        cache_read_input_tokens=None,
+        cache_creation_input_tokens=0,
+    )
+
+
+def _history(context_window_tokens: int = 1000) -> MessageHistory:
+    return MessageHistory(
+        model="claude-sonnet-4-20250514",
+        system="",
+        context_window_tokens=context_window_tokens,
+        client=OfflineClient(),
+    )
+
+
+async def _add_turns(history: MessageHistory, turns: int, size: int) -> None:
+    """Add user/assistant turns that each cost `size` input and output."""
+    for _ in range(turns):
+        await history.add_message("user", "question")
+        await history.add_message(
+            "assistant",
+            [{"type": "text", "text": "answer"}],
+            _usage(history.total_tokens + size, size),
+        )
+
+
+class TestMessageHistory:
+    """Token accounting and eviction."""
+
+    def test_tokens_are_attributed_per_message(self):
+        history = _history()
+        asyncio.run(_add_turns(history, 3, 10))
+
+        assert history.total_tokens == 60
+        assert history.message_tokens == [(10, 10)] * 3
+        assert [r.tokens for r in history.records] == [10, 10] * 3
+
+    def test_truncate_evicts_oldest_pairs_and_keeps_totals(self):
+        history = _history(context_window_tokens=100)
+        asyncio.run(_add_turns(history, 10, 10))
+        assert history.total_tokens == 200
+
+        history.truncate()
+
+        assert history.total_tokens <= 100
+        assert history.total_tokens == sum(r.tokens for r in history.records)
+        assert history.messages[0]["content"][0]["text"] == TRUNCATION_NOTICE
+        assert history.records[0].input_tokens == 25
+        assert len(history.message_tokens) == len(history.records) // 2
+
+    def test_truncate_keeps_pending_user_message(self):
+        history = _history(context_window_tokens=10)
+
+        async def build():
+            await _add_turns(history, 1, 50)
+            await history.add_message("user", "pending")
+
+        asyncio.run(build())
+        history.truncate()
+
+        assert history.messages == [
+            {"role": "user", "content": [{"type": "text", "text": "pending"}]}
+        ]
+        assert history.total_tokens == 0
+
+
+def _breakpoint_indexes(messages: list[dict]) -> list[int]:
+    return [
+        i
+        for i, message in enumerate(messages)
+        for block in message["content"]
+        if "cache_control" in block
+    ]
+
+
+class TestCacheBreakpoints:
+    """Prompt-cache breakpoint placement."""
+
+    def test_anchor_follows_previous_tail(self):
+        history = _history()
+
+        async def build():
+            await _add_turns(history, 2, 10)
+            await history.add_message(
+                "user",
+                [
+                    {"type": "tool_result", "tool_use_id": str(i), "content": "x"}
+                    for i in range(6)
+                ],
+            )
+
+        asyncio.run(build())
+        messages = history.format_for_api()
+
+        # Anchor on the previous request's tail, one block on the new tail
+        assert _breakpoint_indexes(messages) == [2, 4]
+        assert "cache_control" in messages[4]["content"][-1]
+        assert history.format_json().count(b"cache_control") == 2
+        assert history.cache_planner.usage[-1].read_tokens == 0
+
+    def test_truncate_drops_anchor(self):
+        history = _history(context_window_tokens=100)
+
+        async def build():
+            await _add_turns(history, 10, 10)
+            await history.add_message("user", "next")
+
+        asyncio.run(build())
+        assert history.cache_planner.anchor is not None
+        history.truncate()
+
+        assert history.cache_planner.anchor is None
+        messages = history.format_for_api()
+        assert _breakpoint_indexes(messages) == [len(messages) - 1]
+
+    def test_system_and_tools_breakpoints(self):
+        history = _history()
+        history.system = "You are a test."
+        assert history.format_system()[0]["cache_control"] == {
+            "type": "ephemeral"
+        }
+        tools = history.cache_planner.tools([{"name": "a"}, {"name": "b"}])
+        assert "cache_control" not in tools[0]
+        assert "cache_control" in tools[1]
+
+
+class TestTokenEstimator:
+    """Local token estimation and calibration."""
+
+    def test_history_sizes_system_prompt_locally(self):
+        OfflineClient.messages.calls = 0
+        history = MessageHistory(
+            model="claude-sonnet-4-20250514",
+            system="x" * 400,
+            context_window_tokens=1000,
+            client=OfflineClient(),
+            token_estimator=TokenEstimator(),
+        )
+
+        assert history.total_tokens == 100
+        assert OfflineClient.messages.calls == 0
+
+    def test_observed_usage_calibrates_ratio(self):
+        estimator = TokenEstimator(chars_per_token=4.0, smoothing=0.5)
+        estimator.observe("model-a", chars=300, tokens=100)
+
+        assert estimator.chars_per_token("model-a") == 3.5
+        assert estimator.chars_per_token("model-b") == 4.0
+        assert estimator.estimate("model-a", "x" * 35) == 10
+
+    def test_calibration_counts_characters_not_bytes(self):
+        estimator = TokenEstimator(smoothing=1.0)
+        history = MessageHistory(
+            model="model-a",
+            system="",
+            context_window_tokens=100000,
+            client=OfflineClient(),
+            token_estimator=estimator,
+        )
+
+        async def run():
+            await _add_turns(history, 1, 10)
+            # Two bytes per character in UTF-8
+            await history.add_message("user", "é" * 600)
+            await history.add_message(
+                "assistant",
+                [{"type": "text", "text": "answer"}],
+                _usage(history.total_tokens + 200, 10),
+            )
+
+        asyncio.run(run())
+
+        chars = len(history.records[-2].json().decode())
+        assert chars < len(history.records[-2].json())
+        assert estimator.chars_per_token("model-a") == chars / 200
+
+    def test_cached_system_estimates_follow_calibration(self):
+        estimator = TokenEstimator(chars_per_token=4.0, smoothing=1.0)
+
+        assert estimator.count_system("model-a", "x" * 400) == 100
+        estimator.observe("model-a", chars=200, tokens=100)
+        assert estimator.count_system("model-a", "x" * 400) == 200
+
+    def test_system_counts_are_cached_by_model_and_prompt(self):
+        OfflineClient.messages.calls = 0
+        counter = APITokenCounter(OfflineClient(), cache_size=2)
+
+        counter.count_system("model-a", "prompt")
+        counter.count_system("model-a", "prompt")
+        assert OfflineClient.messages.calls == 1
+
+        counter.count_system("model-b", "prompt")
+        counter.count_system("model-a", "other")
+        counter.count_system("model-a", "prompt")
+        assert OfflineClient.messages.calls == 4
+
+
+class TestCompaction:
+    """Summarizing compaction in place of truncation."""
+
+    def test_background_summary_replaces_oldest_span(self):
+        history = _history(context_window_tokens=200)
+        history.compactor = Compactor(high_water=0.5, target=0.3)
+
+        async def run():
+            await _add_turns(history, 6, 10)
+            await history.add_message("user", "pending")
+            assert history.total_tokens == 120
+
+            # Over the high-water mark: summarizing starts, nothing waits
+            await history.compact()
+            assert history.compactor.in_progress(history)
+            assert len(history.records) == 13
+
+            await asyncio.sleep(0)
+            await history.compact()
+
+        asyncio.run(run())
+
+        first = history.messages[0]["content"][0]["text"]
+        assert first.startswith(SUMMARY_PREFIX)
+        assert "user: question" in first
+        assert history.records[1].role == "assistant"
+        assert history.messages[-1]["content"][0]["text"] == "pending"
+        assert history.total_tokens == sum(r.tokens for r in history.records)
+        assert history.total_tokens < 120
+
+    def test_spans_are_not_summarized_twice(self):
+        calls = []
+
+        class CountingSummarizer:
+            async def summarize(self, transcript: str) -> str:
+                calls.append(transcript)
+                return "summary"
+
+        async def run():
+            for _ in range(2):
+                history = _history(context_window_tokens=200)
+                history.compactor = compactor
+                await _add_turns(history, 6, 10)
+                await history.add_message("user", "pending")
+                await history.compact()
+                await history.compactor.finish(history, wait=True)
+
+        compactor = Compactor(CountingSummarizer(), high_water=0.5, target=0.3)
+        asyncio.run(run())
+
+        assert len(calls) == 1
+
+    def test_histories_sharing_a_compactor_get_their_own_summary(self):
+        compactor = Compactor(high_water=0.5, target=0.3)
+        histories = [_history(context_window_tokens=200) for _ in range(2)]
+
+        async def run():
+            for i, history in enumerate(histories):
+                history.compactor = compactor
+                await _add_turns(history, 6, 10)
+                await history.add_message("user", f"pending {i}")
+            # Both summaries are in progress at once
+            for history in histories:
+                await history.compact()
+            await asyncio.sleep(0)
+            for history in histories:
+                await history.compact()
+
+        asyncio.run(run())
+
+        for history in histories:
+            first = history.messages[0]["content"][0]["text"]
+            assert first.startswith(SUMMARY_PREFIX)
+            assert history.total_tokens < 120
+
+    def test_model_summarizer_with_sync_and_async_clients(self):
+        requests = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append(json.loads(request.content))
+            return httpx.Response(
+                200, json=_message([{"type": "text", "text": "short"}])
+            )
+
+        transport = httpx.MockTransport(handler)
+        clients = [
+            AsyncAnthropic(
+                api_key="test",
+                http_client=httpx.AsyncClient(transport=transport),
+            ),
+            Anthropic(
+                api_key="test", http_client=httpx.Client(transport=transport)
+            ),
+        ]
+
+        async def create(**kwargs):
+            requests.append(kwargs)
+            return SimpleNamespace(
+                content=[SimpleNamespace(type="text", text="short")]
+            )
+
+        # Duck-typed clients need only messages.create
+        clients.append(
+            SimpleNamespace(messages=SimpleNamespace(create=create))
+        )
+        for client in clients:
+            summarizer = ModelSummarizer(client, model="m", max_tokens=50)
+            summary = asyncio.run(summarizer.summarize("user: hello"))
+
+            assert summary == "short"
+            assert requests[-1]["model"] == "m"
+            assert requests[-1]["system"] == SUMMARY_PROMPT
+            assert requests[-1]["messages"] == [
+                {"role": "user", "content": "user: hello"}
+            ]
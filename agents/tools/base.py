@@ -1,5 +1,6 @@
 """Base tool definitions for the agent framework."""
 
+import json
 from dataclasses import dataclass
 from typing import Any
 
@@ -11,6 +12,12 @@ class Tool:
     name: str
     description: str
     input_schema: dict[str, Any]
+    # Scheduling limits honoured by execute_tools()
+    max_concurrency: int | None = None
+    timeout: float | None = None
+    parallel_safe: bool = True
+    # Results may be memoized by a ToolResultCache
+    cacheable: bool = False
 
     def to_dict(self) -> dict[str, Any]:
         """Convert tool to Claude API format."""
@@ -20,8 +27,36 @@ class Tool:
             "input_schema": self.input_schema,
         }
 
-    async def execute(self, **kwargs) -> str:
-        """Execute the tool with provided parameters."""
+    def shared_resource(self) -> tuple[Any, int | None]:
+        """Resource this tool shares with others, and its concurrency limit.
+
+        Calls to tools sharing a resource queue for it in FIFO order.
+        """
+        return None, None
+
+    def cache_key(self, **kwargs) -> str | None:
+        """Key identifying a call's result, or None if it is not cached."""
+        if not self.cacheable:
+            return None
+        arguments = json.dumps(
+            kwargs, sort_keys=True, separators=(",", ":"), default=str
+        )
+        return f"{self.name}:{arguments}"
+
+    def cache_version(self, **kwargs) -> Any:
+        """Value that changes whenever a cached result of a call goes stale.
+
+        Compared on every cache lookup, so it should be cheap to compute.
+        """
+        return None
+
+    async def execute(self, **kwargs) -> str | list[dict[str, Any]]:
+        """Execute the tool with provided parameters.
+
+        Returns text, or a list of content blocks. Binary data in blocks
+        (e.g. an image source's "data") may be given as bytes; it is
+        base64-encoded once, when the message is first sent.
+        """
         raise NotImplementedError(
             "Tool subclasses must implement execute method"
         )
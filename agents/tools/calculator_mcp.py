@@ -2,11 +2,14 @@
 
 """Simple calculator tool for basic math operations."""
 
+import json
 import math
 
 from mcp.server import FastMCP
 
-mcp = FastMCP("Calculator")
+# FastMCP configures the root logger, which is the agent's own when the
+# server is mounted in-process; per-request INFO logs would flood it
+mcp = FastMCP("Calculator", log_level="WARNING")
 
 
 @mcp.tool(name="calculator")
@@ -51,5 +54,102 @@ def calculator(number1: float, number2: float, operator: str) -> str:
         return f"Error: {str(e)}"
 
 
+# Vectorized forms of the calculator's operators
+_VECTOR_OPERATORS = {
+    "+": lambda np, a, b: a + b,
+    "-": lambda np, a, b: a - b,
+    "*": lambda np, a, b: a * b,
+    "/": lambda np, a, b: a / b,
+    "^": lambda np, a, b: np.power(a, b),
+    "sqrt": lambda np, a, b: np.sqrt(a),
+}
+_AGGREGATES = ("sum", "mean", "min", "max", "prod")
+
+
+@mcp.tool(name="calculator_batch")
+def calculator_batch(
+    numbers1: list[float],
+    operators: str | list[str],
+    numbers2: list[float] | None = None,
+    aggregate: str | None = None,
+) -> str:
+    """Performs many calculations at once, element by element.
+
+    Use this instead of repeated calculator calls, e.g. to add two
+    columns of numbers, or to total a column with aggregate="sum".
+
+    Args:
+        numbers1: First number of each calculation
+        operators: Operation symbol (+, -, *, /, ^, sqrt) for every
+               calculation, or a list with one symbol per calculation
+        numbers2: Second number of each calculation; if omitted, zeros
+               (e.g. for sqrt, or "+" to aggregate numbers1 alone)
+        aggregate: Optionally combine the results: sum, mean, min, max
+               or prod
+
+    Returns:
+        JSON list of results; a calculation that fails is replaced by
+        its error message (e.g. "Error: Division by zero"). With
+        aggregate, the combined result, or an error naming the
+        calculations that failed.
+    """
+    # Imported here so servers that never batch do not pay for it
+    import numpy as np
+
+    count = len(numbers1)
+    if numbers2 is None:
+        numbers2 = [0.0] * count
+    if len(numbers2) != count:
+        return "Error: numbers1 and numbers2 must have the same length"
+    if not isinstance(operators, str) and len(operators) != count:
+        return "Error: operators must be a symbol or one per calculation"
+    if aggregate is not None and aggregate not in _AGGREGATES:
+        return f"Error: Unsupported aggregate '{aggregate}'"
+
+    a = np.asarray(numbers1, dtype=float)
+    b = np.asarray(numbers2, dtype=float)
+    ops = np.broadcast_to(np.asarray(operators, dtype=object), (count,))
+    results = np.full(count, np.nan)
+    errors = np.full(count, None, dtype=object)
+
+    with np.errstate(all="ignore"):
+        for symbol, operation in _VECTOR_OPERATORS.items():
+            mask = ops == symbol
+            if mask.any():
+                results[mask] = operation(np, a[mask], b[mask])
+    errors[(ops == "/") & (b == 0)] = "Error: Division by zero"
+    errors[(ops == "sqrt") & (a < 0)] = (
+        "Error: Cannot take square root of negative number"
+    )
+    unknown = ~np.isin(ops, list(_VECTOR_OPERATORS))
+    for index in np.flatnonzero(unknown):
+        errors[index] = f"Error: Unsupported operator '{ops[index]}'"
+    invalid = np.equal(errors, None) & ~np.isfinite(results)
+    errors[invalid] = "Error: Result is not a finite real number"
+
+    failed = np.flatnonzero(np.not_equal(errors, None))
+    if aggregate is not None:
+        if failed.size:
+            indexes = ", ".join(str(i) for i in failed[:10])
+            return f"Error: Calculation(s) {indexes} failed"
+        if not count and aggregate not in ("sum", "prod"):
+            # Only sum and prod have a value for no numbers (0 and 1)
+            return f"Error: Cannot take the {aggregate} of no numbers"
+        with np.errstate(all="ignore"):
+            value = float(getattr(np, aggregate)(results))
+        if not math.isfinite(value):
+            return "Error: Result is not a finite real number"
+        return f"Result: {_format(value)}"
+
+    values = [_format(value) for value in results.tolist()]
+    for index in failed:
+        values[index] = errors[index]
+    return json.dumps(values)
+
+
+def _format(value: float) -> int | float:
+    return int(value) if value.is_integer() else value
+
+
 if __name__ == "__main__":
     mcp.run()
@@ -1,12 +1,378 @@
 """File operation tools for reading and writing files."""
 
 import asyncio
-import glob
+import base64
+import bisect
+import functools
+import itertools
+import mmap
 import os
+import re
+import secrets
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from collections.abc import Callable
+from fnmatch import fnmatchcase
 from pathlib import Path
+from typing import Any, TextIO
 
 from .base import Tool
 
+# Line index granularity: finding a line scans at most one block
+_INDEX_BLOCK = 64 * 1024
+_INDEX_CACHE_SIZE = 32
+
+
+class _LineIndex:
+    """Sparse line index of a file: newline counts at every block start.
+
+    Takes 8 bytes per 64 KiB of file, so multi-GB files are indexed in a
+    few hundred KiB without reading them into memory.
+    """
+
+    def __init__(self, data: mmap.mmap, version: tuple[int, int]):
+        self.version = version
+        self.size = len(data)
+        self.newlines = array("q")
+        count = 0
+        for start in range(0, self.size, 16 * _INDEX_BLOCK):
+            chunk = data[start : start + 16 * _INDEX_BLOCK]
+            for offset in range(0, len(chunk), _INDEX_BLOCK):
+                self.newlines.append(count)
+                count += chunk.count(b"\n", offset, offset + _INDEX_BLOCK)
+        ends_open = self.size and data[self.size - 1 : self.size] != b"\n"
+        self.lines = count + 1 if ends_open else count
+
+    def line_start(self, data: mmap.mmap, line: int) -> int:
+        """Byte offset at which a 0-based line starts."""
+        if line <= 0:
+            return 0
+        if line >= self.lines:
+            return self.size
+        # The block holding the line-th newline, then scan within it
+        block = bisect.bisect_left(self.newlines, line) - 1
+        position = block * _INDEX_BLOCK
+        for _ in range(line - self.newlines[block]):
+            position = data.find(b"\n", position) + 1
+        return position
+
+
+_line_indexes: OrderedDict[str, _LineIndex] = OrderedDict()
+_line_indexes_lock = threading.Lock()
+
+
+def _line_index(path: str, data: mmap.mmap, stat: os.stat_result):
+    """Line index for a file, rebuilt when its mtime or size changes."""
+    key = os.path.abspath(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _line_indexes_lock:
+        index = _line_indexes.get(key)
+        if index is not None and index.version == version:
+            _line_indexes.move_to_end(key)
+            return index
+    index = _LineIndex(data, version)
+    with _line_indexes_lock:
+        _line_indexes[key] = index
+        _line_indexes.move_to_end(key)
+        while len(_line_indexes) > _INDEX_CACHE_SIZE:
+            _line_indexes.popitem(last=False)
+    return index
+
+
+_DIR_CACHE_SIZE = 4096
+# Directory mtimes have coarse resolution, so a listing taken within this
+# window of a change could miss a later change in the same tick
+_RACY_WINDOW_NS = 2_000_000_000
+
+_dir_listings: OrderedDict[str, tuple[int, list[tuple[str, bool, bool]]]] = (
+    OrderedDict()
+)
+_dir_listings_lock = threading.Lock()
+
+
+def _scan_directory(path: str) -> list[tuple[str, bool, bool]]:
+    """Sorted (name, is_dir, is_symlink) entries of a directory.
+
+    Listings are cached until the directory's mtime changes, which
+    happens whenever an entry is added, removed or renamed.
+    """
+    mtime = os.stat(path).st_mtime_ns
+    with _dir_listings_lock:
+        cached = _dir_listings.get(path)
+        if cached is not None and cached[0] == mtime:
+            _dir_listings.move_to_end(path)
+            return cached[1]
+
+    entries = []
+    with os.scandir(path) as scan:
+        for entry in scan:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            entries.append((entry.name, is_dir, entry.is_symlink()))
+    entries.sort()
+
+    if time.time_ns() - mtime > _RACY_WINDOW_NS:
+        with _dir_listings_lock:
+            _dir_listings[path] = (mtime, entries)
+            _dir_listings.move_to_end(path)
+            while len(_dir_listings) > _DIR_CACHE_SIZE:
+                _dir_listings.popitem(last=False)
+    return entries
+
+
+def _glob_regex(pattern: str) -> str:
+    """Translate a .gitignore glob into a regular expression."""
+    parts = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2 :]:
+            end = pattern.index("]", i + 2)
+            parts.append("[" + pattern[i + 1 : end].replace("!", "^", 1) + "]")
+            i = end + 1
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(parts) + r"\Z"
+
+
+@functools.lru_cache(maxsize=256)
+def _load_ignore_rules(path: str, mtime_ns: int, size: int) -> tuple:
+    """Parse a .gitignore file; the version arguments key the cache.
+
+    Returns (regex, negate, dir_only, anchored) rules in file order.
+    """
+    rules = []
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.rstrip("\n").rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            line = line[1:] if negate else line
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            # Patterns containing a slash are relative to the .gitignore
+            anchored = "/" in line
+            line = line.lstrip("/")
+            if line:
+                regex = re.compile(_glob_regex(line))
+                rules.append((regex, negate, dir_only, anchored))
+    return tuple(rules)
+
+
+def _ignore_rules(directory: str) -> list[tuple[str, tuple]]:
+    """(directory, rules) for the .gitignore in a directory, if any."""
+    path = os.path.join(directory, ".gitignore")
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return []
+    rules = _load_ignore_rules(path, stat.st_mtime_ns, stat.st_size)
+    return [(directory, rules)]
+
+
+def _stat_version(path: str) -> tuple[int, int] | None:
+    """(mtime, size) of a path, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _repository_ancestors(root: str) -> list[str]:
+    """Directories above root, up to its repository top, nearest first."""
+    ancestors = []
+    current = root
+    while not os.path.exists(os.path.join(current, ".git")):
+        parent = os.path.dirname(current)
+        if parent == current:
+            # Not inside a repository
+            return []
+        ancestors.append(parent)
+        current = parent
+    return ancestors
+
+
+def _ancestor_ignore_rules(root: str) -> list[tuple[str, tuple]]:
+    """Rules of .gitignore files above root, up to its repository top."""
+    rules = []
+    for directory in reversed(_repository_ancestors(root)):
+        rules += _ignore_rules(directory)
+    return rules
+
+
+def _is_ignored(
+    rules: list[tuple[str, tuple]], path: str, is_dir: bool
+) -> bool:
+    """Whether .gitignore rules exclude a path; the last match wins."""
+    ignored = False
+    for directory, file_rules in rules:
+        relative = path[len(directory) + 1 :]
+        name = relative.rsplit("/", 1)[-1]
+        for regex, negate, dir_only, anchored in file_rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(relative if anchored else name):
+                ignored = not negate
+    return ignored
+
+
+def _walk_directory(
+    root: str,
+    pattern: str,
+    max_depth: int,
+    respect_gitignore: bool,
+    after: tuple[str, ...] = (),
+):
+    """Yield (relative path, is_dir) of matching entries under root.
+
+    Entries come depth first with siblings in name order, which is the
+    order of their path components, so a walk can resume after any path
+    by skipping whole subtrees that sort before it. Hidden entries are
+    skipped unless the pattern starts with a dot, as glob does.
+
+    A pattern containing a slash is matched the way glob matches it:
+    component by component, so "*" never crosses a "/", and only at the
+    depth of its last component, whatever max_depth is.
+    """
+    segments = [s for s in pattern.split("/") if s] if "/" in pattern else []
+
+    def visit(directory: str, parents: tuple[str, ...], depth: int, rules):
+        entries = _scan_directory(directory)
+        if respect_gitignore and (".gitignore", False, False) in entries:
+            rules = rules + _ignore_rules(directory)
+        if segments:
+            name_pattern = segments[depth - 1]
+            last = depth == len(segments)
+        else:
+            name_pattern, last = pattern, True
+        show_hidden = name_pattern.startswith(".")
+        for name, is_dir, is_symlink in entries:
+            if (name.startswith(".") and not show_hidden) or name == ".git":
+                continue
+            matched = fnmatchcase(name, name_pattern)
+            if segments and not matched:
+                # No path below an unmatched component can match
+                continue
+            parts = parents + (name,)
+            if parts < after and after[: len(parts)] != parts:
+                continue
+            path = os.path.join(directory, name)
+            if rules and _is_ignored(rules, path, is_dir):
+                continue
+            if last and matched and parts > after:
+                yield "/".join(parts), is_dir
+            if segments:
+                # The depth is bounded, so directory links are followed
+                descend = is_dir and not last
+            else:
+                descend = (
+                    is_dir
+                    and not is_symlink
+                    and (max_depth <= 0 or depth < max_depth)
+                )
+            if descend:
+                yield from visit(path, parts, depth + 1, rules)
+
+    rules = _ancestor_ignore_rules(root) if respect_gitignore else []
+    yield from visit(root, (), 1, rules)
+
+
+def _encode_page_token(relative: str) -> str:
+    return base64.urlsafe_b64encode(relative.encode()).decode()
+
+
+def _decode_page_token(token: str) -> tuple[str, ...]:
+    return tuple(base64.urlsafe_b64decode(token.encode()).decode().split("/"))
+
+
+_EDIT_CHUNK = 1024 * 1024
+
+
+def _rewrite(path: Path, write: Callable[[TextIO], bool]) -> bool:
+    """Replace a file atomically with the content write() produces.
+
+    The content goes to a temp file beside the target, which is then
+    moved over it with os.replace(), so readers see the old file or the
+    new one, never a partial write. Nothing is replaced if write()
+    returns False or raises. An existing file keeps its permissions.
+    """
+    temp = path.with_name(f".{path.name}.{secrets.token_hex(4)}.tmp")
+    try:
+        with open(temp, "x", encoding="utf-8", newline="") as f:
+            if not write(f):
+                return False
+        try:
+            os.chmod(temp, os.stat(path).st_mode & 0o7777)
+        except FileNotFoundError:
+            pass
+        os.replace(temp, path)
+        return True
+    finally:
+        temp.unlink(missing_ok=True)
+
+
+def _replace_streaming(
+    source: TextIO, target: TextIO, edits: list[tuple[str, str]]
+) -> list[int]:
+    """Copy source to target, applying every (old, new) edit in one pass.
+
+    Edits apply to the original text, not to each other's output. Where
+    several match at one position the longest wins. Only one chunk plus
+    an overlap the length of the longest old text is held in memory, so
+    a match spanning two chunks is still found.
+
+    Returns:
+        The number of matches of each edit
+    """
+    replacements = dict(edits)
+    indexes = {old: i for i, (old, _) in enumerate(edits)}
+    pattern = re.compile(
+        "|".join(
+            re.escape(old)
+            for old in sorted(replacements, key=len, reverse=True)
+        )
+    )
+    overlap = max(len(old) for old in replacements) - 1
+    counts = [0] * len(edits)
+    buffer = ""
+    while True:
+        chunk = source.read(_EDIT_CHUNK)
+        buffer += chunk
+        # A match starting past safe_end could continue into the next chunk
+        safe_end = len(buffer) - overlap if chunk else len(buffer)
+        position = 0
+        for match in pattern.finditer(buffer):
+            if match.start() >= safe_end:
+                break
+            old = match.group()
+            target.write(buffer[position : match.start()])
+            target.write(replacements[old])
+            counts[indexes[old]] += 1
+            position = match.end()
+        keep = max(position, safe_end)
+        target.write(buffer[position:keep])
+        buffer = buffer[keep:]
+        if not chunk:
+            return counts
+
 
 class FileReadTool(Tool):
     """Tool for reading files and listing directories."""
@@ -18,15 +384,20 @@ class FileReadTool(Tool):
             Read files or list directory contents.
 
             Operations:
-            - read: Read the contents of a file
-            - list: List files in a directory
+            - read: Read the contents of a file, optionally a range of
+              lines (offset/limit) or bytes (byte_offset/byte_length)
+            - tail: Read the last lines of a file (limit, default 10)
+            - list: List files in a directory, optionally recursively
+              (max_depth). Long listings are split into pages; pass the
+              returned page_token to get the next one. Files excluded by
+              .gitignore are skipped.
             """,
             input_schema={
                 "type": "object",
                 "properties": {
                     "operation": {
                         "type": "string",
-                        "enum": ["read", "list"],
+                        "enum": ["read", "tail", "list"],
                         "description": "File operation to perform",
                     },
                     "path": {
@@ -37,13 +408,70 @@ class FileReadTool(Tool):
                         "type": "integer",
                         "description": "Maximum lines to read (0 means no limit)",
                     },
+                    "offset": {
+                        "type": "integer",
+                        "description": "First line to read, counting from 0",
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Number of lines to read or tail",
+                    },
+                    "byte_offset": {
+                        "type": "integer",
+                        "description": "First byte to read",
+                    },
+                    "byte_length": {
+                        "type": "integer",
+                        "description": "Number of bytes to read",
+                    },
                     "pattern": {
                         "type": "string",
                         "description": "File pattern to match",
                     },
+                    "max_depth": {
+                        "type": "integer",
+                        "description": "Directory levels to list (1 lists "
+                        "only the directory itself, 0 means no limit)",
+                    },
+                    "page_token": {
+                        "type": "string",
+                        "description": "Token from a previous list call to "
+                        "continue after its last entry",
+                    },
                 },
                 "required": ["operation", "path"],
             },
+            cacheable=True,
+        )
+
+    def cache_key(self, **kwargs) -> str | None:
+        # A recursive listing changes without its root's mtime changing,
+        # and so does one with a path pattern, which reaches subdirectories
+        if kwargs.get("operation") == "list":
+            if kwargs.get("max_depth", 1) != 1:
+                return None
+            if "/" in kwargs.get("pattern", "*"):
+                return None
+        # Relative paths are resolved so a cache can be shared across
+        # working directories
+        if "path" in kwargs:
+            kwargs["path"] = os.path.abspath(kwargs["path"])
+        return super().cache_key(**kwargs)
+
+    def cache_version(self, **kwargs) -> Any:
+        """Modification time and size of the file or directory read.
+
+        A listing also depends on the .gitignore files that apply to it,
+        which can be edited without changing a directory's mtime.
+        """
+        path = kwargs.get("path", "")
+        version = _stat_version(path)
+        if version is None or kwargs.get("operation") != "list":
+            return version
+        root = os.path.abspath(path)
+        return version, tuple(
+            _stat_version(os.path.join(directory, ".gitignore"))
+            for directory in [root, *_repository_ancestors(root)]
         )
 
     async def execute(
@@ -51,33 +479,99 @@ class FileReadTool(Tool):
         operation: str,
         path: str,
         max_lines: int = 0,
+        offset: int = 0,
+        limit: int = 0,
+        byte_offset: int | None = None,
+        byte_length: int | None = None,
         pattern: str = "*",
+        max_depth: int = 1,
+        page_token: str | None = None,
     ) -> str:
         """Execute a file read operation.
 
         Args:
-            operation: The operation to perform (read or list)
+            operation: The operation to perform (read, tail or list)
             path: The file or directory path
             max_lines: Maximum lines to read (for read operation, 0 means no limit)
+            offset: First line to read, counting from 0
+            limit: Number of lines to read (same as max_lines) or tail
+            byte_offset: First byte to read; reads a byte range instead of
+                         lines
+            byte_length: Number of bytes to read from byte_offset
             pattern: File pattern to match (for list operation)
+            max_depth: Directory levels to list (0 means no limit)
+            page_token: Continue a listing after a previous page
 
         Returns:
             Result of the operation as string
         """
         if operation == "read":
-            return await self._read_file(path, max_lines)
+            if byte_offset is not None or byte_length is not None:
+                return await self._read_bytes(
+                    path, byte_offset or 0, byte_length
+                )
+            return await self._read_file(path, limit or max_lines, offset)
+        elif operation == "tail":
+            return await self._tail_file(path, limit or max_lines or 10)
         elif operation == "list":
-            return await self._list_files(path, pattern)
+            return await self._list_files(
+                path, pattern, max_depth, page_token
+            )
         else:
             return f"Error: Unsupported operation '{operation}'"
 
-    async def _read_file(self, path: str, max_lines: int = 0) -> str:
+    async def _mapped(self, path: str, read: Any) -> str:
+        """Run read(data, stat) on a memory map of a file in a thread."""
+        try:
+            file_path = Path(path)
+
+            if not file_path.exists():
+                return f"Error: File not found at {path}"
+            if not file_path.is_file():
+                return f"Error: {path} is not a file"
+
+            def read_sync():
+                with open(file_path, "rb") as f:
+                    stat = os.fstat(f.fileno())
+                    if stat.st_size == 0:
+                        # Empty files cannot be mapped
+                        return ""
+                    with mmap.mmap(
+                        f.fileno(), 0, access=mmap.ACCESS_READ
+                    ) as data:
+                        return read(data, stat).decode(
+                            "utf-8", errors="replace"
+                        )
+
+            return await asyncio.to_thread(read_sync)
+        except Exception as e:
+            return f"Error reading {path}: {str(e)}"
+
+    async def _read_file(
+        self, path: str, max_lines: int = 0, offset: int = 0
+    ) -> str:
         """Read a file from disk.
         
         Args:
             path: Path to the file to read
             max_lines: Maximum number of lines to read (0 means read entire file)
+            offset: First line to read; lines are located through a cached
+                    line index, so reads deep into large files are cheap
         """
+        if offset > 0:
+
+            def read_lines(data: mmap.mmap, stat: os.stat_result) -> bytes:
+                index = _line_index(path, data, stat)
+                start = index.line_start(data, offset)
+                end = (
+                    index.line_start(data, offset + max_lines)
+                    if max_lines > 0
+                    else index.size
+                )
+                return data[start:end]
+
+            return await self._mapped(path, read_lines)
+
         try:
             file_path = Path(path)
 
@@ -101,8 +595,54 @@ class FileReadTool(Tool):
         except Exception as e:
             return f"Error reading {path}: {str(e)}"
 
-    async def _list_files(self, directory: str, pattern: str = "*") -> str:
-        """List files in a directory."""
+    async def _read_bytes(
+        self, path: str, byte_offset: int, byte_length: int | None
+    ) -> str:
+        """Read a byte range of a file, decoding it as UTF-8."""
+
+        def read_range(data: mmap.mmap, stat: os.stat_result) -> bytes:
+            end = None if byte_length is None else byte_offset + byte_length
+            return data[byte_offset:end]
+
+        return await self._mapped(path, read_range)
+
+    async def _tail_file(self, path: str, lines: int) -> str:
+        """Read the last lines of a file without reading the rest of it."""
+
+        def read_tail(data: mmap.mmap, stat: os.stat_result) -> bytes:
+            end = len(data)
+            # A trailing newline ends the last line rather than starting one
+            position = end - 1 if data[end - 1 : end] == b"\n" else end
+            start = 0
+            for _ in range(lines):
+                newline = data.rfind(b"\n", 0, position)
+                if newline < 0:
+                    start = 0
+                    break
+                start, position = newline + 1, newline
+            return data[start:end]
+
+        return await self._mapped(path, read_tail)
+
+    async def _list_files(
+        self,
+        directory: str,
+        pattern: str = "*",
+        max_depth: int = 1,
+        page_token: str | None = None,
+        page_size: int = 500,
+    ) -> str:
+        """List files in a directory.
+
+        Args:
+            directory: Directory to list
+            pattern: Pattern matched against entry names, or against paths
+                     relative to directory if it contains a slash
+            max_depth: Directory levels to list (0 means no limit); a
+                       pattern with a slash sets its own depth
+            page_token: Token returned with a previous page
+            page_size: Maximum entries to return per page
+        """
         try:
             dir_path = Path(directory)
 
@@ -112,22 +652,37 @@ class FileReadTool(Tool):
                 return f"Error: {directory} is not a directory"
 
             def list_sync():
-                search_pattern = f"{directory}/{pattern}"
-                files = glob.glob(search_pattern)
+                after = _decode_page_token(page_token) if page_token else ()
+                entries = list(
+                    itertools.islice(
+                        _walk_directory(
+                            os.path.abspath(directory),
+                            pattern,
+                            max_depth,
+                            respect_gitignore=True,
+                            after=after,
+                        ),
+                        page_size + 1,
+                    )
+                )
 
-                if not files:
+                if not entries:
+                    if page_token:
+                        return "No more files"
                     return f"No files found matching {directory}/{pattern}"
 
                 file_list = []
-                for file_path in sorted(files):
-                    path_obj = Path(file_path)
-                    rel_path = str(file_path).replace(str(dir_path) + "/", "")
-
-                    if path_obj.is_dir():
+                for rel_path, is_dir in entries[:page_size]:
+                    if is_dir:
                         file_list.append(f"📁 {rel_path}/")
                     else:
                         file_list.append(f"📄 {rel_path}")
 
+                if len(entries) > page_size:
+                    token = _encode_page_token(entries[page_size - 1][0])
+                    file_list.append(
+                        f"... more files; continue with page_token={token}"
+                    )
                 return "\n".join(file_list)
 
             return await asyncio.to_thread(list_sync)
@@ -146,7 +701,10 @@ class FileWriteTool(Tool):
 
             Operations:
             - write: Create or completely replace a file
-            - edit: Make targeted changes to parts of a file
+            - edit: Make targeted changes to parts of a file. Replaces
+              every occurrence of old_text, or applies a batch of edits
+              in one pass; the file is left unchanged if any old_text is
+              not found.
             """,
             input_schema={
                 "type": "object",
@@ -172,9 +730,25 @@ class FileWriteTool(Tool):
                         "type": "string",
                         "description": "Replacement text (for edit operation)",
                     },
+                    "edits": {
+                        "type": "array",
+                        "description": "Several edits to apply in one pass, "
+                        "instead of old_text and new_text",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "old_text": {"type": "string"},
+                                "new_text": {"type": "string"},
+                            },
+                            "required": ["old_text", "new_text"],
+                        },
+                    },
                 },
                 "required": ["operation", "path"],
             },
+            # Edits read-modify-write files, so two in one turn must not
+            # interleave
+            parallel_safe=False,
         )
 
     async def execute(
@@ -184,6 +758,7 @@ class FileWriteTool(Tool):
         content: str = "",
         old_text: str = "",
         new_text: str = "",
+        edits: list[dict[str, str]] | None = None,
     ) -> str:
         """Execute a file write operation.
 
@@ -193,6 +768,7 @@ class FileWriteTool(Tool):
             content: Content to write (for write operation)
             old_text: Text to replace (for edit operation)
             new_text: Replacement text (for edit operation)
+            edits: old_text/new_text pairs applied together in one pass
 
         Returns:
             Result of the operation as string
@@ -201,25 +777,41 @@ class FileWriteTool(Tool):
             if not content:
                 return "Error: content parameter is required"
             return await self._write_file(path, content)
+        elif operation == "edit" and edits:
+            pairs = [
+                (edit.get("old_text"), edit.get("new_text")) for edit in edits
+            ]
+            if any(not old or new is None for old, new in pairs):
+                return (
+                    "Error: every edit needs a non-empty old_text "
+                    "and a new_text"
+                )
+            if len({old for old, _ in pairs}) < len(pairs):
+                return "Error: edits must have distinct old_text values"
+            return await self._edit_file(path, pairs)
         elif operation == "edit":
             if not old_text or not new_text:
                 return (
                     "Error: both old_text and new_text parameters "
                     "are required for edit operation"
                 )
-            return await self._edit_file(path, old_text, new_text)
+            return await self._edit_file(path, [(old_text, new_text)])
         else:
             return f"Error: Unsupported operation '{operation}'"
 
     async def _write_file(self, path: str, content: str) -> str:
-        """Write content to a file."""
+        """Write content to a file, replacing it atomically."""
         try:
-            file_path = Path(path)
+            # Write the target of a symlink rather than replacing the link
+            file_path = Path(os.path.realpath(path))
             os.makedirs(file_path.parent, exist_ok=True)
 
+            def write(f: TextIO) -> bool:
+                f.write(content)
+                return True
+
             def write_sync():
-                with open(file_path, "w", encoding="utf-8") as f:
-                    f.write(content)
+                _rewrite(file_path, write)
                 return (
                     f"Successfully wrote {len(content)} "
                     f"characters to {path}"
@@ -229,8 +821,18 @@ class FileWriteTool(Tool):
         except Exception as e:
             return f"Error writing to {path}: {str(e)}"
 
-    async def _edit_file(self, path: str, old_text: str, new_text: str) -> str:
-        """Make targeted changes to a file."""
+    async def _edit_file(
+        self, path: str, edits: list[tuple[str, str]]
+    ) -> str:
+        """Make targeted changes to a file.
+
+        The file is streamed through a temp file that atomically replaces
+        it, so files of any size are edited in constant memory.
+
+        Args:
+            path: Path to the file to edit
+            edits: (old_text, new_text) pairs, applied in one pass
+        """
         try:
             file_path = Path(path)
 
@@ -238,40 +840,58 @@ class FileWriteTool(Tool):
                 return f"Error: File not found at {path}"
             if not file_path.is_file():
                 return f"Error: {path} is not a file"
+            # Edit the target of a symlink rather than replacing the link
+            file_path = Path(os.path.realpath(file_path))
 
             def edit_sync():
-                try:
-                    with open(
-                        file_path, encoding="utf-8", errors="replace"
-                    ) as f:
-                        content = f.read()
+                counts: list[int] = []
 
-                    if old_text not in content:
-                        return (
-                            f"Error: The specified text was not "
-                            f"found in {path}"
+                def write(target: TextIO) -> bool:
+                    with open(
+                        file_path, encoding="utf-8", newline=""
+                    ) as source:
+                        counts.extend(
+                            _replace_streaming(source, target, edits)
                         )
+                    return all(counts)
 
-                    # Count occurrences to warn about multiple matches
-                    count = content.count(old_text)
-                    if count > 1:
-                        # Edit with warning about multiple occurrences
-                        new_content = content.replace(old_text, new_text)
-                        with open(file_path, "w", encoding="utf-8") as f:
-                            f.write(new_content)
-                        return (
-                            f"Warning: Found {count} occurrences. "
-                            f"All were replaced in {path}"
-                        )
-                    else:
-                        # One occurrence, straightforward replacement
-                        new_content = content.replace(old_text, new_text)
-                        with open(file_path, "w", encoding="utf-8") as f:
-                            f.write(new_content)
-                        return f"Successfully edited {path}"
+                try:
+                    edited = _rewrite(file_path, write)
                 except UnicodeDecodeError:
                     return f"Error: {path} appears to be a binary file"
 
+                if len(edits) > 1:
+                    if not edited:
+                        missing = [
+                            str(i + 1)
+                            for i, count in enumerate(counts)
+                            if not count
+                        ]
+                        return (
+                            f"Error: The text of edit(s) "
+                            f"{', '.join(missing)} was not found in "
+                            f"{path}; no changes were made"
+                        )
+                    return (
+                        f"Successfully applied {len(edits)} edits to "
+                        f"{path} ({sum(counts)} replacements; matches "
+                        f"per edit: {', '.join(map(str, counts))})"
+                    )
+
+                count = counts[0]
+                if not edited:
+                    return (
+                        f"Error: The specified text was not "
+                        f"found in {path}"
+                    )
+                if count > 1:
+                    # Warn that every occurrence was replaced
+                    return (
+                        f"Warning: Found {count} occurrences. "
+                        f"All were replaced in {path}"
+                    )
+                return f"Successfully edited {path}"
+
             return await asyncio.to_thread(edit_sync)
         except Exception as e:
             return f"Error editing {path}: {str(e)}"
@@ -1,8 +1,64 @@
 """Tools that interface with MCP servers."""
 
-from typing import Any
+import json
+from typing import TYPE_CHECKING, Any
+
 from .base import Tool
-from ..utils.connections import MCPConnection
+
+if TYPE_CHECKING:
+    from ..utils.connections import MCPConnection
+
+# Media the Messages API accepts in tool results
+IMAGE_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp"}
+DOCUMENT_TYPES = {"application/pdf"}
+
+
+def _media_block(data: str, mime_type: str | None) -> dict[str, Any] | None:
+    """Image or document block for base64 data, if the API accepts it."""
+    if mime_type in IMAGE_TYPES:
+        block_type = "image"
+    elif mime_type in DOCUMENT_TYPES:
+        block_type = "document"
+    else:
+        return None
+    return {
+        "type": block_type,
+        "source": {"type": "base64", "media_type": mime_type, "data": data},
+    }
+
+
+def content_block(item: Any) -> dict[str, Any]:
+    """Convert an MCP content item to a Messages API content block.
+
+    Images and PDFs keep the base64 data the server sent, so they are
+    never decoded and re-encoded. Other binary content, which the API
+    cannot take, is described in a text block instead.
+    """
+    item_type = getattr(item, "type", None)
+    if item_type == "text":
+        return {"type": "text", "text": item.text}
+    if item_type in ("image", "audio"):
+        block = _media_block(item.data, item.mimeType)
+        if block:
+            return block
+        return {
+            "type": "text",
+            "text": f"[{item_type} content ({item.mimeType}) not supported]",
+        }
+    if item_type == "resource":
+        resource = item.resource
+        if hasattr(resource, "text"):
+            return {"type": "text", "text": resource.text}
+        block = _media_block(resource.blob, resource.mimeType)
+        if block:
+            return block
+        return {
+            "type": "text",
+            "text": f"[Binary resource {resource.uri} ({resource.mimeType})]",
+        }
+    if item_type == "resource_link":
+        return {"type": "text", "text": f"[Resource {item.uri}]"}
+    return {"type": "text", "text": str(item)}
 
 
 class MCPTool(Tool):
@@ -12,25 +68,56 @@ class MCPTool(Tool):
         description: str,
         input_schema: dict[str, Any],
         connection: "MCPConnection",
+        session_concurrency: int | None = None,
+        timeout: float | None = None,
+        cacheable: bool = False,
+        cache_scope: str = "",
     ):
         super().__init__(
-            name=name, description=description, input_schema=input_schema
+            name=name,
+            description=description,
+            input_schema=input_schema,
+            timeout=timeout,
+            cacheable=cacheable,
         )
         self.connection = connection
+        self.session_concurrency = session_concurrency
+        # Distinguishes same-named tools of different servers
+        self.cache_scope = cache_scope
+
+    def shared_resource(self) -> tuple[Any, int | None]:
+        """All tools of a server share its session's concurrency limit."""
+        return self.connection, self.session_concurrency
 
-    async def execute(self, **kwargs) -> str:
+    def cache_key(self, **kwargs) -> str | None:
+        key = super().cache_key(**kwargs)
+        return key and f"{self.cache_scope}:{key}"
+
+    async def execute(self, **kwargs) -> str | list[dict[str, Any]]:
         """Execute the MCP tool with the given input_schema.
-        Note: Currently only supports text results from MCP tools."""
-        try:
-            result = await self.connection.call_tool(
-                self.name, arguments=kwargs
-            )
 
-            if hasattr(result, "content") and result.content:
-                for item in result.content:
-                    if getattr(item, "type", None) == "text":
-                        return item.text
+        Returns the text of a plain text result, or a list of content
+        blocks when the result has several items, images or documents.
+        Structured content is returned as JSON text when the server sent
+        no content items.
+        """
+        # Failed calls raise, so execute_tools() reports them as errors
+        # and never caches them
+        result = await self.connection.call_tool(self.name, arguments=kwargs)
 
-            return "No text content in tool response"
-        except Exception as e:
-            return f"Error executing {self.name}: {e}"
+        items = getattr(result, "content", None) or []
+        blocks = [content_block(item) for item in items]
+        if getattr(result, "isError", False):
+            # The server caught the tool's exception and sent its message
+            message = "\n".join(
+                block["text"] for block in blocks if block["type"] == "text"
+            )
+            raise RuntimeError(message or "MCP tool call failed")
+        if not blocks:
+            structured = getattr(result, "structuredContent", None)
+            if structured is None:
+                return "No content in tool response"
+            return json.dumps(structured)
+        if len(blocks) == 1 and blocks[0]["type"] == "text":
+            return blocks[0]["text"]
+        return blocks
@@ -1,6 +1,22 @@
 """Agent utility modules."""
 
+from .cassette import Cassette
+from .connections import MCPConnectionPool
 from .history_util import MessageHistory
+from .rate_limit import RateLimiter, default_rate_limiter
+from .result_cache import ToolResultCache
+from .stream_util import stream_events
 from .tool_util import execute_tools
+from .tracing import Tracer
 
-__all__ = ["MessageHistory", "execute_tools"]
+__all__ = [
+    "Cassette",
+    "MCPConnectionPool",
+    "MessageHistory",
+    "RateLimiter",
+    "ToolResultCache",
+    "Tracer",
+    "default_rate_limiter",
+    "execute_tools",
+    "stream_events",
+]
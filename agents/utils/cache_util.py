@@ -0,0 +1,80 @@
+"""Prompt-cache breakpoint planning."""
+
+from dataclasses import dataclass
+from typing import Any
+
+from .payload_util import to_dict
+
+EPHEMERAL = {"type": "ephemeral"}
+
+
+def mark_last_block(content: list[Any]) -> list[dict[str, Any]]:
+    """Copy content blocks with a cache breakpoint on the last one."""
+    blocks = [to_dict(block) for block in content]
+    if blocks:
+        blocks[-1] = {**blocks[-1], "cache_control": EPHEMERAL}
+    return blocks
+
+
+@dataclass
+class CacheUsage:
+    """Prompt-cache tokens reported for one API response."""
+
+    read_tokens: int
+    creation_tokens: int
+
+
+class CacheBreakpointPlanner:
+    """Places the four prompt-cache breakpoints allowed per request.
+
+    Breakpoints go on the last tool definition, the system prompt, an
+    anchor message and the tail message. The anchor is the message that
+    was the tail of the previous request, so its prefix is already cached
+    and is read back exactly however many blocks the current turn added.
+    Truncation changes the prefix, so reset() drops the anchor and the
+    next request re-anchors on its own tail.
+    """
+
+    def __init__(self):
+        self.anchor: Any | None = None
+        self.usage: list[CacheUsage] = []
+
+    def tools(self, tools: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Return tool definitions with a breakpoint on the last one."""
+        if not tools:
+            return tools
+        return [*tools[:-1], {**tools[-1], "cache_control": EPHEMERAL}]
+
+    def system(self, system: str) -> str | list[dict[str, Any]]:
+        """Return the system prompt as a cacheable text block."""
+        if not system:
+            return system
+        return [{"type": "text", "text": system, "cache_control": EPHEMERAL}]
+
+    def message_breakpoints(self, records: Any) -> tuple[Any, ...]:
+        """Return the message records that should carry a breakpoint."""
+        if not records:
+            return ()
+        tail = records[-1]
+        if self.anchor is None or self.anchor is tail:
+            return (tail,)
+        return (self.anchor, tail)
+
+    def advance(self, record: Any) -> None:
+        """Anchor future requests on the tail of a completed request."""
+        self.anchor = record
+
+    def reset(self) -> None:
+        """Forget the anchor after the history prefix has changed."""
+        self.anchor = None
+
+    def record_usage(self, usage: Any) -> CacheUsage:
+        """Record the cache read and creation tokens of a response."""
+        cache_usage = CacheUsage(
+            read_tokens=getattr(usage, "cache_read_input_tokens", 0) or 0,
+            creation_tokens=(
+                getattr(usage, "cache_creation_input_tokens", 0) or 0
+            ),
+        )
+        self.usage.append(cache_usage)
+        return cache_usage
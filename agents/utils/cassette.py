@@ -0,0 +1,261 @@
+"""Record/replay of Messages API calls for deterministic offline runs."""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any
+
+import httpx
+from anthropic import Anthropic, AsyncAnthropic
+
+MODES = ("auto", "record", "replay")
+
+# Request headers that change what the API answers
+_KEY_HEADERS = ("anthropic-beta", "anthropic-version")
+
+Transport = httpx.BaseTransport | httpx.AsyncBaseTransport
+
+
+class Cassette:
+    """Messages API responses stored on disk, keyed by their request.
+
+    A request's key is a hash of its method, path, API version and beta
+    headers and its JSON body with keys sorted, so the same request
+    matches however it was serialized. Responses, streamed or not, are
+    appended to a gzip-compressed JSONL file. Modes:
+
+    - "auto": replay recorded responses, record the rest
+    - "record": always call the API and (re)record its response
+    - "replay": never call the API; unrecorded requests get a 404
+
+    Only successful calls to /v1/messages endpoints are recorded; other
+    requests pass through. Hook a cassette in via Agent(client=...):
+
+        agent = Agent(..., client=Cassette("agent.cassette").client())
+    """
+
+    def __init__(self, path: str | Path, mode: str = "auto"):
+        """Initialize a Cassette.
+
+        Args:
+            path: File holding the recordings, created on first record
+            mode: "auto", "record" or "replay"
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unsupported cassette mode: {mode}")
+        self.path = Path(path)
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _load(self) -> dict[str, dict[str, Any]]:
+        entries = {}
+        if self.path.exists():
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    # Later recordings of a request replace earlier ones
+                    entries[entry["key"]] = entry
+        return entries
+
+    @staticmethod
+    def request_key(request: httpx.Request) -> str:
+        """Canonical hash of a request."""
+        try:
+            body = json.loads(request.content)
+        except ValueError:
+            body = request.content.decode("utf-8", "replace")
+        identity = {
+            "method": request.method,
+            "path": request.url.path,
+            "headers": {
+                name: request.headers.get(name) for name in _KEY_HEADERS
+            },
+            "body": body,
+        }
+        encoded = json.dumps(
+            identity, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+        )
+        return hashlib.sha256(encoded.encode()).hexdigest()
+
+    @staticmethod
+    def handles(request: httpx.Request) -> bool:
+        """Whether a request is recorded and replayed."""
+        return request.method == "POST" and request.url.path.startswith(
+            "/v1/messages"
+        )
+
+    def lookup(self, key: str) -> httpx.Response | None:
+        """The recorded response for a request key, if any."""
+        if self.mode == "record":
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return httpx.Response(
+            entry["status"],
+            headers={"content-type": entry["content_type"]},
+            content=entry["body"].encode(),
+        )
+
+    def missing(self, key: str) -> httpx.Response:
+        """Response to an unrecorded request in replay mode."""
+        return httpx.Response(
+            404,
+            json={
+                "type": "error",
+                "error": {
+                    "type": "not_found_error",
+                    "message": (
+                        f"No recording of request {key[:12]} "
+                        f"in cassette {self.path}"
+                    ),
+                },
+            },
+        )
+
+    def record(self, key: str, response: httpx.Response) -> None:
+        """Store a read response, if it was successful."""
+        if not response.is_success:
+            return
+        entry = {
+            "key": key,
+            "status": response.status_code,
+            "content_type": response.headers.get(
+                "content-type", "application/json"
+            ),
+            "body": response.content.decode("utf-8"),
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._entries[key] = entry
+            os.makedirs(self.path.parent, exist_ok=True)
+            # Each append is a gzip member; readers see one stream
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write(line)
+
+    def transport(
+        self,
+        transport: Transport | None = None,
+    ) -> "CassetteTransport":
+        """An httpx transport serving requests from this cassette."""
+        return CassetteTransport(self, transport)
+
+    def client(
+        self,
+        async_client: bool = True,
+        transport: Transport | None = None,
+        **kwargs: Any,
+    ) -> Anthropic | AsyncAnthropic:
+        """An Anthropic client whose model calls go through this cassette.
+
+        Args:
+            async_client: Return an AsyncAnthropic rather than Anthropic
+            transport: Transport that reaches the API when recording
+            **kwargs: Passed to the client, e.g. api_key or max_retries.
+                      Replay-only runs need no real API key.
+        """
+        if self.mode == "replay":
+            kwargs.setdefault("api_key", "replay")
+        cassette_transport = self.transport(transport)
+        if async_client:
+            http_client = httpx.AsyncClient(transport=cassette_transport)
+            return AsyncAnthropic(http_client=http_client, **kwargs)
+        http_client = httpx.Client(transport=cassette_transport)
+        return Anthropic(http_client=http_client, **kwargs)
+
+
+class CassetteTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """httpx transport that replays and records through a Cassette.
+
+    Works with both sync and async clients. Requests the cassette does
+    not handle, and misses outside replay mode, go to the wrapped
+    transport (by default a regular HTTP transport). Recorded responses
+    are read in full before they are returned, so streams are not
+    incremental while recording.
+    """
+
+    def __init__(
+        self,
+        cassette: Cassette,
+        transport: Transport | None = None,
+    ):
+        self.cassette = cassette
+        self._transport = transport
+
+    def _replay(self, request: httpx.Request) -> tuple[str, Any]:
+        """(key, response) for a handled request; response None on a miss."""
+        key = self.cassette.request_key(request)
+        response = self.cassette.lookup(key)
+        if response is None and self.cassette.mode == "replay":
+            response = self.cassette.missing(key)
+        return key, response
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self._transport is None:
+            self._transport = httpx.HTTPTransport()
+        if not self.cassette.handles(request):
+            return self._transport.handle_request(request)
+        key, response = self._replay(request)
+        if response is None:
+            response = self._transport.handle_request(request)
+            try:
+                response.read()
+            finally:
+                response.close()
+            self.cassette.record(key, response)
+            response = _detached(response)
+        return response
+
+    async def handle_async_request(
+        self, request: httpx.Request
+    ) -> httpx.Response:
+        if self._transport is None:
+            self._transport = httpx.AsyncHTTPTransport()
+        if not self.cassette.handles(request):
+            return await self._transport.handle_async_request(request)
+        key, response = self._replay(request)
+        if response is None:
+            response = await self._transport.handle_async_request(request)
+            try:
+                await response.aread()
+            finally:
+                await response.aclose()
+            self.cassette.record(key, response)
+            response = _detached(response)
+        return response
+
+    def close(self) -> None:
+        if isinstance(self._transport, httpx.BaseTransport):
+            self._transport.close()
+
+    async def aclose(self) -> None:
+        if isinstance(self._transport, httpx.AsyncBaseTransport):
+            await self._transport.aclose()
+
+
+def _detached(response: httpx.Response) -> httpx.Response:
+    """A copy of a read response, independent of its connection."""
+    headers = [
+        (name, value)
+        for name, value in response.headers.multi_items()
+        # The body is already decoded and its length may have changed
+        if name not in ("content-encoding", "content-length")
+    ]
+    return httpx.Response(
+        response.status_code,
+        headers=headers,
+        content=response.content,
+        extensions={"http_version": response.http_version.encode()},
+    )
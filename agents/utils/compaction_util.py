@@ -0,0 +1,199 @@
+"""Summarizing context compaction for long-running agents."""
+
+import asyncio
+import hashlib
+import inspect
+import json
+import weakref
+from collections import OrderedDict
+from typing import Any
+
+from anthropic import AsyncAnthropic
+
+from .payload_util import to_dict
+
+SUMMARY_PREFIX = "[Summary of earlier conversation]"
+
+SUMMARY_PROMPT = (
+    "You compress agent transcripts. Summarize the conversation below so "
+    "the agent can continue the task without it. Keep the user's goals, "
+    "decisions made, facts and values discovered, tool results that are "
+    "still relevant, and any open questions or next steps. Be concise."
+)
+
+
+def render_transcript(records: list[Any]) -> str:
+    """Render message records as plain text for summarization."""
+    lines = []
+    for record in records:
+        for block in record.content:
+            block = to_dict(block)
+            block_type = block.get("type")
+            if block_type == "text":
+                lines.append(f"{record.role}: {block['text']}")
+            elif block_type == "tool_use":
+                lines.append(
+                    f"{record.role} called {block['name']}"
+                    f"({json.dumps(block['input'])})"
+                )
+            elif block_type == "tool_result":
+                content = block.get("content", "")
+                if not isinstance(content, str):
+                    content = " ".join(
+                        item.get("text", "") for item in content
+                    )
+                lines.append(f"tool result: {content}")
+    return "\n".join(lines)
+
+
+class ExtractiveSummarizer:
+    """Summarizes by keeping the head of every message, with no API call."""
+
+    def __init__(self, max_chars_per_line: int = 200):
+        self.max_chars_per_line = max_chars_per_line
+
+    async def summarize(self, transcript: str) -> str:
+        limit = self.max_chars_per_line
+        return "\n".join(
+            line if len(line) <= limit else line[:limit] + "..."
+            for line in transcript.splitlines()
+        )
+
+
+class ModelSummarizer:
+    """Summarizes with a Messages API call."""
+
+    def __init__(
+        self,
+        client: Any,
+        model: str = "claude-haiku-4-5-20251001",
+        max_tokens: int = 1024,
+    ):
+        self.client = client
+        self.model = model
+        self.max_tokens = max_tokens
+
+    async def summarize(self, transcript: str) -> str:
+        kwargs = {
+            "model": self.model,
+            "max_tokens": self.max_tokens,
+            "system": SUMMARY_PROMPT,
+            "messages": [{"role": "user", "content": transcript}],
+        }
+        # The SDK wraps AsyncMessages.create, hiding that it is async
+        if isinstance(self.client, AsyncAnthropic) or (
+            inspect.iscoroutinefunction(self.client.messages.create)
+        ):
+            response = await self.client.messages.create(**kwargs)
+        else:
+            response = await asyncio.to_thread(
+                self.client.messages.create, **kwargs
+            )
+        return "".join(
+            block.text for block in response.content if block.type == "text"
+        )
+
+
+class Compactor:
+    """Replaces the oldest history with a summary, ahead of need.
+
+    Once the history crosses the high-water mark, the oldest span of
+    messages is summarized in a background task while the agent keeps
+    working. The summary is swapped in on a later turn, bringing the
+    history down to the target size. Summaries are cached by the content
+    of their span, so a span is never summarized twice, and an earlier
+    summary is folded into the next one rather than re-derived.
+
+    One compactor can be shared by many histories, e.g. every agent of a
+    batch: the summary cache is shared, while each history has its own
+    summary in progress.
+    """
+
+    def __init__(
+        self,
+        summarizer: Any | None = None,
+        high_water: float = 0.75,
+        target: float = 0.5,
+        cache_size: int = 128,
+    ):
+        """Initialize a Compactor.
+
+        Args:
+            summarizer: Object with an async summarize(transcript) method.
+                        Defaults to ExtractiveSummarizer.
+            high_water: Fraction of the context window that starts compaction
+            target: Fraction of the context window to compact down to
+            cache_size: Number of span summaries to keep
+        """
+        self.summarizer = summarizer or ExtractiveSummarizer()
+        self.high_water = high_water
+        self.target = target
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, str] = OrderedDict()
+        # The summary in progress for each history: (task, span)
+        self._pending: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def in_progress(self, history: Any) -> bool:
+        """Whether a summary is being made for a history."""
+        return history in self._pending
+
+    def select_span(self, history: Any) -> list[Any]:
+        """Pick the oldest records to summarize.
+
+        The span ends on a user message so the summary, itself a user
+        message, is followed by an assistant reply. The last exchange and
+        any pending user message are never included.
+        """
+        budget = self.target * history.context_window_tokens
+        remaining = history.total_tokens
+        span = []
+        records = list(history.records)
+        for i, record in enumerate(records[:-2]):
+            span.append(record)
+            remaining -= record.tokens
+            if i % 2 == 0 and remaining <= budget:
+                break
+        while span and (len(span) % 2 == 0 or span[-1].role != "user"):
+            span.pop()
+        return span if len(span) > 1 else []
+
+    def start(self, history: Any) -> None:
+        """Begin summarizing in the background if over the high-water mark."""
+        limit = self.high_water * history.context_window_tokens
+        if history in self._pending or history.total_tokens <= limit:
+            return
+        span = self.select_span(history)
+        if not span:
+            return
+        task = asyncio.ensure_future(self._summarize(span))
+        self._pending[history] = (task, span)
+
+    async def _summarize(self, span: list[Any]) -> str:
+        transcript = render_transcript(span)
+        key = hashlib.sha256(transcript.encode()).hexdigest()
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        summary = await self.summarizer.summarize(transcript)
+        self._cache[key] = summary
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return summary
+
+    async def finish(
+        self, history: Any, wait: bool = False
+    ) -> tuple[list[Any], str] | None:
+        """Return a history's completed (span, summary), optionally waiting."""
+        pending = self._pending.get(history)
+        if pending is None or (not wait and not pending[0].done()):
+            return None
+        task, span = self._pending.pop(history)
+        if task.cancelled():
+            # Cancelled when a previous run's event loop shut down
+            return None
+        try:
+            summary = await task
+        except Exception as e:
+            print(f"Error summarizing history: {e}")
+            return None
+        return span, summary
@@ -1,14 +1,25 @@
 """Connection handling for MCP servers."""
 
+import asyncio
+import importlib
+import json
+import time
+import weakref
 from abc import ABC, abstractmethod
-from contextlib import AsyncExitStack
+from contextlib import AsyncExitStack, asynccontextmanager
 from typing import Any
 
+import anyio
+import httpx
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.sse import sse_client
 from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamable_http_client
+from mcp.server.fastmcp import FastMCP
+from mcp.shared.memory import create_client_server_memory_streams
 
 from ..tools.mcp_tool import MCPTool
+from .schema_cache import ToolSchemaCache, server_fingerprint
 
 
 class MCPConnection(ABC):
@@ -25,21 +36,33 @@ class MCPConnection(ABC):
 
     async def __aenter__(self):
         """Initialize MCP server connection."""
-        self._rw_ctx = await self._create_rw_context()
-        read_write = await self._rw_ctx.__aenter__()
-        read, write = read_write
-        self._session_ctx = ClientSession(read, write)
-        self.session = await self._session_ctx.__aenter__()
-        await self.session.initialize()
+        try:
+            rw_ctx = await self._create_rw_context()
+            read, write = await rw_ctx.__aenter__()
+            self._rw_ctx = rw_ctx
+            session_ctx = ClientSession(read, write)
+            self.session = await session_ctx.__aenter__()
+            self._session_ctx = session_ctx
+            await self.session.initialize()
+        except BaseException as e:
+            # Close whatever was opened, e.g. when startup times out
+            await self.__aexit__(type(e), e, e.__traceback__)
+            raise
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         """Clean up MCP server connection resources."""
         try:
-            if self._session_ctx:
-                await self._session_ctx.__aexit__(exc_type, exc_val, exc_tb)
-            if self._rw_ctx:
-                await self._rw_ctx.__aexit__(exc_type, exc_val, exc_tb)
+            try:
+                if self._session_ctx:
+                    await self._session_ctx.__aexit__(
+                        exc_type, exc_val, exc_tb
+                    )
+            finally:
+                # Always close the transport, even if the session re-raised
+                # a cancellation
+                if self._rw_ctx:
+                    await self._rw_ctx.__aexit__(exc_type, exc_val, exc_tb)
         except Exception as e:
             print(f"Error during cleanup: {e}")
         finally:
@@ -90,6 +113,137 @@ class MCPConnectionSSE(MCPConnection):
         return sse_client(url=self.url, headers=self.headers)
 
 
+# Keep-alive pool shared by streamable HTTP connections on one event loop
+HTTP_POOL_LIMITS = httpx.Limits(
+    max_connections=32, max_keepalive_connections=32, keepalive_expiry=60.0
+)
+# Connect/write/pool timeout, and read timeout for held-open streams
+HTTP_TIMEOUT = httpx.Timeout(30.0, read=300.0)
+
+# httpx transports belong to the event loop they were used on:
+# {loop: [transport, number of open clients using it]}
+_http_transports: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+@asynccontextmanager
+async def shared_http_client(headers: dict[str, str] | None = None):
+    """HTTP client on the event loop's shared keep-alive connection pool.
+
+    Clients differ only in their default headers. The pool is counted
+    by its open clients and closed when the last one exits, so no user
+    can close it from under another.
+    """
+    loop = asyncio.get_running_loop()
+    shared = _http_transports.get(loop)
+    if shared is None:
+        shared = _http_transports[loop] = [
+            httpx.AsyncHTTPTransport(limits=HTTP_POOL_LIMITS),
+            0,
+        ]
+    shared[1] += 1
+    try:
+        yield httpx.AsyncClient(
+            transport=shared[0], headers=headers, timeout=HTTP_TIMEOUT
+        )
+    finally:
+        shared[1] -= 1
+        if shared[1] == 0 and _http_transports.get(loop) is shared:
+            del _http_transports[loop]
+            await shared[0].aclose()
+
+
+class MCPConnectionStreamableHTTP(MCPConnection):
+    """MCP connection using the streamable HTTP transport.
+
+    Calls are concurrent POST requests on a keep-alive connection pool
+    shared by every streamable HTTP connection on the event loop, so many
+    agents can use one remote server through a bounded set of sockets
+    (HTTP_POOL_LIMITS). Connections are only kept alive across calls
+    when the server answers with JSON (json_response=True): the mcp
+    client closes SSE responses before their end. A stateful server also
+    holds one pooled connection per session open for server-initiated
+    messages, so serve with stateless_http=True, or size the pool above
+    the number of sessions.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        headers: dict[str, str] = None,
+        http_client: httpx.AsyncClient | None = None,
+    ):
+        super().__init__()
+        self.url = url
+        self.headers = headers or {}
+        self.http_client = http_client
+
+    @asynccontextmanager
+    async def _streams(self):
+        async with AsyncExitStack() as stack:
+            client = self.http_client or await stack.enter_async_context(
+                shared_http_client(self.headers)
+            )
+            async with streamable_http_client(
+                self.url, http_client=client
+            ) as (read, write, _):
+                yield read, write
+
+    async def _create_rw_context(self):
+        return self._streams()
+
+
+def resolve_server(server: Any) -> Any:
+    """The server object for an in-process config's "server" value.
+
+    Accepts a FastMCP or low-level mcp Server instance, or an import path
+    "package.module:attribute" (the attribute defaults to "mcp").
+    """
+    if isinstance(server, str):
+        module_name, _, attribute = server.partition(":")
+        server = getattr(
+            importlib.import_module(module_name), attribute or "mcp"
+        )
+    return server
+
+
+@asynccontextmanager
+async def _in_process_streams(server: Any):
+    """Run server in this event loop, yielding the client's streams."""
+    if isinstance(server, FastMCP):
+        # FastMCP exposes no public accessor for its protocol server
+        server = server._mcp_server
+    async with create_client_server_memory_streams() as (
+        client_streams,
+        (read, write),
+    ):
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(
+                lambda: server.run(
+                    read, write, server.create_initialization_options()
+                )
+            )
+            try:
+                yield client_streams
+            finally:
+                tg.cancel_scope.cancel()
+
+
+class MCPConnectionInProcess(MCPConnection):
+    """MCP connection to a Python server running in the agent's loop.
+
+    Messages are passed as objects over in-memory streams, so there is
+    no subprocess to spawn and nothing is serialized. The server's
+    synchronous tools run on the event loop and should return quickly.
+    """
+
+    def __init__(self, server: Any):
+        super().__init__()
+        self.server = server
+
+    async def _create_rw_context(self):
+        return _in_process_streams(resolve_server(self.server))
+
+
 def create_mcp_connection(config: dict[str, Any]) -> MCPConnection:
     """Factory function to create the appropriate MCP connection."""
     conn_type = config.get("type", "stdio").lower()
@@ -110,41 +264,442 @@ def create_mcp_connection(config: dict[str, Any]) -> MCPConnection:
             url=config["url"], headers=config.get("headers")
         )
 
+    elif conn_type == "streamable_http":
+        if not config.get("url"):
+            raise ValueError("URL is required for streamable HTTP connections")
+        return MCPConnectionStreamableHTTP(
+            url=config["url"],
+            headers=config.get("headers"),
+            http_client=config.get("http_client"),
+        )
+
+    elif conn_type == "inprocess":
+        if not config.get("server"):
+            raise ValueError("Server is required for in-process connections")
+        return MCPConnectionInProcess(server=config["server"])
+
     else:
         raise ValueError(f"Unsupported connection type: {conn_type}")
 
 
+# Keeps references to servers shutting down in the background
+_closing: set[asyncio.Task] = set()
+
+
+async def _serve_connection(
+    config: dict[str, Any], ready: asyncio.Future, stop: asyncio.Event
+) -> None:
+    """Hold one MCP connection open until stop is set.
+
+    The connection is entered and exited in this task because the MCP
+    transports use anyio task groups, which must be closed by the task
+    that opened them.
+    """
+    try:
+        connection = create_mcp_connection(config)
+        async with connection:
+            tools = await connection.list_tools()
+            ready.set_result((connection, tools))
+            await stop.wait()
+    except Exception as e:
+        if not ready.done():
+            ready.set_exception(e)
+        else:
+            print(f"Error in MCP server {config}: {e}")
+
+
+class ServedConnection:
+    """An MCP connection held open by its own task."""
+
+    def __init__(
+        self,
+        connection: MCPConnection,
+        tool_definitions: list[Any],
+        task: asyncio.Task,
+        stop: asyncio.Event,
+    ):
+        self.connection = connection
+        self.tool_definitions = tool_definitions
+        self.task = task
+        self.stop = stop
+
+    @property
+    def alive(self) -> bool:
+        return not self.task.done()
+
+    async def close(self) -> None:
+        self.stop.set()
+        await asyncio.gather(self.task, return_exceptions=True)
+
+
+async def open_connection(
+    config: dict[str, Any], timeout: float = 30.0
+) -> ServedConnection:
+    """Start an MCP server and list its tools within a timeout.
+
+    A "timeout" key in the server config overrides the default.
+    """
+    timeout = config.get("timeout", timeout)
+    ready = asyncio.get_running_loop().create_future()
+    stop = asyncio.Event()
+    task = asyncio.create_task(_serve_connection(config, ready, stop))
+
+    try:
+        connection, tool_definitions = await asyncio.wait_for(
+            asyncio.shield(ready), timeout
+        )
+    except asyncio.TimeoutError:
+        _abandon(task)
+        raise TimeoutError(f"timed out after {timeout}s") from None
+    except asyncio.CancelledError:
+        # E.g. a tool call timed out while its server was starting
+        _abandon(task)
+        raise
+
+    return ServedConnection(connection, tool_definitions, task, stop)
+
+
+def _abandon(task: asyncio.Task) -> None:
+    """Let a server nobody waits for shut down in the background."""
+    task.cancel()
+    _keep_until_done(task)
+
+
+def _keep_until_done(task: asyncio.Task) -> None:
+    """Hold a background shutdown task so it is not garbage collected."""
+    _closing.add(task)
+    task.add_done_callback(_closing.discard)
+
+
+def create_mcp_tools(
+    tool_definitions: list[Any],
+    connection: Any,
+    config: dict[str, Any] | None = None,
+) -> list[MCPTool]:
+    """Create tool interfaces for tools listed by an MCP server.
+
+    The server config may set "max_concurrency" (concurrent calls per
+    session), "tool_timeout" (seconds per call) and "cache_results"
+    (True, or a list of tool names, whose results a ToolResultCache may
+    memoize; only set it for read-only tools).
+    """
+    config = config or {}
+    cached = config.get("cache_results") or []
+    scope = server_fingerprint(config) if cached else ""
+    return [
+        MCPTool(
+            name=tool_info.name,
+            description=tool_info.description
+            or f"MCP tool: {tool_info.name}",
+            input_schema=tool_info.inputSchema,
+            connection=connection,
+            session_concurrency=config.get("max_concurrency"),
+            timeout=config.get("tool_timeout"),
+            cacheable=cached is True or tool_info.name in cached,
+            cache_scope=scope,
+        )
+        for tool_info in tool_definitions
+    ]
+
+
+class LazyConnection:
+    """Starts an MCP server on its first tool call.
+
+    Used for servers whose tools were loaded from a ToolSchemaCache; the
+    server is then kept open until the agent's exit stack closes.
+    """
+
+    def __init__(
+        self,
+        config: dict[str, Any],
+        stack: AsyncExitStack,
+        timeout: float,
+        schema_cache: ToolSchemaCache,
+    ):
+        self.config = config
+        self.stack = stack
+        self.timeout = timeout
+        self.schema_cache = schema_cache
+        self.served: ServedConnection | None = None
+        self._lock = asyncio.Lock()
+
+    async def call_tool(
+        self, tool_name: str, arguments: dict[str, Any]
+    ) -> Any:
+        async with self._lock:
+            if self.served is None:
+                self.served = await open_connection(self.config, self.timeout)
+                self.stack.push_async_callback(self.served.close)
+                self.schema_cache.store(
+                    self.config, self.served.tool_definitions
+                )
+        return await self.served.connection.call_tool(
+            tool_name, arguments=arguments
+        )
+
+
+async def _start_connection(
+    config: dict[str, Any],
+    stack: AsyncExitStack,
+    timeout: float,
+    schema_cache: ToolSchemaCache | None = None,
+) -> list[MCPTool]:
+    """Start one MCP server and build its tools, isolating failures."""
+    if schema_cache:
+        tool_definitions = schema_cache.load(config)
+        if tool_definitions is not None:
+            connection = LazyConnection(config, stack, timeout, schema_cache)
+            return create_mcp_tools(tool_definitions, connection, config)
+
+    try:
+        served = await open_connection(config, timeout)
+    except Exception as e:
+        print(f"Error setting up MCP server {config}: {e}")
+        return []
+
+    stack.push_async_callback(served.close)
+    if schema_cache:
+        schema_cache.store(config, served.tool_definitions)
+    return create_mcp_tools(
+        served.tool_definitions, served.connection, config
+    )
+
+
 async def setup_mcp_connections(
     mcp_servers: list[dict[str, Any]] | None,
     stack: AsyncExitStack,
+    timeout: float = 30.0,
+    schema_cache: ToolSchemaCache | None = None,
 ) -> list[MCPTool]:
-    """Set up MCP server connections and create tool interfaces."""
+    """Set up MCP server connections and create tool interfaces.
+
+    Servers are started concurrently, each with its own timeout (a
+    "timeout" key in a server config overrides the default). A server
+    that fails is skipped; tools are returned in server config order.
+    With a schema_cache, servers whose tools are cached are not started
+    until one of their tools is called.
+    """
     if not mcp_servers:
         return []
 
-    mcp_tools = []
-
-    for config in mcp_servers:
-        try:
-            connection = create_mcp_connection(config)
-            await stack.enter_async_context(connection)
-            tool_definitions = await connection.list_tools()
-
-            for tool_info in tool_definitions:
-                mcp_tools.append(
-                    MCPTool(
-                        name=tool_info.name,
-                        description=tool_info.description
-                        or f"MCP tool: {tool_info.name}",
-                        input_schema=tool_info.inputSchema,
-                        connection=connection,
-                    )
-                )
-
-        except Exception as e:
-            print(f"Error setting up MCP server {config}: {e}")
+    server_tools = await asyncio.gather(
+        *[
+            _start_connection(config, stack, timeout, schema_cache)
+            for config in mcp_servers
+        ]
+    )
+    mcp_tools = [tool for tools in server_tools for tool in tools]
 
     print(
         f"Loaded {len(mcp_tools)} MCP tools from {len(mcp_servers)} servers."
     )
     return mcp_tools
+
+
+class PooledConnection:
+    """A pool entry for one server config, shared by every agent using it.
+
+    Tools hold the entry rather than a raw connection, so a server that
+    dies is restarted transparently on the next call.
+    """
+
+    def __init__(self, pool: "MCPConnectionPool", config: dict[str, Any]):
+        self.pool = pool
+        self.config = config
+        self.served: ServedConnection | None = None
+        self.tools: list[MCPTool] = []
+        self._definitions: list[tuple] = []
+        self.refs = 0
+        self.last_checked = 0.0
+        self.idle_handle: asyncio.TimerHandle | None = None
+        self.lock = asyncio.Lock()
+
+    async def ensure_connected(self) -> None:
+        """Connect, or reconnect if the server died or fails a ping."""
+        async with self.lock:
+            if self.served and self.served.alive:
+                if not await self._healthy():
+                    await self.close()
+            if self.served and self.served.alive:
+                return
+
+            self.served = await open_connection(
+                self.config, self.pool.timeout
+            )
+            self.last_checked = time.monotonic()
+            # Keep the same tool objects across reconnects unless the
+            # server's tools changed
+            definitions = [
+                (t.name, t.description, t.inputSchema)
+                for t in self.served.tool_definitions
+            ]
+            if definitions != self._definitions:
+                self._definitions = definitions
+                self.tools = create_mcp_tools(
+                    self.served.tool_definitions, self, self.config
+                )
+                if self.pool.schema_cache:
+                    self.pool.schema_cache.store(
+                        self.config, self.served.tool_definitions
+                    )
+
+    def load_cached_tools(self) -> bool:
+        """Build tools from the pool's schema cache without connecting."""
+        if self.tools or not self.pool.schema_cache:
+            return bool(self.tools)
+        tool_definitions = self.pool.schema_cache.load(self.config)
+        if tool_definitions is None:
+            return False
+        self._definitions = [
+            (t.name, t.description, t.inputSchema) for t in tool_definitions
+        ]
+        self.tools = create_mcp_tools(tool_definitions, self, self.config)
+        return True
+
+    async def _healthy(self) -> bool:
+        elapsed = time.monotonic() - self.last_checked
+        if elapsed < self.pool.health_check_interval:
+            return True
+        try:
+            await asyncio.wait_for(
+                self.served.connection.session.send_ping(),
+                self.pool.timeout,
+            )
+        except Exception:
+            return False
+        self.last_checked = time.monotonic()
+        return True
+
+    async def call_tool(
+        self, tool_name: str, arguments: dict[str, Any]
+    ) -> Any:
+        """Call a tool, restarting the server first if it has died."""
+        if not (self.served and self.served.alive):
+            await self.ensure_connected()
+        try:
+            return await self.served.connection.call_tool(
+                tool_name, arguments=arguments
+            )
+        except Exception:
+            # The call may have reached the server, so it is not retried;
+            # a failed health check makes the next call reconnect
+            self.last_checked = 0.0
+            raise
+
+    async def close(self) -> None:
+        if self.served:
+            served, self.served = self.served, None
+            await served.close()
+
+
+class MCPConnectionPool:
+    """Long-lived MCP connections shared across agents and runs.
+
+    Connections are keyed by server config and reference counted. A
+    connection that is no longer used by any agent stays open for
+    idle_timeout seconds so the next run reuses it instead of spawning
+    the server again. Connections are pinged before reuse when they have
+    not been checked for health_check_interval seconds.
+
+    A pool belongs to one event loop. Agent.run() starts a new loop per
+    call, so share a pool between agents via run_async() on one loop.
+    With a schema_cache, a server whose tools are cached is only started
+    when one of its tools is first called.
+    """
+
+    def __init__(
+        self,
+        timeout: float = 30.0,
+        idle_timeout: float = 300.0,
+        health_check_interval: float = 30.0,
+        schema_cache: ToolSchemaCache | None = None,
+    ):
+        self.timeout = timeout
+        self.schema_cache = schema_cache
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self._entries: dict[str, PooledConnection] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    @staticmethod
+    def _key(config: dict[str, Any]) -> str:
+        return json.dumps(config, sort_keys=True, default=str)
+
+    async def acquire(self, config: dict[str, Any]) -> list[MCPTool]:
+        """Get the tools of a server, connecting if needed."""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Connections from another loop died with it
+            self._entries.clear()
+            self._loop = loop
+
+        key = self._key(config)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = PooledConnection(self, config)
+        if entry.idle_handle:
+            entry.idle_handle.cancel()
+            entry.idle_handle = None
+
+        entry.refs += 1
+        if entry.served is None and entry.load_cached_tools():
+            return entry.tools
+        try:
+            await entry.ensure_connected()
+        except BaseException:
+            self.release(config)
+            raise
+        return entry.tools
+
+    def release(self, config: dict[str, Any]) -> None:
+        """Drop a reference; idle connections close after idle_timeout."""
+        entry = self._entries.get(self._key(config))
+        if entry is None:
+            return
+        entry.refs -= 1
+        if entry.refs == 0:
+            entry.idle_handle = asyncio.get_running_loop().call_later(
+                self.idle_timeout,
+                lambda: _keep_until_done(
+                    asyncio.ensure_future(self._expire(entry))
+                ),
+            )
+
+    async def _expire(self, entry: PooledConnection) -> None:
+        key = self._key(entry.config)
+        if entry.refs == 0 and self._entries.get(key) is entry:
+            del self._entries[key]
+            await entry.close()
+
+    async def connect(
+        self, mcp_servers: list[dict[str, Any]] | None, stack: AsyncExitStack
+    ) -> list[MCPTool]:
+        """Acquire tools for several servers, released when stack closes.
+
+        Mirrors setup_mcp_connections(): servers are acquired concurrently,
+        failures are isolated and tools keep server config order.
+        """
+        if not mcp_servers:
+            return []
+
+        async def acquire(config: dict[str, Any]) -> list[MCPTool]:
+            try:
+                tools = await self.acquire(config)
+            except Exception as e:
+                print(f"Error setting up MCP server {config}: {e}")
+                return []
+            stack.callback(self.release, config)
+            return tools
+
+        server_tools = await asyncio.gather(
+            *[acquire(config) for config in mcp_servers]
+        )
+        return [tool for tools in server_tools for tool in tools]
+
+    async def close(self) -> None:
+        """Close every pooled connection."""
+        entries, self._entries = list(self._entries.values()), {}
+        for entry in entries:
+            if entry.idle_handle:
+                entry.idle_handle.cancel()
+        await asyncio.gather(*[entry.close() for entry in entries])
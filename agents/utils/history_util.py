@@ -1,7 +1,96 @@
 """Message history with token tracking and prompt caching."""
 
+import base64
+from collections import deque
+from dataclasses import dataclass, field
 from typing import Any
 
+from .cache_util import CacheBreakpointPlanner, mark_last_block
+from .compaction_util import SUMMARY_PREFIX, Compactor
+from .payload_util import dumps
+from .token_util import TokenEstimator, default_token_estimator
+from .tracing import current_span
+
+TRUNCATION_NOTICE_TOKENS = 25
+TRUNCATION_NOTICE = "[Earlier history has been truncated.]"
+
+# Content blocks whose size in the request says little about their tokens
+MEDIA_BLOCK_TYPES = ("image", "document")
+
+
+def _encode_content(value: Any, media: list[bool]) -> Any:
+    """Copy of content with bytes base64-encoded for the API.
+
+    Sets media[0] if the content holds image or document blocks.
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(value).decode("ascii")
+    if isinstance(value, dict):
+        if value.get("type") in MEDIA_BLOCK_TYPES:
+            media[0] = True
+        return {key: _encode_content(v, media) for key, v in value.items()}
+    if isinstance(value, list):
+        return [_encode_content(item, media) for item in value]
+    return value
+
+
+@dataclass(slots=True)
+class MessageRecord:
+    """A single message together with the tokens it contributed.
+
+    User messages carry the input tokens their turn added to the context;
+    assistant messages carry the output tokens they generated.
+    """
+
+    role: str
+    content: list[Any]
+    input_tokens: int = 0
+    output_tokens: int = 0
+    has_usage: bool = False
+    _has_media: bool = field(default=False, repr=False)
+    _api: dict[str, Any] | None = field(default=None, repr=False)
+    _json: bytes | None = field(default=None, repr=False)
+
+    @property
+    def tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def api_message(self) -> dict[str, Any]:
+        """The message in API format, built once and reused.
+
+        Binary data in the content is base64-encoded here, so only once
+        however many requests resend the message.
+        """
+        if self._api is None:
+            content = self.content
+            if self.role == "user":
+                # Tool results are the only content that carries bytes
+                media = [False]
+                content = _encode_content(content, media)
+                self._has_media = media[0]
+            self._api = {"role": self.role, "content": content}
+        return self._api
+
+    @property
+    def has_media(self) -> bool:
+        """Whether the message holds images or documents."""
+        self.api_message()
+        return self._has_media
+
+    def json(self) -> bytes:
+        """The message serialized to JSON, encoded once and reused."""
+        if self._json is None:
+            self._json = dumps(self.api_message())
+        return self._json
+
+    def replace(self, role: str, content: list[Any]) -> None:
+        """Replace the message, invalidating its cached forms."""
+        self.role = role
+        self.content = content
+        self._has_media = False
+        self._api = None
+        self._json = None
+
 
 class MessageHistory:
     """Manages chat history with token tracking and context management."""
@@ -13,33 +102,43 @@ class MessageHistory:
         context_window_tokens: int,
         client: Any,
         enable_caching: bool = True,
+        token_estimator: TokenEstimator | None = None,
+        compactor: Compactor | None = None,
     ):
         self.model = model
         self.system = system
         self.context_window_tokens = context_window_tokens
-        self.messages: list[dict[str, Any]] = []
+        self.records: deque[MessageRecord] = deque()
         self.total_tokens = 0
         self.enable_caching = enable_caching
-        self.message_tokens: list[tuple[int, int]] = (
-            []
-        )  # List of (input_tokens, output_tokens) tuples
+        self.cache_planner = CacheBreakpointPlanner()
         self.client = client
+        self.token_estimator = token_estimator or default_token_estimator
+        self.compactor = compactor
+        # Number of records in the history that carry API usage
+        self._usage_turns = 0
 
         # set initial total tokens to system prompt
-        try:
-            system_token = (
-                self.client.messages.count_tokens(
-                    model=self.model,
-                    system=self.system,
-                    messages=[{"role": "user", "content": "test"}],
-                ).input_tokens
-                - 1
-            )
+        self.total_tokens = self.token_estimator.count_system(
+            self.model, self.system
+        )
 
-        except Exception:
-            system_token = len(self.system) / 4
+    @property
+    def messages(self) -> list[dict[str, Any]]:
+        """Messages in the history as role/content dicts."""
+        return [{"role": r.role, "content": r.content} for r in self.records]
 
-        self.total_tokens = system_token
+    @property
+    def message_tokens(self) -> list[tuple[int, int]]:
+        """(input_tokens, output_tokens) for each turn with recorded usage."""
+        tokens = []
+        previous = None
+        for record in self.records:
+            if record.has_usage:
+                input_tokens = previous.input_tokens if previous else 0
+                tokens.append((input_tokens, record.output_tokens))
+            previous = record
+        return tokens
 
     async def add_message(
         self,
@@ -51,74 +150,171 @@ class MessageHistory:
         if isinstance(content, str):
             content = [{"type": "text", "text": content}]
 
-        message = {"role": role, "content": content}
-        self.messages.append(message)
+        record = MessageRecord(role=role, content=content)
+        self.records.append(record)
 
         if role == "assistant" and usage:
             total_input = (
                 usage.input_tokens
-                + getattr(usage, "cache_read_input_tokens", 0)
-                + getattr(usage, "cache_creation_input_tokens", 0)
+                + (getattr(usage, "cache_read_input_tokens", 0) or 0)
+                + (getattr(usage, "cache_creation_input_tokens", 0) or 0)
             )
-            output_tokens = usage.output_tokens
-
             current_turn_input = total_input - self.total_tokens
-            self.message_tokens.append((current_turn_input, output_tokens))
-            self.total_tokens += current_turn_input + output_tokens
+
+            # The turn's new input belongs to the message that prompted it
+            if len(self.records) >= 2:
+                prompt = self.records[-2]
+                prompt.input_tokens += current_turn_input
+                if len(self.records) > 2 and not prompt.has_media:
+                    # Later turns add just this message, which makes it a
+                    # clean sample for calibrating the estimator (unless
+                    # media, billed by size rather than bytes, is in it).
+                    # Like estimates, it is measured in characters
+                    self.token_estimator.observe(
+                        self.model,
+                        len(prompt.json().decode()),
+                        current_turn_input,
+                    )
+                if self.enable_caching:
+                    # The request that produced this response ended on the
+                    # preceding message, so its prefix is now cached
+                    self.cache_planner.advance(self.records[-2])
+            self.cache_planner.record_usage(usage)
+            record.output_tokens = usage.output_tokens
+            record.has_usage = True
+            self._usage_turns += 1
+            self.total_tokens += current_turn_input + usage.output_tokens
+
+    def _evict_oldest(self) -> None:
+        """Remove the oldest message, keeping running totals in sync."""
+        record = self.records.popleft()
+        self.total_tokens -= record.tokens
+        if record.has_usage:
+            self._usage_turns -= 1
 
     def truncate(self) -> None:
         """Remove oldest messages when context window limit is exceeded."""
         if self.total_tokens <= self.context_window_tokens:
             return
 
-        TRUNCATION_NOTICE_TOKENS = 25
-        TRUNCATION_MESSAGE = {
-            "role": "user",
-            "content": [
-                {
-                    "type": "text",
-                    "text": "[Earlier history has been truncated.]",
-                }
-            ],
-        }
-
-        def remove_message_pair():
-            self.messages.pop(0)
-            self.messages.pop(0)
-
-            if self.message_tokens:
-                input_tokens, output_tokens = self.message_tokens.pop(0)
-                self.total_tokens -= input_tokens + output_tokens
-
+        tokens_before, records_before = self.total_tokens, len(self.records)
         while (
-            self.message_tokens
-            and len(self.messages) >= 2
+            self._usage_turns
+            and len(self.records) >= 2
             and self.total_tokens > self.context_window_tokens
         ):
-            remove_message_pair()
+            self._evict_oldest()
+            self._evict_oldest()
+            self.cache_planner.reset()
 
-            if self.messages and self.message_tokens:
-                original_input_tokens, original_output_tokens = (
-                    self.message_tokens[0]
-                )
-                self.messages[0] = TRUNCATION_MESSAGE
-                self.message_tokens[0] = (
-                    TRUNCATION_NOTICE_TOKENS,
-                    original_output_tokens,
-                )
-                self.total_tokens += (
-                    TRUNCATION_NOTICE_TOKENS - original_input_tokens
+            if self.records and self._usage_turns:
+                first = self.records[0]
+                self.total_tokens += TRUNCATION_NOTICE_TOKENS - first.tokens
+                first.replace(
+                    "user", [{"type": "text", "text": TRUNCATION_NOTICE}]
                 )
+                first.input_tokens = TRUNCATION_NOTICE_TOKENS
+                first.output_tokens = 0
+
+        current_span().add_event(
+            "history.truncated",
+            tokens_before=tokens_before,
+            tokens_after=self.total_tokens,
+            messages_evicted=records_before - len(self.records),
+        )
+
+    async def compact(self) -> None:
+        """Keep the history under budget by summarizing old messages.
+
+        Swaps in any summary that finished in the background, then starts
+        summarizing the next span if the history is over the compactor's
+        high-water mark. A summary is only waited for when the history
+        has outgrown the context window; truncate() is the last resort.
+        """
+        if self.compactor is None:
+            self.truncate()
+            return
+
+        over_budget = self.total_tokens > self.context_window_tokens
+        if self.compactor.in_progress(self):
+            result = await self.compactor.finish(self, wait=over_budget)
+            if result:
+                self._replace_span(*result)
+
+        self.compactor.start(self)
+        if self.total_tokens > self.context_window_tokens:
+            result = await self.compactor.finish(self, wait=True)
+            if result:
+                self._replace_span(*result)
+            self.truncate()
+
+    def _replace_span(self, span: list[MessageRecord], summary: str) -> None:
+        """Replace the leading span of records with a summary message."""
+        # Skip summaries whose span is no longer the front of the history
+        if len(span) > len(self.records) or any(
+            a is not b for a, b in zip(span, self.records)
+        ):
+            return
+        tokens_before = self.total_tokens
+        for _ in span:
+            self._evict_oldest()
+
+        text = f"{SUMMARY_PREFIX}\n{summary}"
+        record = MessageRecord(
+            role="user",
+            content=[{"type": "text", "text": text}],
+            input_tokens=self.token_estimator.estimate(self.model, text),
+        )
+        self.records.appendleft(record)
+        self.total_tokens += record.tokens
+        self.cache_planner.reset()
+        current_span().add_event(
+            "history.summarized",
+            tokens_before=tokens_before,
+            tokens_after=self.total_tokens,
+            messages_summarized=len(span),
+        )
+
+    def format_system(self) -> str | list[dict[str, Any]]:
+        """Format the system prompt for Claude API with optional caching."""
+        if not self.enable_caching:
+            return self.system
+        return self.cache_planner.system(self.system)
+
+    def _breakpoints(self) -> tuple[MessageRecord, ...]:
+        if not self.enable_caching:
+            return ()
+        return self.cache_planner.message_breakpoints(self.records)
 
     def format_for_api(self) -> list[dict[str, Any]]:
         """Format messages for Claude API with optional caching."""
-        result = [
-            {"role": m["role"], "content": m["content"]} for m in self.messages
+        breakpoints = self._breakpoints()
+        return [
+            (
+                {
+                    "role": r.role,
+                    "content": mark_last_block(r.api_message()["content"]),
+                }
+                if any(r is b for b in breakpoints)
+                else r.api_message()
+            )
+            for r in self.records
         ]
 
-        if self.enable_caching and self.messages:
-            result[-1]["content"] = [
-                {**block, "cache_control": {"type": "ephemeral"}}
-                for block in self.messages[-1]["content"]
-            ]
-        return result
+    def format_json(self) -> bytes:
+        """Serialize format_for_api() output, reusing cached message JSON."""
+        breakpoints = self._breakpoints()
+        parts = [
+            (
+                dumps(
+                    {
+                        "role": r.role,
+                        "content": mark_last_block(r.api_message()["content"]),
+                    }
+                )
+                if any(r is b for b in breakpoints)
+                else r.json()
+            )
+            for r in self.records
+        ]
+        return b"[" + b",".join(parts) + b"]"
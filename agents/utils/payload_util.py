@@ -0,0 +1,89 @@
+"""Incremental request payload building for the Messages API."""
+
+import json
+from typing import Any
+
+# Keyword arguments accepted by client.messages.create() that configure
+# the HTTP request rather than the JSON body.
+REQUEST_OPTION_KEYS = ("extra_headers", "extra_query", "extra_body", "timeout")
+
+
+def _encode_default(obj: Any) -> Any:
+    """Encode SDK response models the same way the SDK sends them back."""
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json", exclude_unset=True)
+    raise TypeError(
+        f"Object of type {type(obj).__name__} is not JSON serializable"
+    )
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize an object to compact UTF-8 JSON."""
+    return json.dumps(
+        obj,
+        default=_encode_default,
+        ensure_ascii=False,
+        separators=(",", ":"),
+        allow_nan=False,
+    ).encode()
+
+
+def to_dict(block: Any) -> dict[str, Any]:
+    """Return a content block as a plain dict."""
+    if hasattr(block, "model_dump"):
+        return block.model_dump(mode="json", exclude_unset=True)
+    return block
+
+
+class RequestPayloadBuilder:
+    """Builds Messages API request bodies from cached JSON fragments.
+
+    Stable history messages and the tools array are serialized once and
+    reused across turns, so each request only encodes the messages that
+    changed since the previous turn plus a handful of scalar parameters.
+    """
+
+    def __init__(self, history: Any):
+        self.history = history
+        self._messages: list[dict[str, Any]] | None = None
+        self._tool_set: tuple[Any, ...] | None = None
+        self._tools: list[dict[str, Any]] = []
+        self._tools_json = b"[]"
+
+    def messages(self) -> list[dict[str, Any]]:
+        """Return the history formatted for the API."""
+        self._messages = self.history.format_for_api()
+        return self._messages
+
+    def tools(self, tools: list[Any]) -> list[dict[str, Any]]:
+        """Return tool definitions, rebuilt only when the tool set changes."""
+        tool_set = tuple(tools)
+        unchanged = self._tool_set is not None and (
+            len(tool_set) == len(self._tool_set)
+            and all(a is b for a, b in zip(tool_set, self._tool_set))
+        )
+        if not unchanged:
+            self._tools = [tool.to_dict() for tool in tool_set]
+            if self.history.enable_caching:
+                self._tools = self.history.cache_planner.tools(self._tools)
+            self._tools_json = dumps(self._tools)
+            self._tool_set = tool_set
+        return self._tools
+
+    def encode(self, params: dict[str, Any]) -> bytes:
+        """Serialize request params, splicing in cached fragments.
+
+        Values that are the exact objects returned by messages() and
+        tools() are replaced by their pre-serialized JSON; anything else
+        (e.g. overrides from message_params) is encoded normally.
+        """
+        parts = []
+        for key, value in params.items():
+            if key == "messages" and value is self._messages:
+                encoded = self.history.format_json()
+            elif key == "tools" and value is self._tools:
+                encoded = self._tools_json
+            else:
+                encoded = dumps(value)
+            parts.append(dumps(key) + b":" + encoded)
+        return b"{" + b",".join(parts) + b"}"
@@ -0,0 +1,227 @@
+"""Client-side rate limiting shared by every agent in a process."""
+
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+# Limits the API reports, as anthropic-ratelimit-{name}-{limit,remaining}
+_LIMITS = ("requests", "input-tokens", "output-tokens")
+
+
+@dataclass
+class _Bucket:
+    """Token bucket refilled continuously; unlimited until a limit is known."""
+
+    capacity: float | None = None
+    level: float = 0.0
+    rate: float = 0.0
+    updated: float = field(default_factory=time.monotonic)
+
+    def refill(self, now: float) -> None:
+        if self.capacity is not None:
+            elapsed = now - self.updated
+            self.level = min(self.capacity, self.level + elapsed * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount can be taken (after refill())."""
+        if self.capacity is None:
+            return 0.0
+        # A request larger than the bucket waits for a full one
+        shortfall = min(amount, self.capacity) - self.level
+        if shortfall <= 0:
+            return 0.0
+        return shortfall / self.rate if self.rate else float("inf")
+
+    def take(self, amount: float) -> None:
+        if self.capacity is not None:
+            self.level -= amount
+
+
+@dataclass
+class Reservation:
+    """Budget taken for one request, settled once its usage is known."""
+
+    model: str
+    input_tokens: int
+    output_tokens: int
+
+
+class _ModelLimits:
+    def __init__(self):
+        self.buckets = {name: _Bucket() for name in _LIMITS}
+        self.blocked_until = 0.0
+        self.failures = 0
+        # Running average of output tokens per request, for reservations
+        self.output_tokens = 0.0
+
+
+class RateLimiter:
+    """Paces Messages API requests per model within the account's limits.
+
+    Keeps a token bucket per model for requests, input tokens and output
+    tokens. Buckets start unlimited and take their size and level from
+    the anthropic-ratelimit-* headers of each response, refilling at the
+    per-minute limit in between, so agents sharing a limiter wait for
+    budget locally instead of collectively running into 429s. After a
+    429 or 529 every request for the model waits out retry-after or an
+    exponential backoff, each with its own jitter so waiters do not wake
+    up together.
+    """
+
+    def __init__(
+        self,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        max_retries: int = 6,
+        jitter: float = 0.5,
+        smoothing: float = 0.2,
+    ):
+        """Initialize a RateLimiter.
+
+        Args:
+            backoff_base: First backoff delay in seconds, doubled after
+                          each consecutive rate-limit response
+            backoff_max: Upper bound on backoff delays
+            max_retries: Rate-limit responses tolerated per request
+                         before the error is raised
+            jitter: Maximum random seconds added to every wait
+            smoothing: Weight of each request in the output estimate
+        """
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retries = max_retries
+        self.jitter = jitter
+        self.smoothing = smoothing
+        self._models: dict[str, _ModelLimits] = {}
+        self._lock = threading.Lock()
+
+    def _limits(self, model: str) -> _ModelLimits:
+        if model not in self._models:
+            self._models[model] = _ModelLimits()
+        return self._models[model]
+
+    async def acquire(
+        self, model: str, input_tokens: int, max_tokens: int
+    ) -> Reservation:
+        """Wait until a request fits the model's budget, then reserve it.
+
+        Args:
+            model: Model the request is for
+            input_tokens: Estimated uncached input tokens
+            max_tokens: The request's max_tokens; output is reserved at
+                        the running average, capped by this value
+
+        Returns:
+            A reservation to pass to settle() or release()
+        """
+        while True:
+            with self._lock:
+                limits = self._limits(model)
+                output_tokens = round(
+                    min(max_tokens, limits.output_tokens or max_tokens)
+                )
+                amounts = {
+                    "requests": 1,
+                    "input-tokens": input_tokens,
+                    "output-tokens": output_tokens,
+                }
+                now = time.monotonic()
+                wait = limits.blocked_until - now
+                for name, bucket in limits.buckets.items():
+                    bucket.refill(now)
+                    wait = max(wait, bucket.wait_time(amounts[name]))
+                if wait <= 0:
+                    for name, bucket in limits.buckets.items():
+                        bucket.take(amounts[name])
+                    return Reservation(model, input_tokens, output_tokens)
+            await asyncio.sleep(wait + random.uniform(0, self.jitter))
+
+    def settle(self, reservation: Reservation, usage: Any) -> None:
+        """Correct a reservation with the usage the API reported."""
+        output_tokens = usage.output_tokens
+        input_tokens = usage.input_tokens + (
+            getattr(usage, "cache_creation_input_tokens", 0) or 0
+        )
+        with self._lock:
+            limits = self._limits(reservation.model)
+            limits.failures = 0
+            buckets = limits.buckets
+            buckets["input-tokens"].take(
+                input_tokens - reservation.input_tokens
+            )
+            buckets["output-tokens"].take(
+                output_tokens - reservation.output_tokens
+            )
+            if limits.output_tokens:
+                limits.output_tokens += self.smoothing * (
+                    output_tokens - limits.output_tokens
+                )
+            else:
+                limits.output_tokens = float(output_tokens)
+
+    def release(self, reservation: Reservation) -> None:
+        """Return the budget of a request that was not processed."""
+        with self._lock:
+            buckets = self._limits(reservation.model).buckets
+            buckets["requests"].take(-1)
+            buckets["input-tokens"].take(-reservation.input_tokens)
+            buckets["output-tokens"].take(-reservation.output_tokens)
+
+    def update(self, model: str, headers: Any) -> None:
+        """Adopt the limits and remaining budget reported by the API."""
+        with self._lock:
+            limits = self._limits(model)
+            now = time.monotonic()
+            for name, bucket in limits.buckets.items():
+                prefix = f"anthropic-ratelimit-{name}"
+                try:
+                    limit = float(headers[f"{prefix}-limit"])
+                    remaining = float(headers[f"{prefix}-remaining"])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                # Limits are per minute and replenish continuously
+                bucket.capacity = limit
+                bucket.rate = limit / 60
+                bucket.level = remaining
+                bucket.updated = now
+
+    def backoff(self, model: str, headers: Any = None) -> float:
+        """Block the model after a rate-limit response.
+
+        Honors retry-after when present, otherwise backs off
+        exponentially with jitter.
+
+        Returns:
+            Seconds the model is blocked for
+        """
+        headers = headers or {}
+        retry_after = None
+        try:
+            retry_after = float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            pass
+        with self._lock:
+            limits = self._limits(model)
+            limits.failures += 1
+            if retry_after is None:
+                ceiling = min(
+                    self.backoff_max,
+                    self.backoff_base * 2 ** (limits.failures - 1),
+                )
+                delay = random.uniform(ceiling / 2, ceiling)
+            else:
+                delay = retry_after
+            limits.blocked_until = max(
+                limits.blocked_until, time.monotonic() + delay
+            )
+        # A 429 also reports the budget that ran out
+        self.update(model, headers)
+        return delay
+
+
+# Shared by every agent and batch runner that is not given its own limiter
+default_rate_limiter = RateLimiter()
@@ -0,0 +1,116 @@
+"""Memoized results for idempotent tool calls."""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+
+@dataclass(slots=True)
+class _Entry:
+    tool_name: str
+    version: Any
+    result: str | list[Any]
+    stored_at: float
+
+
+class ToolResultCache:
+    """LRU cache of tool results, keyed by tool name and canonical input.
+
+    Only tools that opt in (cacheable=True) are cached. An entry is
+    served while the tool's cache_version() for the call is unchanged,
+    e.g. while a file keeps its mtime and size, and until it is older
+    than the TTL. Returning the stored string also keeps repeated tool
+    results byte-identical, which keeps prompt-cache prefixes stable.
+    A cache can be shared by several agents, across runs.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float | None = 300.0):
+        """Initialize a ToolResultCache.
+
+        Args:
+            max_entries: Maximum number of results to keep
+            ttl: Seconds a result stays valid (None keeps results until
+                 evicted or invalidated)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(
+        self, tool: Any, tool_input: dict[str, Any], version: Any = None
+    ) -> str | list[Any] | None:
+        """Cached result of a call, or None on a miss.
+
+        Args:
+            tool: The tool being called
+            tool_input: The call's input
+            version: The tool's current cache_version() for the call
+        """
+        key = tool.cache_key(**tool_input)
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._fresh(entry, version):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.result
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        tool: Any,
+        tool_input: dict[str, Any],
+        result: str | list[Any],
+        version: Any = None,
+    ) -> None:
+        """Store the result of a call.
+
+        Args:
+            tool: The tool that was called
+            tool_input: The call's input
+            result: The tool's result, a string or content blocks
+            version: The cache_version() passed to get() before the call
+                     ran, so a change made while it ran leaves the entry
+                     stale
+        """
+        key = tool.cache_key(**tool_input)
+        if key is None:
+            return
+        entry = _Entry(tool.name, version, result, time.monotonic())
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(
+        self, tool: Any = None, tool_input: dict[str, Any] | None = None
+    ) -> None:
+        """Drop one call's result, every result of a tool, or everything."""
+        with self._lock:
+            if tool is None:
+                self._entries.clear()
+            elif tool_input is not None:
+                self._entries.pop(tool.cache_key(**tool_input), None)
+            else:
+                for key, entry in list(self._entries.items()):
+                    if entry.tool_name == tool.name:
+                        del self._entries[key]
+
+    def _fresh(self, entry: _Entry, version: Any) -> bool:
+        if entry.version != version:
+            return False
+        return (
+            self.ttl is None or time.monotonic() - entry.stored_at < self.ttl
+        )
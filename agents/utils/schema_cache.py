@@ -0,0 +1,124 @@
+"""On-disk cache of MCP tool schemas for fast agent startup."""
+
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from mcp.types import Tool as MCPToolDefinition
+
+
+def _default_directory() -> Path:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "agents" / "mcp_tools"
+
+
+def server_fingerprint(config: dict[str, Any]) -> str:
+    """Hash identifying a server and the version of its code.
+
+    Covers the connection settings plus the size and mtime of every local
+    file named by the command or its arguments, or holding an in-process
+    server's module, so editing a server script invalidates its entry.
+    Servers fetched at launch (e.g. via npx) can pin a "version" key in
+    their config.
+    """
+    identity: dict[str, Any] = {
+        key: config.get(key)
+        for key in (
+            "type", "command", "args", "env", "url", "server", "version"
+        )
+    }
+    paths = [config.get("command"), *(config.get("args") or [])]
+    server = config.get("server")
+    if isinstance(server, str):
+        # An in-process server's code lives in its module
+        try:
+            spec = importlib.util.find_spec(server.partition(":")[0])
+        except (ImportError, ValueError):
+            spec = None
+        if spec is not None:
+            paths.append(spec.origin)
+    files = []
+    for item in paths:
+        if not isinstance(item, str):
+            continue
+        path = shutil.which(item) or item
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            files.append(
+                [os.path.abspath(path), stat.st_mtime_ns, stat.st_size]
+            )
+    identity["files"] = files
+    encoded = json.dumps(identity, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ToolSchemaCache:
+    """Tool catalogues of MCP servers, persisted across processes.
+
+    Lets an agent build its tool list without starting its MCP servers;
+    a server is then only spawned when one of its tools is called.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path | None = None,
+        max_age: float | None = 24 * 60 * 60,
+    ):
+        """Initialize a ToolSchemaCache.
+
+        Args:
+            directory: Where to store catalogues. Defaults to
+                       $XDG_CACHE_HOME/agents/mcp_tools.
+            max_age: Seconds after which a catalogue is refreshed from the
+                     server (None keeps catalogues until invalidated)
+        """
+        self.directory = (
+            Path(directory) if directory else _default_directory()
+        )
+        self.max_age = max_age
+
+    def _path(self, config: dict[str, Any]) -> Path:
+        return self.directory / f"{server_fingerprint(config)}.json"
+
+    def load(self, config: dict[str, Any]) -> list[MCPToolDefinition] | None:
+        """Cached tool definitions for a server, or None on a miss."""
+        path = self._path(config)
+        try:
+            if self.max_age is not None:
+                if time.time() - path.stat().st_mtime > self.max_age:
+                    return None
+            entries = json.loads(path.read_text(encoding="utf-8"))
+            return [MCPToolDefinition.model_validate(e) for e in entries]
+        except (OSError, ValueError):
+            return None
+
+    def store(
+        self, config: dict[str, Any], tool_definitions: list[Any]
+    ) -> None:
+        """Persist the tool definitions listed by a server."""
+        entries = [
+            {
+                "name": tool.name,
+                "description": tool.description,
+                "inputSchema": tool.inputSchema,
+            }
+            for tool in tool_definitions
+        ]
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self._path(config))
+        except OSError as e:
+            print(f"Error caching tools for MCP server {config}: {e}")
+
+    def invalidate(self, config: dict[str, Any]) -> None:
+        """Forget the cached catalogue of a server."""
+        self._path(config).unlink(missing_ok=True)
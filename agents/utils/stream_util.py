@@ -0,0 +1,69 @@
+"""Streaming helpers for the Messages API."""
+
+import asyncio
+import threading
+from collections.abc import AsyncIterator, Callable
+from typing import Any
+
+_STREAM_END = object()
+
+
+async def stream_events(
+    client: Any,
+    is_async: bool,
+    on_response: Callable[[Any], None] | None = None,
+    **kwargs: Any,
+) -> AsyncIterator[Any]:
+    """Yield client.messages.stream() events without blocking the loop.
+
+    Async clients are iterated directly. Sync clients are consumed in a
+    worker thread that hands each event back to the event loop as soon as
+    it arrives, so callers can react to individual content blocks.
+    on_response, if given, is called with the HTTP response once the
+    stream opens (from the worker thread for sync clients). If the caller
+    stops iterating early, the stream is closed rather than read to its
+    end.
+    """
+    if is_async:
+        async with client.messages.stream(**kwargs) as stream:
+            if on_response is not None:
+                on_response(stream.response)
+            async for event in stream:
+                yield event
+        return
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue[Any] = asyncio.Queue()
+    stop = threading.Event()
+    opened: list[Any] = []
+
+    def pump() -> None:
+        try:
+            with client.messages.stream(**kwargs) as stream:
+                opened.append(stream)
+                if stop.is_set():
+                    return
+                if on_response is not None:
+                    on_response(stream.response)
+                for event in stream:
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, event)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, _STREAM_END)
+
+    worker = asyncio.ensure_future(asyncio.to_thread(pump))
+    try:
+        while (event := await queue.get()) is not _STREAM_END:
+            if isinstance(event, Exception):
+                raise event
+            yield event
+    finally:
+        if not worker.done():
+            # The caller stopped early; don't read the rest of the stream
+            stop.set()
+            for stream in opened:
+                stream.close()
+        await worker
@@ -0,0 +1,118 @@
+"""Token estimation for sizing prompts without an API round trip."""
+
+import hashlib
+import inspect
+import threading
+from collections import OrderedDict
+from typing import Any
+
+
+class TokenEstimator:
+    """Estimates token counts locally from text length.
+
+    Each model starts from a default characters-per-token ratio that is
+    calibrated from the usage the API reports, so estimates track the
+    real tokenizer as an agent runs. Lengths are measured in characters
+    on both sides. Exact system prompt counts (see APITokenCounter) are
+    kept in an LRU cache keyed by model and prompt hash, shared by every
+    history that uses this estimator. Estimated ones are not cached as
+    counts, so they always use the latest calibration.
+    """
+
+    def __init__(
+        self,
+        chars_per_token: float = 4.0,
+        cache_size: int = 1024,
+        smoothing: float = 0.2,
+    ):
+        """Initialize a TokenEstimator.
+
+        Args:
+            chars_per_token: Starting ratio before any usage is observed
+            cache_size: Maximum number of system prompt counts to keep
+            smoothing: Weight of each new observation in the running ratio
+        """
+        self.default_chars_per_token = chars_per_token
+        self.cache_size = cache_size
+        self.smoothing = smoothing
+        self._ratios: dict[str, float] = {}
+        # None marks a prompt with no exact count, estimated when read
+        self._cache: OrderedDict[tuple[str, str], int | None] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def chars_per_token(self, model: str) -> float:
+        """Current calibrated ratio for a model."""
+        return self._ratios.get(model, self.default_chars_per_token)
+
+    def estimate(self, model: str, text: str) -> int:
+        """Estimate the number of tokens in a piece of text."""
+        if not text:
+            return 0
+        return max(1, round(len(text) / self.chars_per_token(model)))
+
+    def observe(self, model: str, chars: int, tokens: int) -> None:
+        """Calibrate the ratio from a measured (characters, tokens) pair."""
+        if chars <= 0 or tokens <= 0:
+            return
+        # Clamp so a single odd measurement cannot skew later estimates
+        sample = min(max(chars / tokens, 1.0), 10.0)
+        with self._lock:
+            current = self.chars_per_token(model)
+            self._ratios[model] = current + self.smoothing * (sample - current)
+
+    def count_system(self, model: str, system: str) -> int:
+        """Token count of a system prompt, cached by model and prompt hash."""
+        key = (model, hashlib.sha256(system.encode()).hexdigest())
+        with self._lock:
+            cached = key in self._cache
+            if cached:
+                self._cache.move_to_end(key)
+                tokens = self._cache[key]
+
+        if not cached:
+            tokens = self._count(model, system)
+            with self._lock:
+                self._cache[key] = tokens
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        if tokens is None:
+            return self.estimate(model, system)
+        return tokens
+
+    def _count(self, model: str, system: str) -> int | None:
+        """Exact token count of a system prompt, or None to estimate it."""
+        return None
+
+
+class APITokenCounter(TokenEstimator):
+    """Counts system prompts with the count_tokens endpoint.
+
+    Exact counts are cached like local estimates, so each distinct system
+    prompt costs one round trip per process. Falls back to local
+    estimation when the call fails or the client is async.
+    """
+
+    def __init__(self, client: Any, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.client = client
+
+    def _count(self, model: str, system: str) -> int | None:
+        if inspect.iscoroutinefunction(self.client.messages.count_tokens):
+            return super()._count(model, system)
+        try:
+            return (
+                self.client.messages.count_tokens(
+                    model=model,
+                    system=system,
+                    messages=[{"role": "user", "content": "test"}],
+                ).input_tokens
+                - 1
+            )
+        except Exception:
+            return super()._count(model, system)
+
+
+# Shared by every MessageHistory that is not given its own estimator
+default_token_estimator = TokenEstimator()
@@ -1,39 +1,199 @@
 """Tool execution utility with parallel execution support."""
 
 import asyncio
+import time
+import weakref
 from typing import Any
 
+from .tracing import span
+
+# Concurrency limits are asyncio primitives, which belong to one event
+# loop, so they are kept per loop: {loop: {id(owner): (ref, limit, sem)}}.
+# Tools are dataclasses and so unhashable, hence the ids; owners are only
+# weakly referenced and their entries dropped when they are collected
+_limits: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def _semaphore(owner: Any, limit: int) -> asyncio.Semaphore:
+    """Shared semaphore limiting concurrent use of a tool or connection."""
+    loop_limits = _limits.setdefault(asyncio.get_running_loop(), {})
+    key = id(owner)
+    cached = loop_limits.get(key)
+    if cached is None or cached[0]() is not owner or cached[1] != limit:
+        # A changed limit applies to the calls made from now on
+        ref = weakref.ref(owner, lambda _: loop_limits.pop(key, None))
+        cached = loop_limits[key] = (ref, limit, asyncio.Semaphore(limit))
+    return cached[2]
+
 
 async def _execute_single_tool(
-    call: Any, tool_dict: dict[str, Any]
+    call: Any,
+    tool_dict: dict[str, Any],
+    timeout: float | None = None,
+    cache: Any = None,
+) -> dict[str, Any]:
+    """Execute a single tool and handle errors.
+
+    Results of cacheable tools are served from and stored in cache, a
+    ToolResultCache, when one is given.
+    """
+    with span("tool.execute", tool=call.name) as tool_span:
+        response = await _run_tool(call, tool_dict, timeout, cache, tool_span)
+        tool_span.set(is_error=response.get("is_error", False))
+    return response
+
+
+async def _run_tool(
+    call: Any,
+    tool_dict: dict[str, Any],
+    timeout: float | None,
+    cache: Any,
+    tool_span: Any,
 ) -> dict[str, Any]:
-    """Execute a single tool and handle errors."""
     response = {"type": "tool_result", "tool_use_id": call.id}
 
     try:
-        # Execute the tool directly
-        result = await tool_dict[call.name].execute(**call.input)
-        response["content"] = str(result)
+        tool = tool_dict[call.name]
     except KeyError:
         response["content"] = f"Tool '{call.name}' not found"
         response["is_error"] = True
+        return response
+
+    version = None
+    if cache is not None and tool.cacheable:
+        version = tool.cache_version(**call.input)
+        cached = cache.get(tool, call.input, version)
+        if cached is not None:
+            tool_span.set(cached=True)
+            response["content"] = cached
+            return response
+
+    # Tools sharing a resource (e.g. one MCP session) queue for it in
+    # FIFO order, then for the tool's own limit
+    semaphores = []
+    owner, limit = tool.shared_resource()
+    if owner is not None and limit:
+        semaphores.append(_semaphore(owner, limit))
+    if tool.max_concurrency:
+        semaphores.append(_semaphore(tool, tool.max_concurrency))
+    timeout = tool.timeout or timeout
+
+    acquired = []
+    try:
+        queued = time.perf_counter()
+        for semaphore in semaphores:
+            await semaphore.acquire()
+            acquired.append(semaphore)
+        if semaphores:
+            tool_span.set(
+                queue_ms=round((time.perf_counter() - queued) * 1000, 3)
+            )
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout else None
+        result = await asyncio.wait_for(tool.execute(**call.input), timeout)
+        # Content blocks (e.g. images) are passed through as they are
+        response["content"] = (
+            result if isinstance(result, list) else str(result)
+        )
+        if cache is not None and not response.get("is_error"):
+            cache.put(tool, call.input, response["content"], version)
+    except asyncio.TimeoutError as e:
+        if deadline is not None and loop.time() >= deadline:
+            # wait_for() has cancelled the stuck call
+            response["content"] = (
+                f"Tool '{call.name}' timed out after {timeout}s"
+            )
+            tool_span.add_event("timeout", timeout=timeout)
+        else:
+            # Raised by the tool itself, e.g. a network timeout
+            response["content"] = f"Error executing tool: {str(e)}"
+        response["is_error"] = True
     except Exception as e:
         response["content"] = f"Error executing tool: {str(e)}"
         response["is_error"] = True
+    finally:
+        for semaphore in acquired:
+            semaphore.release()
 
     return response
 
 
+class ToolScheduler:
+    """Runs the tool calls of one turn in order-preserving batches.
+
+    Calls to parallel-safe tools run concurrently. A call to a tool that
+    is not parallel-safe waits for every earlier call and blocks later
+    ones, so it never overlaps another call from the same turn. Calls
+    can be submitted one at a time as they arrive (e.g. while streaming).
+    """
+
+    def __init__(
+        self,
+        tool_dict: dict[str, Any],
+        timeout: float | None = None,
+        cache: Any = None,
+    ):
+        self.tool_dict = tool_dict
+        self.timeout = timeout
+        self.cache = cache
+        self._barrier: asyncio.Task | None = None
+        self._running: list[asyncio.Task] = []
+
+    def submit(self, call: Any) -> asyncio.Task:
+        """Schedule a tool call, returning a task for its tool_result."""
+        tool = self.tool_dict.get(call.name)
+        parallel_safe = getattr(tool, "parallel_safe", True)
+
+        waits_for = [self._barrier] if self._barrier else []
+        if not parallel_safe:
+            waits_for += self._running
+        task = asyncio.create_task(self._run_after(waits_for, call))
+
+        if parallel_safe:
+            self._running.append(task)
+        else:
+            self._barrier = task
+            self._running = []
+        return task
+
+    async def _run_after(
+        self, waits_for: list[asyncio.Task], call: Any
+    ) -> dict[str, Any]:
+        if waits_for:
+            await asyncio.wait(waits_for)
+        return await _execute_single_tool(
+            call, self.tool_dict, self.timeout, self.cache
+        )
+
+    async def run(self, tool_calls: list[Any]) -> list[dict[str, Any]]:
+        """Schedule tool calls and return their results in call order."""
+        tasks = [self.submit(call) for call in tool_calls]
+        try:
+            return list(await asyncio.gather(*tasks))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+
 async def execute_tools(
-    tool_calls: list[Any], tool_dict: dict[str, Any], parallel: bool = True
+    tool_calls: list[Any],
+    tool_dict: dict[str, Any],
+    parallel: bool = True,
+    timeout: float | None = None,
+    cache: Any = None,
 ) -> list[dict[str, Any]]:
-    """Execute multiple tools sequentially or in parallel."""
+    """Execute multiple tools sequentially or in parallel.
+
+    Parallel execution honours each tool's max_concurrency, timeout and
+    parallel_safe settings; timeout applies to tools that set none.
+    Results of cacheable tools are memoized in cache, if given.
+    """
 
     if parallel:
-        return await asyncio.gather(
-            *[_execute_single_tool(call, tool_dict) for call in tool_calls]
-        )
+        return await ToolScheduler(tool_dict, timeout, cache).run(tool_calls)
     else:
         return [
-            await _execute_single_tool(call, tool_dict) for call in tool_calls
+            await _execute_single_tool(call, tool_dict, timeout, cache)
+            for call in tool_calls
         ]
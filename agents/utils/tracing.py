@@ -0,0 +1,316 @@
+"""Tracing spans for agent turns, model requests and tool calls."""
+
+import contextvars
+import json
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+
+@dataclass
+class Span:
+    """A timed operation with attributes and point-in-time events."""
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: str | None = None
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: int = 0
+    attributes: dict[str, Any] = field(default_factory=dict)
+    events: list[dict[str, Any]] = field(default_factory=list)
+    error: str | None = None
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def add_event(self, name: str, **attributes: Any) -> None:
+        self.events.append(
+            {"name": name, "time_ns": time.time_ns(), "attributes": attributes}
+        )
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "events": self.events,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """Stands in for a span when no tracer is active."""
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def add_event(self, name: str, **attributes: Any) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+# The active (tracer, span), inherited by tasks and worker threads
+_current: contextvars.ContextVar[tuple["Tracer", Span] | None] = (
+    contextvars.ContextVar("current_span", default=None)
+)
+
+
+class Tracer:
+    """Records nested spans and hands each finished span to an exporter.
+
+    The active span is tracked in a context variable, so spans opened
+    in tasks and threads started inside a span become its children.
+    """
+
+    def __init__(self, exporter: Any):
+        """Initialize a Tracer.
+
+        Args:
+            exporter: Object with export(span) and optionally flush(),
+                      e.g. InMemoryExporter, JSONLExporter or OTLPExporter
+        """
+        self.exporter = exporter
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any):
+        """Open a span, as a child of the active span if there is one."""
+        active = _current.get()
+        parent = active[1] if active else None
+        span = Span(
+            name=name,
+            trace_id=parent.trace_id if parent else secrets.token_hex(16),
+            span_id=secrets.token_hex(8),
+            parent_id=parent.span_id if parent else None,
+            attributes=attributes,
+        )
+        token = _current.set((self, span))
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _current.reset(token)
+            self.exporter.export(span)
+
+    def flush(self) -> None:
+        """Send any spans the exporter has buffered."""
+        flush = getattr(self.exporter, "flush", None)
+        if flush is not None:
+            flush()
+
+
+@contextmanager
+def span(name: str, **attributes: Any):
+    """Open a span with the active tracer, or do nothing without one."""
+    active = _current.get()
+    if active is None:
+        yield _NOOP_SPAN
+        return
+    with active[0].span(name, **attributes) as child:
+        yield child
+
+
+def current_span() -> Span | _NoopSpan:
+    """The active span, for adding attributes or events to it."""
+    active = _current.get()
+    return active[1] if active else _NOOP_SPAN
+
+
+class InMemoryExporter:
+    """Keeps finished spans in a list, e.g. for tests."""
+
+    def __init__(self):
+        self.spans: list[Span] = []
+
+    def export(self, span: Span) -> None:
+        self.spans.append(span)
+
+    def clear(self) -> None:
+        self.spans.clear()
+
+
+class _BatchingExporter:
+    """Buffers finished spans and sends them in batches off the caller.
+
+    A full batch is handed to a single background thread, so exports
+    made on the event loop never wait for file or network I/O, and
+    batches are sent in the order they filled. flush() sends the rest
+    and waits until every batch has been sent.
+    """
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self._buffer: list[Span] = []
+        self._lock = threading.Lock()
+        self._sender = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="span-exporter"
+        )
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self._buffer.append(span)
+            if len(self._buffer) < self.batch_size:
+                return
+            spans, self._buffer = self._buffer, []
+        self._sender.submit(self._send, spans)
+
+    def flush(self) -> None:
+        with self._lock:
+            spans, self._buffer = self._buffer, []
+        # The sender runs one batch at a time, so this one goes last
+        self._sender.submit(self._send, spans).result()
+
+    def _send(self, spans: list[Span]) -> None:
+        raise NotImplementedError
+
+
+class JSONLExporter(_BatchingExporter):
+    """Appends finished spans to a JSONL file.
+
+    Spans are written in batches of batch_size, and when the tracer is
+    flushed at the end of a run.
+    """
+
+    def __init__(self, path: str | Path, batch_size: int = 64):
+        """Initialize a JSONLExporter.
+
+        Args:
+            path: File the spans are appended to
+            batch_size: Number of spans buffered before a write
+        """
+        super().__init__(batch_size)
+        self.path = Path(path)
+
+    def _send(self, spans: list[Span]) -> None:
+        if not spans:
+            return
+        lines = "".join(
+            json.dumps(span.to_dict(), default=str) + "\n" for span in spans
+        )
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+        except OSError as e:
+            print(f"Error writing {len(spans)} spans to {self.path}: {e}")
+
+
+def _otlp_value(value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # OTLP/JSON encodes 64-bit integers as strings
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: dict[str, Any]) -> list[dict[str, Any]]:
+    return [
+        {"key": key, "value": _otlp_value(value)}
+        for key, value in attributes.items()
+        if value is not None
+    ]
+
+
+class OTLPExporter(_BatchingExporter):
+    """Sends spans to an OpenTelemetry collector over OTLP/HTTP JSON.
+
+    Spans are buffered and posted in batches of batch_size, and when the
+    tracer is flushed at the end of a run.
+    """
+
+    def __init__(
+        self,
+        endpoint: str = "http://localhost:4318/v1/traces",
+        service_name: str = "agents",
+        batch_size: int = 64,
+        client: httpx.Client | None = None,
+    ):
+        """Initialize an OTLPExporter.
+
+        Args:
+            endpoint: The collector's OTLP/HTTP traces endpoint
+            service_name: service.name resource attribute of the spans
+            batch_size: Number of spans buffered before a post
+            client: HTTP client to post with
+        """
+        super().__init__(batch_size)
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.client = client or httpx.Client(timeout=10)
+
+    def _send(self, spans: list[Span]) -> None:
+        if not spans:
+            return
+        try:
+            response = self.client.post(self.endpoint, json=self.encode(spans))
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            print(f"Error exporting {len(spans)} spans: {e}")
+
+    def encode(self, spans: list[Span]) -> dict[str, Any]:
+        """OTLP ExportTraceServiceRequest for a list of spans."""
+        resource = {"service.name": self.service_name}
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": _otlp_attributes(resource)},
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "agents"},
+                            "spans": [self._encode_span(s) for s in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    @staticmethod
+    def _encode_span(span: Span) -> dict[str, Any]:
+        encoded = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": _otlp_attributes(span.attributes),
+            "events": [
+                {
+                    "timeUnixNano": str(event["time_ns"]),
+                    "name": event["name"],
+                    "attributes": _otlp_attributes(event["attributes"]),
+                }
+                for event in span.events
+            ],
+            # STATUS_CODE_OK or STATUS_CODE_ERROR
+            "status": (
+                {"code": 2, "message": span.error}
+                if span.error
+                else {"code": 1}
+            ),
+        }
+        if span.parent_id:
+            encoded["parentSpanId"] = span.parent_id
+        return encoded